@@ -0,0 +1,72 @@
+"""Parsing speed of the crawlers on recorded pages. Besides the pages bundled
+   with the repository, any pages saved as benchmarks/pages/<Crawler>/<name>.html
+   (or .json, for crawlers that read JSON) are benchmarked. Pages whose name
+   starts with 'detail' are detail pages of a single expose, which are only
+   parsed, not passed to extract_data"""
+import glob
+import json
+import os
+
+import pytest
+from bs4 import BeautifulSoup
+
+from data import repo_path
+
+BUNDLED_PAGES = [
+    ('WgGesucht', repo_path('test', 'crawler', 'fixtures', 'wg-gesucht-spotahome.html')),
+    ('Storia', repo_path('storia_sample.html')),
+    ('Storia', repo_path('flathunter', 'samples', 'storia.html')),
+    ('ImobiliareRo', repo_path('imobiliare_sample.html')),
+]
+
+
+def recorded_pages():
+    """The (crawler name, path) of every page to benchmark"""
+    pages = list(BUNDLED_PAGES)
+    for path in sorted(glob.glob(repo_path('benchmarks', 'pages', '*', '*'))):
+        if path.endswith('.html') or path.endswith('.json'):
+            pages.append((os.path.basename(os.path.dirname(path)), path))
+    return pages
+
+
+def page_id(page):
+    crawler, path = page
+    return f"{crawler}-{os.path.basename(path)}"
+
+
+def is_detail_page(path):
+    return os.path.basename(path).startswith('detail')
+
+
+def load_page(path):
+    """The page as passed to extract_data: parsed HTML or JSON"""
+    with open(path, encoding='utf-8') as page:
+        if path.endswith('.json'):
+            return json.load(page)
+        return BeautifulSoup(page, 'lxml')
+
+
+def crawler_named(config, name):
+    for searcher in config.searchers():
+        if searcher.get_name() == name:
+            return searcher
+    pytest.skip(f"No crawler named {name}")
+
+
+@pytest.mark.parametrize('page', [page for page in recorded_pages() if page[1].endswith('.html')],
+                         ids=page_id)
+def bench_parse_page(benchmark, page):
+    _, path = page
+    with open(path, encoding='utf-8') as html:
+        content = html.read()
+    benchmark(BeautifulSoup, content, 'lxml')
+
+
+@pytest.mark.parametrize('page', [page for page in recorded_pages()
+                                  if not is_detail_page(page[1])], ids=page_id)
+def bench_extract_data(benchmark, config, page):
+    crawler_name, path = page
+    crawler = crawler_named(config, crawler_name)
+    raw_data = load_page(path)
+    benchmark(crawler.extract_data, raw_data)
+
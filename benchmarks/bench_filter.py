@@ -0,0 +1,44 @@
+"""Filter throughput over a large number of exposes"""
+import pytest
+
+from flathunter.config import YamlConfig
+from flathunter.filter import Filter
+
+from data import synthetic_exposes
+
+EXPOSE_COUNT = 100_000
+
+
+@pytest.fixture(scope='module')
+def exposes():
+    return synthetic_exposes(EXPOSE_COUNT)
+
+
+@pytest.fixture(scope='module')
+def filter_set():
+    config = YamlConfig({'filters': {
+        'excluded_titles': ['wg', 'tausch', 'befristet', 'souterrain'],
+        'min_price': 500,
+        'max_price': 2500,
+        'min_size': 40,
+        'max_size': 150,
+        'min_rooms': 2,
+        'max_rooms': 5,
+        'max_price_per_square': 25,
+    }})
+    return Filter.builder().read_config(config).build()
+
+
+def bench_is_interesting_expose(benchmark, exposes, filter_set):
+    result = benchmark.pedantic(
+        lambda: [expose for expose in exposes if filter_set.is_interesting_expose(expose)],
+        rounds=5, warmup_rounds=1)
+    assert 0 < len(result) < len(exposes)
+
+
+def bench_title_filter(benchmark, exposes):
+    config = YamlConfig({'filters': {'excluded_titles': ['wg', 'tausch', 'befristet']}})
+    filter_set = Filter.builder().read_config(config).build()
+    benchmark.pedantic(
+        lambda: [expose for expose in exposes if filter_set.is_interesting_expose(expose)],
+        rounds=5, warmup_rounds=1)
@@ -0,0 +1,75 @@
+"""Latency of the SQLite database with a large history. The database is filled
+   with FLATHUNTER_BENCHMARK_ROWS processed ids and exposes (default 1M)"""
+import datetime
+import itertools
+import json
+import os
+import random
+
+import pytest
+
+from flathunter.idmaintainer import IdMaintainer
+
+from data import synthetic_expose
+
+ROWS = int(os.environ.get('FLATHUNTER_BENCHMARK_ROWS', 1_000_000))
+CRAWLERS = ["Immowelt", "WgGesucht", "Kleinanzeigen", "Immobilienscout"]
+
+
+@pytest.fixture(scope='module')
+def id_watch(tmp_path_factory):
+    """A database with ROWS processed ids (the even numbers) and ROWS exposes,
+       created over the last 90 days"""
+    id_watch = IdMaintainer(str(tmp_path_factory.mktemp('db') / 'processed_ids.db'))
+    connection = id_watch.get_connection()
+    rand = random.Random(42)
+    now = datetime.datetime.now()
+    connection.executemany('INSERT INTO processed VALUES (?)',
+                           ((expose_id,) for expose_id in range(0, 2 * ROWS, 2)))
+    def exposes():
+        for expose_id in range(ROWS):
+            expose = synthetic_expose(rand, expose_id)
+            created = now - datetime.timedelta(seconds=rand.randint(0, 90 * 24 * 3600))
+            yield (expose_id, created, expose['crawler'], json.dumps(expose))
+    connection.executemany('INSERT INTO exposes VALUES (?, ?, ?, ?)', exposes())
+    connection.commit()
+    return id_watch
+
+
+@pytest.fixture
+def new_ids():
+    """Ids that are not in the database yet"""
+    return itertools.count(2 * ROWS + random.randint(0, ROWS))
+
+
+def bench_is_processed_hit(benchmark, id_watch):
+    assert benchmark(id_watch.is_processed, ROWS)
+
+
+def bench_is_processed_miss(benchmark, id_watch):
+    assert not benchmark(id_watch.is_processed, ROWS + 1)
+
+
+def bench_mark_processed(benchmark, id_watch, new_ids):
+    benchmark(lambda: id_watch.mark_processed(next(new_ids)))
+
+
+def bench_save_exposes(benchmark, id_watch, new_ids):
+    rand = random.Random(7)
+    def save_batch():
+        id_watch.save_exposes([synthetic_expose(rand, next(new_ids)) for _ in range(20)])
+    benchmark(save_batch)
+
+
+def bench_get_exposes_since(benchmark, id_watch):
+    since = datetime.datetime.now() - datetime.timedelta(hours=6)
+    assert len(benchmark(id_watch.get_exposes_since, since)) > 0
+
+
+def bench_get_exposes_since_by_crawler(benchmark, id_watch):
+    since = datetime.datetime.now() - datetime.timedelta(days=1)
+    assert len(benchmark(id_watch.get_exposes_since, since, CRAWLERS[:1])) > 0
+
+
+def bench_get_recent_exposes(benchmark, id_watch):
+    assert len(benchmark(id_watch.get_recent_exposes, 10)) == 10
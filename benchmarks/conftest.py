@@ -0,0 +1,13 @@
+"""Shared setup of the benchmarks. The benchmarks need pytest-benchmark, and
+   run offline: pages are read from the repository and from benchmarks/pages"""
+import pytest
+
+from flathunter.config import YamlConfig
+
+
+@pytest.fixture(scope='session')
+def config():
+    """Configuration with all crawlers"""
+    config = YamlConfig({})
+    config.init_searchers()
+    return config
@@ -0,0 +1,35 @@
+"""Inputs of the benchmarks: synthetic exposes, and the paths of recorded pages"""
+import os
+import random
+import string
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def repo_path(*parts):
+    """Path of a file in the repository"""
+    return os.path.join(ROOT, *parts)
+
+
+def synthetic_expose(rand: random.Random, expose_id: int):
+    """An expose with the fields and the formats that the crawlers produce"""
+    words = ["Altbau", "Balkon", "WG", "Tausch", "ruhig", "hell", "saniert", "Neubau",
+             "Dachgeschoss", "zentral", "Garten", "befristet", "Souterrain", "modern"]
+    title = ' '.join(rand.choice(words) for _ in range(rand.randint(3, 8)))
+    price = rand.randint(250, 4000)
+    return {
+        'id': expose_id,
+        'url': f"https://www.example.com/expose/{expose_id}",
+        'title': title,
+        'price': f"{price:,} €".replace(',', '.') if rand.random() < 0.5 else f"{price},00 EUR",
+        'size': f"{rand.randint(12, 200)},{rand.randint(0, 99)} m²",
+        'rooms': str(rand.choice([1, 1.5, 2, 2.5, 3, 4, 5, 6])),
+        'address': ''.join(rand.choice(string.ascii_letters) for _ in range(20)),
+        'crawler': rand.choice(["Immowelt", "WgGesucht", "Kleinanzeigen", "Immobilienscout"]),
+    }
+
+
+def synthetic_exposes(count: int, seed: int = 42):
+    """A reproducible list of exposes"""
+    rand = random.Random(seed)
+    return [synthetic_expose(rand, expose_id) for expose_id in range(count)]
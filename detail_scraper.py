@@ -17,8 +17,11 @@ It enriches listings with:
 
 import time
 import datetime
+import hashlib
+import heapq
+import json
 from datetime import time as dtime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from flathunter.argument_parser import parse
 from flathunter.logging import logger, configure_logging
@@ -33,13 +36,35 @@ __version__ = "1.0"
 __status__ = "Production"
 
 
+DETAIL_FIELDS = ['description', 'images', 'construction_year', 'floor',
+                 'building_type', 'condition', 'heating', 'parking']
+
+# Upper bound for the exponential back-off applied to listings that keep failing
+MAX_RETRY_BACKOFF = datetime.timedelta(days=1)
+
+
+def content_hash(expose: Dict[str, Any]) -> str:
+    """Hash of the detail fields of an expose, used to detect changed listings"""
+    details = {field: expose.get(field) for field in DETAIL_FIELDS}
+    return hashlib.sha256(
+        json.dumps(details, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
 class DetailScraper:
     """Scrapes detailed information for saved listings"""
 
     def __init__(self, config: Config, id_watch: IdMaintainer):
         self.config = config
         self.id_watch = id_watch
-        
+
+        detail_config = config.get('detail_scraper', {}) or {}
+        # Enriched listings are only fetched again once they are older than this
+        self.refresh_interval = datetime.timedelta(
+            hours=detail_config.get('refresh_hours', 24))
+        # Base delay before retrying a listing whose detail fetch failed
+        self.retry_backoff = datetime.timedelta(
+            minutes=detail_config.get('retry_backoff_minutes', 30))
+
         # Initialize crawlers for Storia and Imobiliare.ro
         self.storia_crawler = Storia(config)
         self.imobiliare_crawler = ImobiliareRo(config)
@@ -51,19 +76,57 @@ class DetailScraper:
         }
 
     def get_listings_to_update(self, hours_ago: int = 24) -> List[Dict[str, Any]]:
-        """Get listings from the last N hours that need detail updates"""
+        """Get listings from the last N hours that need detail updates, most urgent first.
+
+        Only Storia and Imobiliare.ro listings are loaded from the database.
+        Listings that were never enriched come first, followed by listings
+        whose last successful fetch is older than the refresh interval (oldest
+        first). Listings that are still fresh, or that are backing off after
+        failures, are skipped."""
         min_datetime = datetime.datetime.now() - datetime.timedelta(hours=hours_ago)
-        exposes = self.id_watch.get_exposes_since(min_datetime)
-        
-        # Filter for Storia and Imobiliare.ro listings only
-        filtered = [
-            expose for expose in exposes 
-            if expose.get('crawler') in self.crawlers
-        ]
-        
-        logger.info("Found %d listings to update (filtered from %d total)", 
-                   len(filtered), len(exposes))
-        return filtered
+        exposes = self.id_watch.get_exposes_since(min_datetime, crawlers=list(self.crawlers))
+        now = datetime.datetime.now()
+        states = self.id_watch.get_enrichment_states(
+            [(expose['id'], expose['crawler']) for expose in exposes])
+
+        queue: List[Any] = []
+        for position, expose in enumerate(exposes):
+            state = states.get((expose['id'], expose['crawler']))
+            if not self.is_due(state, now):
+                continue
+            last_fetch = None if state is None else state.get('last_detail_fetch')
+            failures = 0 if state is None else state.get('failure_count', 0)
+            priority = (last_fetch is not None, failures,
+                        last_fetch.timestamp() if last_fetch is not None else 0, position)
+            heapq.heappush(queue, (priority, expose))
+
+        listings = [heapq.heappop(queue)[1] for _ in range(len(queue))]
+        logger.info("Found %d listings to update (selected from %d total)",
+                   len(listings), len(exposes))
+        return listings
+
+    def retry_delay(self, failure_count: int) -> datetime.timedelta:
+        """Exponential back-off delay after the given number of consecutive failures"""
+        if failure_count <= 0:
+            return datetime.timedelta(0)
+        # Cap the exponent so that long failure streaks don't overflow the timedelta
+        delay = self.retry_backoff * (2 ** min(failure_count - 1, 16))
+        return min(delay, MAX_RETRY_BACKOFF)
+
+    def is_due(self, state: Optional[Dict[str, Any]], now: datetime.datetime) -> bool:
+        """True if a listing with the given enrichment state should be fetched now"""
+        if state is None:
+            return True
+        failures = state.get('failure_count', 0)
+        last_attempt = state.get('last_attempt')
+        if failures > 0 and last_attempt is not None \
+                and now < last_attempt + self.retry_delay(failures):
+            return False
+        last_fetch = state.get('last_detail_fetch')
+        if failures == 0 and last_fetch is not None \
+                and now < last_fetch + self.refresh_interval:
+            return False
+        return True
 
     def update_listing_details(self, expose: Dict[str, Any]) -> bool:
         """Fetch and update detailed information for a single listing"""
@@ -72,6 +135,8 @@ class DetailScraper:
             logger.debug("Skipping expose with crawler: %s", crawler_name)
             return False
         
+        state = self.id_watch.get_enrichment_state(expose['id'], crawler_name) or {}
+        now = datetime.datetime.now()
         try:
             crawler = self.crawlers[crawler_name]
             logger.info("Fetching details for: %s (ID: %s, Crawler: %s)", 
@@ -83,16 +148,19 @@ class DetailScraper:
             updated_expose = crawler.get_expose_details(expose)
             
             # Check if we got new information
-            new_fields = []
-            for field in ['description', 'images', 'construction_year', 'floor', 
-                         'building_type', 'condition', 'heating', 'parking']:
-                if field in updated_expose and field not in expose:
-                    new_fields.append(field)
-                elif (field in updated_expose and field in expose and 
-                      updated_expose[field] != expose[field]):
-                    new_fields.append(field)
-            
-            if new_fields:
+            previous_hash = state.get('content_hash') or content_hash(expose)
+            new_hash = content_hash(updated_expose)
+            self.id_watch.save_enrichment_state(expose['id'], crawler_name, {
+                'last_detail_fetch': now,
+                'last_attempt': now,
+                'content_hash': new_hash,
+                'failure_count': 0
+            })
+
+            if new_hash != previous_hash:
+                new_fields = [field for field in DETAIL_FIELDS
+                              if field in updated_expose
+                              and updated_expose[field] != expose.get(field)]
                 logger.info("Updated fields: %s", ', '.join(new_fields))
                 
                 # Save updated expose to database
@@ -105,6 +173,15 @@ class DetailScraper:
         except Exception as e:  # pylint: disable=broad-except
             logger.error("Error updating details for expose %s: %s", 
                         expose.get('url', 'unknown'), str(e))
+            failures = state.get('failure_count', 0) + 1
+            self.id_watch.save_enrichment_state(expose['id'], crawler_name, {
+                'last_detail_fetch': state.get('last_detail_fetch'),
+                'last_attempt': now,
+                'content_hash': state.get('content_hash'),
+                'failure_count': failures
+            })
+            logger.info("Backing off listing %s for %s after %d failure(s)",
+                        expose.get('id', 'unknown'), self.retry_delay(failures), failures)
             return False
 
     def scrape_details(self, hours_ago: int = 24):
@@ -135,6 +212,7 @@ class DetailScraper:
                 logger.debug("Sleeping for %d seconds before next request", sleep_time)
                 time.sleep(sleep_time)
         
+        self.id_watch.flush()
         logger.info("Detail scraping complete: %d updated, %d failed/skipped", 
                    updated_count, failed_count)
 
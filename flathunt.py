@@ -4,16 +4,22 @@
    messages about them. This is the main command-line executable, for running on the
    console. To run as a webservice, look at main.py"""
 
-import time
 from datetime import time as dtime
+from functools import partial
 
 from flathunter.argument_parser import parse
 from flathunter.logging import logger, configure_logging
+from flathunter import metrics
+from flathunter.adaptive_schedule import AdaptiveSchedule
 from flathunter.idmaintainer import IdMaintainer
 from flathunter.hunter import Hunter
 from flathunter.config import Config
 from flathunter.heartbeat import Heartbeat
-from flathunter.time_utils import get_random_time_jitter, wait_during_period
+from flathunter.outbox import OutboxDispatcher
+from flathunter.scheduler import Interval, Scheduler
+from flathunter.stand_ins import point_at_stand_ins
+from flathunter.time_utils import get_random_time_jitter, seconds_until_end_of_period, \
+    wait_during_period
 
 __author__ = "Jan Harrie"
 __version__ = "1.0"
@@ -22,6 +28,38 @@ __email__ = "harrymcfly@protonmail.com"
 __status__ = "Production"
 
 
+def schedule_sequential_crawls(config, hunter: Hunter, scheduler: Scheduler):
+    """Crawls all URLs every loop period"""
+    scheduler.every(Interval(config.loop_period_seconds(), config.random_jitter_enabled()),
+                    hunter.hunt_flats, 'crawl')
+
+
+def schedule_fixed_rate_crawls(config, hunter: Hunter, scheduler: Scheduler):
+    """Crawls every search at its own period, on the worker pool of the scheduler"""
+    for searcher, url in hunter.searches():
+        scheduler.every(Interval(config.loop_search_period_seconds(searcher.get_name(), url),
+                                 config.random_jitter_enabled()),
+                        partial(hunter.hunt_flats, searches=[(searcher, url)]),
+                        f"crawl {searcher.get_name()} {url}", background=True)
+
+
+def schedule_adaptive_crawls(config, hunter: Hunter, scheduler: Scheduler):
+    """Crawls every search when it is due according to its adaptive schedule"""
+    schedule = AdaptiveSchedule.from_config(config, hunter.searches())
+
+    def crawl(search):
+        def run():
+            new_exposes = hunter.hunt_flats(searches=[search.search()])
+            schedule.record(search, len(new_exposes))
+            if config.random_jitter_enabled():
+                return get_random_time_jitter(int(search.interval))
+            return search.interval
+        return run
+
+    for search in schedule.searches:
+        scheduler.schedule(crawl(search), f"crawl {search.searcher.get_name()} {search.url}")
+
+
 def launch_flat_hunt(config, heartbeat: Heartbeat):
     """Starts the crawler / notification loop"""
     id_watch = IdMaintainer(f'{config.database_location()}/processed_ids.db')
@@ -29,24 +67,38 @@ def launch_flat_hunt(config, heartbeat: Heartbeat):
     time_from = dtime.fromisoformat(config.loop_pause_from())
     time_till = dtime.fromisoformat(config.loop_pause_till())
 
-    wait_during_period(time_from, time_till)
+    metrics_port = config.metrics_port()
+    if metrics_port is not None:
+        metrics.start_http_server(metrics_port, config.metrics_host())
 
-    hunter = Hunter(config, id_watch)
-    hunter.hunt_flats()
-    counter = 0
+    wait_during_period(time_from, time_till)
 
-    while config.loop_is_active():
-        wait_during_period(time_from, time_till)
+    outbox = None
+    if config.notification_outbox():
+        outbox = OutboxDispatcher(config, id_watch)
+        if config.loop_is_active():
+            outbox.start()
 
-        counter += 1
-        counter = heartbeat.send_heartbeat(counter)
-        if config.random_jitter_enabled():
-            sleep_period = get_random_time_jitter(config.loop_period_seconds())
+    hunter = Hunter(config, id_watch)
+    if config.loop_is_active():
+        scheduler = Scheduler(pause=partial(seconds_until_end_of_period, time_from, time_till),
+                              workers=config.loop_workers())
+        heartbeat.schedule(scheduler)
+        if config.loop_schedule() == 'adaptive':
+            schedule_adaptive_crawls(config, hunter, scheduler)
+        elif config.loop_schedule() == 'fixed_rate':
+            schedule_fixed_rate_crawls(config, hunter, scheduler)
         else:
-            sleep_period = config.loop_period_seconds()
-        time.sleep(sleep_period)
+            schedule_sequential_crawls(config, hunter, scheduler)
+        scheduler.run()
+    else:
         hunter.hunt_flats()
 
+    if outbox is not None:
+        outbox.stop()
+        # Send whatever is left before exiting
+        outbox.drain()
+
 
 def main():
     """Processes command-line arguments, loads the config, launches the flathunter"""
@@ -61,6 +113,9 @@ def main():
     # setup logging
     configure_logging(config)
 
+    if args.stand_ins is not None:
+        point_at_stand_ins(config, args.stand_ins)
+
     # initialize search plugins for config
     config.init_searchers()
 
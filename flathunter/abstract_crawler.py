@@ -18,10 +18,11 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.wait import WebDriverWait
 
-from flathunter import proxies
+from flathunter import metrics, proxies
 from flathunter.captcha.captcha_solver import CaptchaUnsolvableError
 from flathunter.logging import logger
 from flathunter.exceptions import ProxyException
+from flathunter.page_archive import PageArchive
 
 
 class Crawler(ABC):
@@ -29,6 +30,9 @@ class Crawler(ABC):
 
     URL_PATTERN: re.Pattern
 
+    # Relative cost of a crawl, used to space out the crawls of expensive searches
+    CRAWL_COST = 1
+
     HEADERS = {
         'Connection': 'keep-alive',
         'Pragma': 'no-cache',
@@ -65,6 +69,9 @@ class Crawler(ABC):
             afterlogin_string: Optional[str] = None) -> BeautifulSoup:
         """Creates a Soup object from the HTML at the provided URL"""
 
+        replayed = self._replayed_page(url)
+        if replayed is not None:
+            return BeautifulSoup(replayed, 'lxml')
         if self.config.use_proxy():
             return self.get_soup_with_proxy(url)
         if driver is not None:
@@ -76,6 +83,7 @@ class Crawler(ABC):
             elif re.search("g-recaptcha", driver.page_source):
                 self.resolve_recaptcha(
                     driver, checkbox, afterlogin_string or "")
+            self._record_page(driver.page_source, url)
             return BeautifulSoup(driver.page_source, 'lxml')
 
         resp = requests.get(url, headers=self.HEADERS, timeout=30)
@@ -86,10 +94,14 @@ class Crawler(ABC):
             logger.error("Got response (%i): %s\n%s",
                          resp.status_code, resp.content, user_agent)
 
+        self._record_page(resp.content, url)
         return BeautifulSoup(resp.content, 'lxml')
 
     def get_soup_with_proxy(self, url) -> BeautifulSoup:
         """Will try proxies until it's possible to crawl and return a soup"""
+        replayed = self._replayed_page(url)
+        if replayed is not None:
+            return BeautifulSoup(replayed, 'lxml')
         resolved = False
         resp = None
 
@@ -109,6 +121,7 @@ class Crawler(ABC):
                     if resp.status_code != 200:
                         logger.error("Got response (%i): %s",
                                      resp.status_code, resp.content)
+                        metrics.PROXY_FAILURES.inc(reason='status')
                     else:
                         resolved = True
                         break
@@ -116,19 +129,62 @@ class Crawler(ABC):
                 except requests.exceptions.ConnectionError:
                     logger.error(
                         "Connection failed for proxy %s. Trying new proxy...", proxy)
+                    metrics.PROXY_FAILURES.inc(reason='connection')
                 except requests.exceptions.Timeout:
                     logger.error(
                         "Connection timed out for proxy %s. Trying new proxy...", proxy
                     )
+                    metrics.PROXY_FAILURES.inc(reason='timeout')
                 except requests.exceptions.RequestException:
                     logger.error("Some error occurred. Trying new proxy...")
+                    metrics.PROXY_FAILURES.inc(reason='error')
 
         if not resp:
             raise ProxyException(
                 "An error occurred while fetching proxies or content")
 
+        self._record_page(resp.content, url)
         return BeautifulSoup(resp.content, 'lxml')
 
+    def _page_archive(self) -> Optional[PageArchive]:
+        """The archive that pages are recorded to or replayed from, if any"""
+        config = getattr(self, 'config', None)
+        if config is None:
+            return None
+        return config.page_archive()
+
+    def _record_page(self, content, url: Optional[str] = None) -> None:
+        """Count a fetched page, and its size, in the metrics. If an archive
+           is recording, the page is added to it"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        metrics.PAGES_FETCHED.inc(crawler=self.get_name())
+        metrics.BYTES_DOWNLOADED.inc(len(content or b''), crawler=self.get_name())
+        archive = self._page_archive()
+        if archive is not None and archive.recording and url is not None:
+            archive.record(self.get_name(), url, content or b'')
+
+    def _replayed_page(self, url: str) -> Optional[bytes]:
+        """The recorded page for the URL, if an archive is replaying, else None"""
+        archive = self._page_archive()
+        if archive is None or not archive.replaying:
+            return None
+        content = archive.replay(self.get_name(), url)
+        self._record_page(content, url)
+        return content
+
+    def _solve_captcha(self, kind: str, solve, *args):
+        """Call the captcha solver, counting the solves and their cost"""
+        solver = type(self.captcha_solver).__name__
+        try:
+            result = solve(*args)
+        except CaptchaUnsolvableError:
+            metrics.CAPTCHA_SOLVES.inc(solver=solver, kind=kind, result='unsolvable')
+            raise
+        metrics.CAPTCHA_SOLVES.inc(solver=solver, kind=kind, result='solved')
+        metrics.CAPTCHA_COST.inc(self.config.captcha_cost_per_solve(), solver=solver)
+        return result
+
     def extract_data(self, raw_data):
         """Should be implemented in subclass"""
         raise NotImplementedError
@@ -181,7 +237,9 @@ class Crawler(ABC):
         geetest = re.findall("gt: \"(.*?)\"", result[0])[0]
         challenge = re.findall("challenge: \"(.*?)\"", result[0])[0]
         try:
-            captcha_response = self.captcha_solver.solve_geetest(
+            captcha_response = self._solve_captcha(
+                'geetest',
+                self.captcha_solver.solve_geetest,
                 geetest,
                 challenge,
                 driver.current_url
@@ -250,7 +308,9 @@ class Crawler(ABC):
             raise CaptchaUnsolvableError("Unable to find challenge or JSApi value in page source")
 
         try:
-            captcha = self.captcha_solver.solve_awswaf(
+            captcha = self._solve_captcha(
+                'awswaf',
+                self.captcha_solver.solve_awswaf,
                 sitekey,
                 iv,
                 context,
@@ -281,7 +341,9 @@ class Crawler(ABC):
                 .get_attribute("data-sitekey")
 
             try:
-                captcha_result = self.captcha_solver.solve_recaptcha(
+                captcha_result = self._solve_captcha(
+                    'recaptcha',
+                    self.captcha_solver.solve_recaptcha,
                     google_site_key,
                     driver.current_url
                 ).result
@@ -7,3 +7,9 @@ class Notifier(ABC):
     @abstractmethod
     def notify(self, message: str):
         """Notify users with the given message"""
+
+    @staticmethod
+    def is_permanent_failure(status_code: int) -> bool:
+        """True if a service rejected a message with a client error, which
+           retrying won't fix. Rate limiting (429) is not permanent"""
+        return 400 <= status_code < 500 and status_code != 429
@@ -1,14 +1,53 @@
 """Abstract class defining the 'Processor' interface"""
-from typing import Dict
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from flathunter.utils.list import chunk_stream
 
 class Processor:
     """Processor interface. Flathunter runs sequences of exposes through
        a set of processors that stack on each other"""
 
+    # Whether the processor mostly waits for I/O (web pages, APIs, the
+    # database) rather than using the CPU. In a staged chain, every I/O-bound
+    # processor runs on a thread of its own
+    IO_BOUND = False
+
+    # How many exposes an I/O-bound processor can work on at the same time. A
+    # staged chain runs 'process_expose' on this many threads, unless the
+    # processor implements 'process_exposes' (and its own concurrency) itself
+    PARALLELISM = 1
+
+    # Largest batch that is passed to 'process_batch'. Processor chains may
+    # use smaller batches, see 'pipeline.batch_size'
+    BATCH_SIZE: Optional[int] = 20
+
     def process_expose(self, expose: Dict) -> Dict:
         """Mutate the expose. Should be implemented in the subclass"""
         return expose
 
+    def process_batch(self, exposes: List[Dict]) -> List[Dict]:
+        """Mutate a batch of exposes. Processors that can share work between
+           exposes (bulk writes, batched API requests) implement this instead
+           of 'process_expose'"""
+        return [self.process_expose(expose) for expose in exposes]
+
+    def supports_batches(self) -> bool:
+        """True if the processor implements 'process_batch'"""
+        return type(self).process_batch is not Processor.process_batch
+
     def process_exposes(self, exposes):
         """Apply the processor to every expose in the sequence"""
+        if self.supports_batches():
+            return self.process_batches(exposes, self.BATCH_SIZE)
         return map(self.process_expose, exposes)
+
+    def process_batches(self, exposes: Iterable, batch_size: Optional[int],
+                        timeout: Optional[float] = None) -> Iterator[Dict]:
+        """Apply the processor to batches of the exposes. A batch is processed
+           when it is full, or when its first expose has waited for the timeout"""
+        if self.BATCH_SIZE is not None:
+            batch_size = self.BATCH_SIZE if batch_size is None \
+                else min(batch_size, self.BATCH_SIZE)
+        return chain.from_iterable(map(self.process_batch,
+                                       chunk_stream(exposes, batch_size or 1, timeout)))
@@ -0,0 +1,88 @@
+"""Adaptive scheduling of the configured searches. Every search - a crawler
+   and one of its URLs - gets its own crawl interval, adapted to how often the
+   search turns up new listings. The rate of new listings is estimated with
+   exponential smoothing; searches with expensive crawlers (such as the ones
+   driving a browser) need to promise more new listings before they run"""
+import time
+from typing import Callable, Iterable, Optional, Tuple
+
+from flathunter.abstract_crawler import Crawler
+from flathunter.logging import logger
+
+
+class SearchSchedule:
+    """Crawl interval and rate of new listings of one search"""
+
+    def __init__(self, searcher: Crawler, url: str, interval: float):
+        self.searcher = searcher
+        self.url = url
+        self.cost = getattr(searcher, 'CRAWL_COST', 1)
+        self.interval = interval
+        # Smoothed number of new listings per second, None until measured
+        self.rate: Optional[float] = None
+        self.last_run: Optional[float] = None
+
+    def search(self) -> Tuple[Crawler, str]:
+        """The (crawler, URL) pair, as accepted by the hunter"""
+        return (self.searcher, self.url)
+
+    def __repr__(self):
+        return f"SearchSchedule({self.searcher.get_name()}, {self.url})"
+
+
+class AdaptiveSchedule:
+    """
+    Decides the crawl interval of each search. After each crawl of a search,
+    the new listings it found are folded into the smoothed rate of the search,
+    and the next crawl is planned for when the search is expected to have
+    found enough new listings to be worth its cost. Searches that find nothing slow
+    down to the maximum interval; busy ones speed up to the minimum interval
+    """
+
+    # Weight of the latest observation in the smoothed rate
+    SMOOTHING = 0.3
+    # New listings a crawl of cost 1 is expected to find
+    TARGET_NEW_PER_CRAWL = 1.0
+
+    def __init__(self, searches: Iterable[Tuple[Crawler, str]], base_interval: float,
+                 min_interval: float, max_interval: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.clock = clock
+        self.searches = [SearchSchedule(searcher, url, self.__clamp(base_interval))
+                         for searcher, url in searches]
+
+    @classmethod
+    def from_config(cls, config, searches: Iterable[Tuple[Crawler, str]]):
+        """Create a schedule with the intervals from the loop configuration"""
+        return cls(searches, config.loop_period_seconds(),
+                   config.loop_min_period_seconds(), config.loop_max_period_seconds())
+
+    def __clamp(self, interval: float) -> float:
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def interval_for(self, search: SearchSchedule) -> float:
+        """The interval that is expected to find enough new listings for the cost"""
+        if search.rate is None:
+            return self.__clamp(self.base_interval * search.cost)
+        if search.rate <= 0:
+            return self.max_interval
+        return self.__clamp(search.cost * self.TARGET_NEW_PER_CRAWL / search.rate)
+
+    def record(self, search: SearchSchedule, new_listings: int) -> None:
+        """Record the outcome of a crawl, and set the interval until the next crawl
+           of the search"""
+        now = self.clock()
+        # The listings found by the first crawl have no known time span
+        if search.last_run is not None:
+            observed = new_listings / max(now - search.last_run, 1.0)
+            if search.rate is None:
+                search.rate = observed
+            else:
+                search.rate = self.SMOOTHING * observed + (1 - self.SMOOTHING) * search.rate
+        search.last_run = now
+        search.interval = self.interval_for(search)
+        logger.debug("%s found %d new listings, next crawl in %d seconds",
+                     search, new_listings, search.interval)
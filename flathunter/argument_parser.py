@@ -30,4 +30,12 @@ def parse():
                               'that the bot is alive. Accepted strings are "hour", "day", "week".'
                               'Defaults to None.')
                         )
+    parser.add_argument('--stand-ins',
+                        action='store',
+                        default=None,
+                        metavar='URL',
+                        help=('Send the requests to Telegram, Google Maps, Slack, Mattermost '
+                              'and the captcha solvers to local stand-ins at this URL, '
+                              'as served by "python -m flathunter.stand_ins".')
+                        )
     return parser.parse_known_args()[0]
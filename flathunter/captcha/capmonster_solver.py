@@ -15,6 +15,8 @@ from flathunter.captcha.captcha_solver import (
 class CapmonsterSolver(CaptchaSolver):
     """Implementation of Captcha solver for CapMonster"""
 
+    API_URL = "https://api.capmonster.cloud"
+
     def solve_geetest(self, geetest: str, challenge: str, page_url: str) -> GeetestResponse:
         """Should be implemented in subclass"""
         raise NotImplementedError("Geetest captcha solving is not implemented for CapMonster")
@@ -54,7 +56,7 @@ class CapmonsterSolver(CaptchaSolver):
 
     @backoff.on_exception(**CaptchaSolver.backoff_options)
     def __submit_capmonster_request(self, params: Dict[str, str]) -> str:
-        submit_url = "https://api.capmonster.cloud/createTask"
+        submit_url = f"{self.api_url}/createTask"
         submit_response = requests.post(submit_url, json=params, timeout=30)
         logger.info("Got response from capmonster: %s", submit_response.text)
 
@@ -64,7 +66,7 @@ class CapmonsterSolver(CaptchaSolver):
 
     @backoff.on_exception(**CaptchaSolver.backoff_options)
     def __retrieve_capmonster_result(self, captcha_id: str):
-        retrieve_url = "https://api.capmonster.cloud/getTaskResult"
+        retrieve_url = f"{self.api_url}/getTaskResult"
         params = {
             "clientKey": self.api_key,
             "taskId": captcha_id
@@ -2,6 +2,7 @@
 Captcha solver implementations should subclass this."""
 
 from dataclasses import dataclass
+from typing import Optional
 import requests
 import backoff
 
@@ -32,8 +33,12 @@ class CaptchaSolver:
         "max_time": 100
     }
 
-    def __init__(self, api_key):
+    # Base URL of the solving service
+    API_URL = ''
+
+    def __init__(self, api_key, api_url: Optional[str] = None):
         self.api_key = api_key
+        self.api_url = (api_url or self.API_URL).rstrip('/')
 
     def solve_geetest(self, geetest: str, challenge: str, page_url: str) -> GeetestResponse:
         """Should be implemented in subclass"""
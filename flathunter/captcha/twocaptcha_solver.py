@@ -18,6 +18,8 @@ from flathunter.captcha.captcha_solver import (
 class TwoCaptchaSolver(CaptchaSolver):
     """Implementation of Captcha solver for 2Captcha"""
 
+    API_URL = "http://2captcha.com"
+
     def solve_geetest(self, geetest: str, challenge: str, page_url: str) -> GeetestResponse:
         """Solves GeeTest Captcha"""
         logger.info("Trying to solve geetest.")
@@ -62,7 +64,7 @@ class TwoCaptchaSolver(CaptchaSolver):
 
     @backoff.on_exception(**CaptchaSolver.backoff_options)
     def __submit_2captcha_request(self, params: Dict[str, str]) -> str:
-        submit_url = "http://2captcha.com/in.php"
+        submit_url = f"{self.api_url}/in.php"
         submit_response = requests.post(submit_url, params=params, timeout=30)
         logger.info("Got response from 2captcha/in: %s", submit_response.text)
 
@@ -74,7 +76,7 @@ class TwoCaptchaSolver(CaptchaSolver):
 
     @backoff.on_exception(**CaptchaSolver.backoff_options)
     def __retrieve_2captcha_result(self, captcha_id: str):
-        retrieve_url = "http://2captcha.com/res.php"
+        retrieve_url = f"{self.api_url}/res.php"
         params = {
             "key": self.api_key,
             "action": "get",
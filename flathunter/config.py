@@ -23,6 +23,7 @@ from flathunter.crawler.imobiliare_ro import ImobiliareRo
 from flathunter.filter import Filter
 from flathunter.logging import logger
 from flathunter.exceptions import ConfigException
+from flathunter.page_archive import PageArchive
 
 load_dotenv()
 
@@ -35,6 +36,16 @@ def _read_env(key: str, fallback: Optional[str] = None) -> Readenv:
     """ read the given key from environment"""
     return lambda: os.environ.get(key, fallback)
 
+def _to_threshold(value: Any) -> Optional[int]:
+    """Cast the digest threshold to a non-negative integer, or None"""
+    if value is None:
+        return None
+    threshold = int(value)
+    if threshold < 0:
+        raise ConfigException(f"The digest threshold must not be negative, got {threshold}")
+    return threshold
+
+
 def _to_bool(value: Any) -> bool:
     """Cast config parameters to booleans"""
     if isinstance(value, bool):
@@ -63,9 +74,15 @@ class Env:
     FLATHUNTER_DATABASE_LOCATION = _read_env("FLATHUNTER_DATABASE_LOCATION")
     FLATHUNTER_GOOGLE_CLOUD_PROJECT_ID = _read_env(
         "FLATHUNTER_GOOGLE_CLOUD_PROJECT_ID")
+    FLATHUNTER_GOOGLE_CLOUD_BATCH_WRITES = _read_env(
+        "FLATHUNTER_GOOGLE_CLOUD_BATCH_WRITES")
+    FLATHUNTER_NOTIFICATION_OUTBOX = _read_env("FLATHUNTER_NOTIFICATION_OUTBOX")
+    FLATHUNTER_STAGED_PIPELINE = _read_env("FLATHUNTER_STAGED_PIPELINE")
+    FLATHUNTER_METRICS_PORT = _read_env("FLATHUNTER_METRICS_PORT")
     FLATHUNTER_VERBOSE_LOG = _read_env("FLATHUNTER_VERBOSE_LOG")
     FLATHUNTER_LOOP_PERIOD_SECONDS = _read_env(
         "FLATHUNTER_LOOP_PERIOD_SECONDS")
+    FLATHUNTER_LOOP_SCHEDULE = _read_env("FLATHUNTER_LOOP_SCHEDULE")
     FLATHUNTER_RANDOM_JITTER_ENABLED = _read_env("FLATHUNTER_RANDOM_JITTER_ENABLED")
     FLATHUNTER_LOOP_PAUSE_FROM = _read_env("FLATHUNTER_LOOP_PAUSE_FROM")
     FLATHUNTER_LOOP_PAUSE_TILL = _read_env("FLATHUNTER_LOOP_PAUSE_TILL")
@@ -91,6 +108,7 @@ class Env:
         "FLATHUNTER_APPRISE_NOTIFY_WITH_IMAGES")
     FLATHUNTER_APPRISE_IMAGE_LIMIT = _read_env(
         "FLATHUNTER_APPRISE_IMAGE_LIMIT")
+    FLATHUNTER_DIGEST_THRESHOLD = _read_env("FLATHUNTER_DIGEST_THRESHOLD")
 
     # Filters
     FLATHUNTER_FILTER_EXCLUDED_TITLES = _read_env(
@@ -129,6 +147,8 @@ Preis: {price}
             config = {}
         self.config = config
         self.__searchers__ = []
+        self.__page_archive: Optional[PageArchive] = None
+        self.__stand_ins_url: Optional[str] = None
         self.check_deprecated()
 
     def __iter__(self):
@@ -238,6 +258,36 @@ Preis: {price}
         """Number of seconds to wait between crawls when looping"""
         return self._read_yaml_path('loop.sleeping_time', 60 * 10)
 
+    def loop_schedule(self) -> str:
+        """How the searches are scheduled when looping: 'sequential' crawls all
+           URLs every loop period, 'adaptive' gives every search its own interval,
+           'fixed_rate' crawls every search at its configured period, in parallel"""
+        return str(self._read_yaml_path('loop.schedule', 'sequential')).lower()
+
+    def loop_search_period_seconds(self, crawler_name: str, url: str) -> int:
+        """Number of seconds between the crawls of one search, for fixed-rate
+           scheduling. Periods can be configured by URL or by crawler name"""
+        periods = self._read_yaml_path('loop.periods', None) or {}
+        if url in periods:
+            return int(periods[url])
+        if crawler_name in periods:
+            return int(periods[crawler_name])
+        return int(self.loop_period_seconds())
+
+    def loop_workers(self) -> int:
+        """How many searches can be crawled at the same time, for fixed-rate scheduling"""
+        return int(self._read_yaml_path('loop.workers', 4))
+
+    def loop_min_period_seconds(self) -> int:
+        """Shortest interval between two crawls of a search, for adaptive scheduling"""
+        return int(self._read_yaml_path('loop.min_sleeping_time',
+                                        max(60, int(self.loop_period_seconds()) // 4)))
+
+    def loop_max_period_seconds(self) -> int:
+        """Longest interval between two crawls of a search, for adaptive scheduling"""
+        return int(self._read_yaml_path('loop.max_sleeping_time',
+                                        int(self.loop_period_seconds()) * 4))
+
     def random_jitter_enabled(self):
         """Whether a random delay should be added to loop sleeping time, defaults to true"""
         return self._read_yaml_path('loop.random_jitter', True)
@@ -270,6 +320,31 @@ Preis: {price}
         """Google Cloud project ID for App Engine / Cloud Run deployments"""
         return self._read_yaml_path('google_cloud_project_id', None)
 
+    def google_cloud_batch_writes(self) -> bool:
+        """True if Firestore writes should be batched and flushed once per crawl"""
+        return _to_bool(self._read_yaml_path('google_cloud_batch_writes', False))
+
+    def notification_outbox(self) -> bool:
+        """True if notifications should be queued in the database and sent
+           separately from the crawl"""
+        return _to_bool(self._read_yaml_path('notification_outbox', False))
+
+    def staged_pipeline(self) -> bool:
+        """True if the processors should run as concurrent pipeline stages"""
+        return _to_bool(self._read_yaml_path('pipeline.staged', False))
+
+    def pipeline_queue_size(self) -> int:
+        """How many exposes may wait between two pipeline stages"""
+        return int(self._read_yaml_path('pipeline.queue_size', 16))
+
+    def pipeline_batch_size(self) -> int:
+        """How many exposes are passed at once to processors that handle batches"""
+        return int(self._read_yaml_path('pipeline.batch_size', 20))
+
+    def pipeline_batch_timeout(self) -> float:
+        """Seconds after which an incomplete batch of exposes is processed anyway"""
+        return float(self._read_yaml_path('pipeline.batch_timeout', 1.0))
+
     def message_format(self):
         """Format of the message to send in user notifications"""
         config_format = self._read_yaml_path('message', None)
@@ -279,7 +354,14 @@ Preis: {price}
 
     def notifiers(self) -> List[str]:
         """List of currently-active notifiers"""
-        return self._read_yaml_path('notifiers', [])
+        return self._redirectable_notifiers(self._read_yaml_path('notifiers', []))
+
+    def _redirectable_notifiers(self, notifiers: List[str]) -> List[str]:
+        """The notifiers, without those that cannot be sent to the stand-ins if
+           they are used"""
+        if self.__stand_ins_url is None or notifiers is None:
+            return notifiers
+        return [notifier for notifier in notifiers if notifier != 'apprise']
 
     def telegram_bot_token(self) -> Optional[str]:
         """API Token to authenticate to the Telegram bot"""
@@ -295,13 +377,19 @@ Preis: {price}
         """Static list of receiver IDs for notification messages"""
         return self._read_yaml_path('telegram.receiver_ids', [])
 
+    def telegram_api_url(self) -> str:
+        """Base URL of the Telegram bot API"""
+        if self.__stand_ins_url is not None:
+            return self.__stand_ins_url
+        return self._read_yaml_path('telegram.api_url', 'https://api.telegram.org').rstrip('/')
+
     def mattermost_webhook_url(self):
         """Webhook for sending Mattermost messages"""
-        return self._read_yaml_path('mattermost.webhook_url', None)
+        return self._stand_in('mattermost') or self._read_yaml_path('mattermost.webhook_url', None)
 
     def slack_webhook_url(self):
         """Webhook for sending Slack messages"""
-        return self._read_yaml_path('slack.webhook_url', "")
+        return self._stand_in('slack') or self._read_yaml_path('slack.webhook_url', "")
 
     def apprise_urls(self) -> List[str]:
         """Notification URLs for Apprise"""
@@ -317,8 +405,24 @@ Preis: {price}
         """How many images should be sent along with Apprise notifications"""
         return self._read_yaml_path('apprise_image_limit', None)
 
+    def digest_threshold(self) -> Optional[int]:
+        """Number of new exposes in one crawl above which notifications are sent
+           as digests. None if digests are disabled"""
+        return _to_threshold(self._read_yaml_path('digest.threshold', None))
+
+    def digest_listings_per_message(self) -> int:
+        """How many exposes are listed in each digest message"""
+        return int(self._read_yaml_path('digest.listings_per_message', 10))
+
+    def digest_summary_only(self) -> bool:
+        """True if a digest should be a single summary message linking to the website"""
+        return _to_bool(self._read_yaml_path('digest.summary_only', False))
+
     def _get_imagetyperz_token(self):
-        """API Token for Imagetyperz"""
+        """API Token for Imagetyperz. Imagetyperz cannot be sent to the stand-ins,
+           so there is none while they are used"""
+        if self.__stand_ins_url is not None:
+            return ""
         return self._read_yaml_path("captcha.imagetyperz.token", "")
 
     def get_twocaptcha_key(self) -> str:
@@ -329,6 +433,15 @@ Preis: {price}
         """API Token for Capmonster"""
         return self._read_yaml_path("captcha.capmonster.api_key", "")
 
+    def get_twocaptcha_api_url(self) -> Optional[str]:
+        """Base URL of the 2captcha API, None for the default"""
+        return self._stand_in('2captcha') or self._read_yaml_path("captcha.2captcha.api_url", None)
+
+    def get_capmonster_api_url(self) -> Optional[str]:
+        """Base URL of the Capmonster API, None for the default"""
+        return self._stand_in('capmonster') or \
+            self._read_yaml_path("captcha.capmonster.api_url", None)
+
     def _get_captcha_solver(self) -> Optional[CaptchaSolver]:
         """Get configured captcha solver"""
         imagetyperz_token = self._get_imagetyperz_token()
@@ -337,11 +450,11 @@ Preis: {price}
 
         twocaptcha_api_key = self.get_twocaptcha_key()
         if twocaptcha_api_key:
-            return TwoCaptchaSolver(twocaptcha_api_key)
+            return TwoCaptchaSolver(twocaptcha_api_key, self.get_twocaptcha_api_url())
 
         capmonster_api_key = self.get_capmonster_key()
         if capmonster_api_key:
-            return CapmonsterSolver(capmonster_api_key)
+            return CapmonsterSolver(capmonster_api_key, self.get_capmonster_api_url())
 
         return None
 
@@ -352,6 +465,47 @@ Preis: {price}
             return solver
         raise ConfigException("No captcha solver configured properly.")
 
+    def captcha_cost_per_solve(self) -> float:
+        """What the captcha solving service charges per solved captcha, for the
+           metrics. Zero if not configured"""
+        return float(self._read_yaml_path('captcha.cost_per_solve', 0.0))
+
+    def page_archive(self) -> Optional[PageArchive]:
+        """Archive that the crawlers record their pages to, or replay them from"""
+        if self.__page_archive is None and self._read_yaml_path('page_archive.path', None):
+            self.__page_archive = PageArchive(self._read_yaml_path('page_archive.path', None),
+                                              self._read_yaml_path('page_archive.mode',
+                                                                   PageArchive.RECORD))
+        return self.__page_archive
+
+    def set_page_archive(self, archive: Optional[PageArchive]):
+        """Use the archive for the crawlers' pages"""
+        self.__page_archive = archive
+
+    def stand_ins_url(self) -> Optional[str]:
+        """Base URL of the local stand-ins for the external services, or None"""
+        return self.__stand_ins_url
+
+    def set_stand_ins_url(self, base_url: Optional[str]):
+        """Send the requests to external services to the stand-ins at base_url.
+           This takes precedence over the config file and the environment"""
+        self.__stand_ins_url = base_url.rstrip('/') if base_url else None
+
+    def _stand_in(self, service: str) -> Optional[str]:
+        """URL of the stand-in for a service, None if the stand-ins are not used"""
+        if self.__stand_ins_url is None:
+            return None
+        return f"{self.__stand_ins_url}/{service}"
+
+    def metrics_port(self) -> Optional[int]:
+        """Port of the metrics HTTP server of the command-line loop, or None"""
+        port = self._read_yaml_path('metrics.port', None)
+        return None if port is None else int(port)
+
+    def metrics_host(self) -> str:
+        """Address the metrics HTTP server listens on"""
+        return self._read_yaml_path('metrics.host', '127.0.0.1')
+
     def captcha_driver_arguments(self):
         """The list of driver arguments for Selenium / Webdriver"""
         return self._read_yaml_path('captcha.driver_arguments', [])
@@ -426,6 +580,8 @@ class CaptchaEnvironmentConfig(YamlConfig):
     """Mixin to add environment-variable captcha support to config object"""
 
     def _get_imagetyperz_token(self):
+        if self.stand_ins_url() is not None:  # pylint: disable=no-member
+            return super()._get_imagetyperz_token()  # pylint: disable=no-member
         return Env.FLATHUNTER_IMAGETYPERZ_TOKEN() or super()._get_imagetyperz_token()  # pylint: disable=no-member
 
     def get_twocaptcha_key(self) -> str:
@@ -495,6 +651,12 @@ class Config(CaptchaEnvironmentConfig):  # pylint: disable=too-many-public-metho
             return int(env_seconds)
         return super().loop_period_seconds()
 
+    def loop_schedule(self) -> str:
+        env_schedule = Env.FLATHUNTER_LOOP_SCHEDULE()
+        if env_schedule is not None:
+            return str(env_schedule).lower()
+        return super().loop_schedule()
+
     def random_jitter_enabled(self):
         env_jitter = Env.FLATHUNTER_RANDOM_JITTER_ENABLED()
         if env_jitter is not None:
@@ -530,6 +692,30 @@ class Config(CaptchaEnvironmentConfig):  # pylint: disable=too-many-public-metho
     def google_cloud_project_id(self):
         return Env.FLATHUNTER_GOOGLE_CLOUD_PROJECT_ID() or super().google_cloud_project_id()
 
+    def google_cloud_batch_writes(self) -> bool:
+        env_batch_writes = Env.FLATHUNTER_GOOGLE_CLOUD_BATCH_WRITES()
+        if env_batch_writes is not None:
+            return _to_bool(env_batch_writes)
+        return super().google_cloud_batch_writes()
+
+    def notification_outbox(self) -> bool:
+        env_notification_outbox = Env.FLATHUNTER_NOTIFICATION_OUTBOX()
+        if env_notification_outbox is not None:
+            return _to_bool(env_notification_outbox)
+        return super().notification_outbox()
+
+    def metrics_port(self) -> Optional[int]:
+        env_metrics_port = Env.FLATHUNTER_METRICS_PORT()
+        if env_metrics_port is not None:
+            return int(env_metrics_port)
+        return super().metrics_port()
+
+    def staged_pipeline(self) -> bool:
+        env_staged_pipeline = Env.FLATHUNTER_STAGED_PIPELINE()
+        if env_staged_pipeline is not None:
+            return _to_bool(env_staged_pipeline)
+        return super().staged_pipeline()
+
     def message_format(self):
         env_message_format = Env.FLATHUNTER_MESSAGE_FORMAT()
         if env_message_format is not None:
@@ -539,7 +725,7 @@ class Config(CaptchaEnvironmentConfig):  # pylint: disable=too-many-public-metho
     def notifiers(self):
         env_notifiers = Env.FLATHUNTER_NOTIFIERS()
         if env_notifiers is not None:
-            return env_notifiers.split(",")
+            return self._redirectable_notifiers(env_notifiers.split(","))
         return super().notifiers()
 
     def telegram_bot_token(self) -> Optional[str]:
@@ -558,10 +744,12 @@ class Config(CaptchaEnvironmentConfig):  # pylint: disable=too-many-public-metho
         return super().telegram_receiver_ids()
 
     def mattermost_webhook_url(self):
+        if self.stand_ins_url() is not None:
+            return super().mattermost_webhook_url()
         return Env.FLATHUNTER_MATTERMOST_WEBHOOK_URL() or super().mattermost_webhook_url()
 
     def slack_webhook_url(self):
-        if Env.FLATHUNTER_SLACK_WEBHOOK_URL() is not None:
+        if Env.FLATHUNTER_SLACK_WEBHOOK_URL() is not None and self.stand_ins_url() is None:
             return Env.FLATHUNTER_SLACK_WEBHOOK_URL()
         return super().slack_webhook_url()
 
@@ -576,6 +764,12 @@ class Config(CaptchaEnvironmentConfig):  # pylint: disable=too-many-public-metho
             return int(env_limit)
         return super().apprise_image_limit()
 
+    def digest_threshold(self) -> Optional[int]:
+        env_threshold = Env.FLATHUNTER_DIGEST_THRESHOLD()
+        if env_threshold is not None:
+            return _to_threshold(env_threshold)
+        return super().digest_threshold()
+
     def excluded_titles(self):
         env_filter = Env.FLATHUNTER_FILTER_EXCLUDED_TITLES()
         if env_filter is not None:
@@ -78,16 +78,24 @@ class Immobilienscout(Crawler):
     def fetch_api_data(self, search_url: str, page_no: int | None = None) -> requests.Response:
         """Applies a page number to a formatted API URL and fetches the exposes at that page"""
 
+        url = search_url.format(page_no)
+        replayed = self._replayed_page(url)
+        if replayed is not None:
+            response = requests.Response()
+            response.status_code = 200
+            response._content = replayed  # pylint: disable=protected-access
+            return response
         data = {
             "supportedResultListType": [],
             "userData": {}
         }
         response = requests.post(
-            search_url.format(page_no),
+            url,
             headers=self.HEADERS,
             json=data,
             timeout=30
         )
+        self._record_page(response.content, url)
         return response
 
     def extract_data(self, raw_data: dict) -> list:
@@ -26,6 +26,10 @@ class Storia(WebdriverCrawler):
         from selenium.webdriver.support.ui import WebDriverWait
         from selenium.webdriver.support import expected_conditions as EC
         
+        replayed = self._replayed_page(search_url)
+        if replayed is not None:
+            return BeautifulSoup(replayed, 'lxml')
+
         driver = self.get_driver()
         if driver is None:
             logger.error("WebDriver not available for Storia.ro - Chrome is required")
@@ -98,6 +102,7 @@ class Storia(WebdriverCrawler):
             else:
                 logger.debug("Storia.ro: Retrieved page with %d characters", len(page_source))
             
+            self._record_page(page_source, search_url)
             return BeautifulSoup(page_source, 'lxml')
             
         except Exception as e:
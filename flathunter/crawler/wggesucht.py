@@ -215,6 +215,9 @@ class WgGesucht(Crawler):
         necessary as we need to reload the page once for all filters to
         be applied correctly on wg-gesucht.
         """
+        replayed = self._replayed_page(url)
+        if replayed is not None:
+            return BeautifulSoup(replayed, 'lxml')
         sess = requests.session()
         # First page load to set filters; response is discarded
         sess.get(url, headers=self.HEADERS)
@@ -233,5 +236,7 @@ class WgGesucht(Crawler):
             elif re.search("g-recaptcha", driver.page_source):
                 self.resolve_recaptcha(
                     driver, checkbox, afterlogin_string or "")
+            self._record_page(driver.page_source, url)
             return BeautifulSoup(driver.page_source, 'lxml')
+        self._record_page(resp.content, url)
         return BeautifulSoup(resp.content, 'lxml')
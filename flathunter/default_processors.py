@@ -1,9 +1,14 @@
 """Built-in expose processor implementations. Used by the processor pipelines
    in flathunter and in the webservice"""
+import datetime
 import re
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Dict, Optional, Tuple
 
 from flathunter.logging import logger
 from flathunter.abstract_processor import Processor
+from flathunter.webdriver_crawler import hold_driver
 
 class Filter(Processor):
     """Filter processor implementation. Applies a filter to the list of exposes"""
@@ -16,25 +21,85 @@ class Filter(Processor):
         return self.filter.filter(exposes)
 
 class AddressResolver(Processor):
-    """Processor to extract apartment addresses from expose links"""
+    """Processor to extract apartment addresses from expose links. Pages are
+       fetched concurrently, each URL at most once per run, and the resolved
+       addresses are cached in the database if one is supplied"""
 
-    def __init__(self, config):
+    CACHE_NAMESPACE = 'address'
+    CACHE_TTL = datetime.timedelta(days=90)
+
+    MAX_WORKERS = 4
+    IO_BOUND = True
+    PARALLELISM = MAX_WORKERS
+    # Number of exposes held back while waiting for their addresses
+    MAX_PENDING = 16
+
+    def __init__(self, config, id_watch=None):
         self.config = config
+        self.id_watch = id_watch
 
     def process_expose(self, expose):
         """Fetches the expose from the expose URL and extracts the address"""
-        if expose['address'].startswith('http'):
-            url = expose['address']
-            for searcher in self.config.searchers():
-                if re.search(searcher.URL_PATTERN, url):
-                    expose['address'] = searcher.load_address(url)
-                    logger.debug("Loaded address %s for url %s", expose['address'], url)
-                    break
+        return next(iter(self.process_exposes([expose])))
+
+    def process_exposes(self, exposes):
+        """Resolve the addresses of the exposes, loading the pages in parallel"""
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS,
+                                thread_name_prefix='address') as executor:
+            lookups: Dict[str, Future] = {}
+            pending: Deque[Tuple[Dict, Optional[Future]]] = deque()
+            for expose in exposes:
+                url = expose['address'] if expose['address'].startswith('http') else None
+                lookup = None
+                if url is not None:
+                    if url not in lookups:
+                        lookups[url] = self.__lookup(executor, url)
+                    lookup = lookups[url]
+                pending.append((expose, lookup))
+                while len(pending) > self.MAX_PENDING:
+                    yield self.__resolve(*pending.popleft())
+            while len(pending) > 0:
+                yield self.__resolve(*pending.popleft())
+
+    def __lookup(self, executor, url) -> Future:
+        """Start loading the address for a URL, unless it is cached"""
+        if self.id_watch is not None:
+            address = self.id_watch.get_cached(self.CACHE_NAMESPACE, url, self.CACHE_TTL)
+            if address is not None:
+                logger.debug("Using cached address %s for url %s", address, url)
+                cached: Future = Future()
+                cached.set_result((address, False))
+                return cached
+        return executor.submit(self.load_address, url)
+
+    def load_address(self, url):
+        """Load the address from the expose page. Returns the address (or the
+           URL if no crawler handles it) and whether it was loaded from the page"""
+        for searcher in self.config.searchers():
+            if re.search(searcher.URL_PATTERN, url):
+                with hold_driver(searcher):
+                    return searcher.load_address(url), True
+        return url, False
+
+    def __resolve(self, expose, lookup: Optional[Future]):
+        """Wait for the address of an expose, and cache it"""
+        if lookup is None:
+            return expose
+        url = expose['address']
+        address, loaded = lookup.result()
+        expose['address'] = address
+        if loaded:
+            logger.debug("Loaded address %s for url %s", address, url)
+            if address and self.id_watch is not None:
+                self.id_watch.set_cached(self.CACHE_NAMESPACE, url, address)
         return expose
 
 class CrawlExposeDetails(Processor):
     """Processor to extract additional apartment details by parsing page at expose URL"""
 
+    IO_BOUND = True
+    PARALLELISM = 4
+
     def __init__(self, config):
         self.config = config
 
@@ -42,7 +107,8 @@ class CrawlExposeDetails(Processor):
         """Fetches the page at exposes['url'] and extracts additional details from it"""
         for searcher in self.config.searchers():
             if re.search(searcher.URL_PATTERN, expose['url']):
-                expose = searcher.get_expose_details(expose)
+                with hold_driver(searcher):
+                    expose = searcher.get_expose_details(expose)
         return expose
 
 class LambdaProcessor(Processor):
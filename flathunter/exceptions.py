@@ -19,6 +19,16 @@ class UserDeactivatedException(ValueException):
     A small class that defines a UserDeactivated Exception.
     """
 
+class NotificationException(ValueException):
+    """
+    A notification could not be delivered
+    """
+
+class PermanentNotificationException(NotificationException):
+    """
+    A notification was rejected in a way that sending it again won't change
+    """
+
 class HeartbeatException(ValueException):
     """
     A small class that defines a Heartbeat Exception.
@@ -0,0 +1,95 @@
+"""Daily statistics aggregates over the exposes found by flathunter.
+
+Every storage back-end keeps one aggregate per day and crawler, and updates
+it whenever an expose is saved for the first time. Prices and prices per
+square metre are kept as log-scale histograms, so that medians can be
+calculated without keeping the individual values around."""
+import datetime
+import math
+from typing import Dict, List, Optional, Tuple
+
+from flathunter.filter import ExposeHelper
+
+# Width of the log-scale price buckets: medians are accurate to about 1%
+PRICE_BUCKET_RATIO = 1.02
+
+# Width of the size histogram buckets, in square metres
+SIZE_BUCKET_WIDTH = 10
+
+
+def empty_aggregate() -> Dict:
+    """A new aggregate, for a day and crawler without exposes"""
+    return {'count': 0, 'price': {}, 'pps': {}, 'size': {}}
+
+
+def _parse(extractor, expose) -> Optional[float]:
+    """Extract a positive number from the expose, or None"""
+    try:
+        value = extractor(expose)
+    except (KeyError, TypeError, ValueError):
+        return None
+    if value is None or value <= 0:
+        return None
+    return value
+
+
+def price_bucket(value: float) -> str:
+    """Histogram bucket for a price or price per square metre"""
+    return str(math.floor(math.log(value, PRICE_BUCKET_RATIO)))
+
+
+def price_bucket_value(bucket: str) -> float:
+    """Representative (geometric mid-point) value of a price bucket"""
+    return PRICE_BUCKET_RATIO ** (int(bucket) + 0.5)
+
+
+def size_bucket(value: float) -> str:
+    """Histogram bucket for a size - the lower bound of the bucket"""
+    return str(int(value // SIZE_BUCKET_WIDTH) * SIZE_BUCKET_WIDTH)
+
+
+def add_expose(aggregate: Dict, expose: Dict) -> Dict:
+    """Add a newly seen expose to the aggregate (in place)"""
+    def increment(histogram, bucket):
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+    aggregate['count'] = aggregate.get('count', 0) + 1
+    price = _parse(ExposeHelper.get_price, expose)
+    size = _parse(ExposeHelper.get_size, expose)
+    if price is not None:
+        increment(aggregate.setdefault('price', {}), price_bucket(price))
+    if size is not None:
+        increment(aggregate.setdefault('size', {}), size_bucket(size))
+    if price is not None and size is not None:
+        increment(aggregate.setdefault('pps', {}), price_bucket(price / size))
+    return aggregate
+
+
+def histogram_median(histogram: Dict[str, int]) -> Optional[float]:
+    """Approximate median of the values in a log-scale price histogram"""
+    total = sum(histogram.values())
+    if total == 0:
+        return None
+    seen = 0
+    for bucket in sorted(histogram, key=int):
+        seen += histogram[bucket]
+        if seen * 2 >= total:
+            return round(price_bucket_value(bucket), 2)
+    return None
+
+
+def summarize(rows: List[Tuple[datetime.date, str, Dict]]) -> List[Dict]:
+    """Turn stored (day, crawler, aggregate) rows into the compact per-day
+       figures that are shown on the statistics page"""
+    res = []
+    for day, crawler, aggregate in sorted(rows, key=lambda row: (row[0], row[1])):
+        res.append({
+            'day': day.isoformat(),
+            'weekday': day.weekday(),
+            'crawler': crawler,
+            'count': aggregate.get('count', 0),
+            'median_price': histogram_median(aggregate.get('price', {})),
+            'median_pps': histogram_median(aggregate.get('pps', {})),
+            'sizes': {int(bucket): count
+                      for bucket, count in aggregate.get('size', {}).items()}
+        })
+    return res
@@ -1,6 +1,7 @@
 """Module with implementations of standard expose filters"""
 from functools import reduce
 import re
+import threading
 from abc import ABC, ABCMeta
 from typing import List, Any
 
@@ -42,17 +43,25 @@ class ExposeHelper:
 
 
 class AlreadySeenFilter(AbstractFilter):
-    """Filter exposes that have already been processed"""
+    """Filter exposes that have already been processed. Unless 'mark_processed'
+       is False, exposes that pass the filter are marked as processed"""
 
-    def __init__(self, id_watch):
+    # Crawls that run at the same time can find the same expose
+    _marking = threading.Lock()
+
+    def __init__(self, id_watch, mark_processed=True):
         self.id_watch = id_watch
+        self.mark_processed = mark_processed
 
     def is_interesting(self, expose):
         """Returns true if an expose should be kept in the pipeline"""
-        if not self.id_watch.is_processed(expose['id']):
+        if not self.mark_processed:
+            return not self.id_watch.is_processed(expose['id'])
+        with self._marking:
+            if self.id_watch.is_processed(expose['id']):
+                return False
             self.id_watch.mark_processed(expose['id'])
             return True
-        return False
 
 
 class MaxPriceFilter(AbstractFilter):
@@ -198,9 +207,9 @@ class FilterBuilder:
             PPSFilter, config.max_price_per_square())
         return self
 
-    def filter_already_seen(self, id_watch):
+    def filter_already_seen(self, id_watch, mark_processed=True):
         """Filter exposes that have already been seen"""
-        self.filters.append(AlreadySeenFilter(id_watch))
+        self.filters.append(AlreadySeenFilter(id_watch, mark_processed=mark_processed))
         return self
 
     def build(self):
@@ -1,54 +1,180 @@
 """Calculate Google-Maps distances between specific locations and the target flat"""
 import datetime
+import json
+import re
 import time
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import quote_plus
 import requests
 
 from flathunter.logging import logger
 from flathunter.abstract_processor import Processor
+from flathunter.utils.list import chunk_list
 
 class GMapsDurationProcessor(Processor):
-    """Implementation of Processor class to calculate travel durations"""
+    """Implementation of Processor class to calculate travel durations. All
+       destinations of a travel mode, and the addresses of several exposes, are
+       looked up with a single Distance Matrix request"""
 
     GM_MODE_TRANSIT = 'transit'
     GM_MODE_BICYCLE = 'bicycling'
     GM_MODE_DRIVING = 'driving'
 
-    def __init__(self, config):
+    IO_BOUND = True
+
+    CACHE_NAMESPACE = 'gmaps_duration'
+
+    # Distance Matrix limits: 25 origins or destinations, and 100 elements
+    # (origins x destinations) per request
+    MAX_PLACES_PER_REQUEST = 25
+    MAX_ELEMENTS_PER_REQUEST = 100
+
+    # Largest number of exposes whose durations are calculated together
+    BATCH_SIZE = 10
+
+    def __init__(self, config, id_watch=None):
         self.config = config
+        self.id_watch = id_watch
+        self.cache_ttl = datetime.timedelta(
+            days=self.config.get('google_maps_api', {}).get('cache_ttl_days', 30))
 
     def process_expose(self, expose):
         """Calculate the durations for an expose"""
         expose['durations'] = self.get_formatted_durations(expose['address']).strip()
         return expose
 
+    def process_batch(self, exposes):
+        """Calculate the durations for a batch of exposes"""
+        durations = self.get_formatted_durations_for_addresses(
+            [expose['address'] for expose in exposes])
+        for expose, formatted in zip(exposes, durations):
+            expose['durations'] = formatted.strip()
+        return exposes
+
     def get_formatted_durations(self, address):
         """Return a formatted list of GoogleMaps durations"""
-        out = ""
+        return self.get_formatted_durations_for_addresses([address])[0]
+
+    def __configured_durations(self) -> List[Tuple[str, str, str, str]]:
+        """The (name, destination, mode, mode title) combinations to calculate"""
+        res = []
         for duration in self.config.get('durations', []):
             if 'destination' in duration and 'name' in duration:
-                dest = duration.get('destination')
-                name = duration.get('name')
                 for mode in duration.get('modes', []):
                     if 'gm_id' in mode and 'title' in mode \
                                        and 'key' in self.config.get('google_maps_api', {}):
-                        duration = self.get_gmaps_distance(address, dest, mode['gm_id'])
-                        title = mode['title']
-                        out += f"> {name} ({title}): {duration}\n"
+                        res.append((duration['name'], duration['destination'],
+                                    mode['gm_id'], mode['title']))
+        return res
+
+    def get_formatted_durations_for_addresses(self, addresses: List[str]) -> List[str]:
+        """Return a formatted list of GoogleMaps durations for each of the addresses"""
+        configured = self.__configured_durations()
+        durations = self.get_gmaps_distances(
+            addresses, [(dest, mode) for _, dest, mode, _ in configured])
+        res = []
+        for address in addresses:
+            out = ""
+            for name, dest, mode, title in configured:
+                out += f"> {name} ({title}): {durations.get((address, dest, mode))}\n"
+            res.append(out.strip())
+        return res
+
+    @staticmethod
+    def normalize_address(address):
+        """Normalize an address for use as cache key"""
+        address = re.sub(r'\s*,\s*', ', ', ' '.join(address.lower().split()))
+        return address.strip(' ,.')
 
-        return out.strip()
+    def cache_key(self, address, dest, mode, arrival_slot):
+        """Cache key of a duration: origin, destination, mode and arrival slot"""
+        return json.dumps([self.normalize_address(address), self.normalize_address(dest),
+                           mode, arrival_slot], ensure_ascii=False)
 
     def get_gmaps_distance(self, address, dest, mode):
-        """Get the distance"""
-        # get timestamp for next monday at 9:00:00 o'clock
+        """Get the distance, from the cache if it has been looked up before"""
+        return self.get_gmaps_distances([address], [(dest, mode)]).get((address, dest, mode))
+
+    @staticmethod
+    def __next_arrival() -> Tuple[str, str]:
+        """The time of arrival for the lookups - next monday at 9:00 - as a
+           timestamp, and as the weekday and time that durations are cached by"""
         now = datetime.datetime.today().replace(hour=9, minute=0, second=0)
         next_monday = now + datetime.timedelta(days=7 - now.weekday())
         arrival_time = str(int(time.mktime(next_monday.timetuple())))
+        return arrival_time, f"{next_monday.weekday()} {next_monday.strftime('%H:%M')}"
+
+    def __cache_mode(self, mode: str) -> str:
+        """Without an API key, every lookup is downgraded to driving"""
+        if self.config.get('google_maps_api', {}).get('key'):
+            return mode
+        return self.GM_MODE_DRIVING
+
+    def get_gmaps_distances(self,
+                            addresses: List[str],
+                            targets: List[Tuple[str, str]]) -> Dict[Tuple, Optional[str]]:
+        """
+        Get the distances from each address to each (destination, mode) target.
+        Durations that are not cached are looked up with one request per mode,
+        or a few if there are many addresses and destinations
+        :return: dictionary from (address, destination, mode) to the duration
+        """
+        arrival_time, arrival_slot = self.__next_arrival()
+        res, missing = self.__cached_distances(addresses, targets, arrival_slot)
+        for mode, destinations_by_address in missing.items():
+            fetched = self.__fetch_all(destinations_by_address, mode, arrival_time)
+            for (address, dest), duration in fetched.items():
+                res[(address, dest, mode)] = duration
+                if duration is not None and self.id_watch is not None:
+                    self.id_watch.set_cached(
+                        self.CACHE_NAMESPACE,
+                        self.cache_key(address, dest, self.__cache_mode(mode), arrival_slot),
+                        duration)
+        return res
+
+    def __cached_distances(self, addresses: List[str], targets: List[Tuple[str, str]],
+                           arrival_slot: str):
+        """The cached durations by (address, destination, mode), and the
+           destinations of each address that are missing, by mode"""
+        res: Dict[Tuple, Optional[str]] = {}
+        missing: Dict[str, Dict[str, List[str]]] = {}
+        for dest, mode in dict.fromkeys(targets):
+            for address in dict.fromkeys(addresses):
+                key = self.cache_key(address, dest, self.__cache_mode(mode), arrival_slot)
+                cached = None
+                if self.id_watch is not None:
+                    cached = self.id_watch.get_cached(self.CACHE_NAMESPACE, key, self.cache_ttl)
+                if cached is not None:
+                    logger.debug("Using cached duration for %s", key)
+                    res[(address, dest, mode)] = cached
+                else:
+                    missing.setdefault(mode, {}).setdefault(address, []).append(dest)
+        return res, missing
+
+    def __fetch_all(self, destinations_by_address: Dict[str, List[str]], mode, arrival_time):
+        """Look up the durations for one mode, in as few requests as the API limits allow"""
+        destinations = list(dict.fromkeys(
+            dest for dests in destinations_by_address.values() for dest in dests))
+        res = {}
+        for dest_chunk in chunk_list(destinations, self.MAX_PLACES_PER_REQUEST):
+            origins_per_request = max(1, min(self.MAX_PLACES_PER_REQUEST,
+                                             self.MAX_ELEMENTS_PER_REQUEST // len(dest_chunk)))
+            origins = [address for address, dests in destinations_by_address.items()
+                       if any(dest in dest_chunk for dest in dests)]
+            for origin_chunk in chunk_list(origins, origins_per_request):
+                res.update(self.__fetch_gmaps_distances(
+                    origin_chunk, dest_chunk, mode, arrival_time))
+        return res
+
+    def __fetch_gmaps_distances(self, addresses, destinations, mode, arrival_time):
+        """Get the distances between each of the addresses and destinations from
+           the Distance Matrix API"""
 
         # decode from unicode and url encode addresses
-        address = quote_plus(address.strip().encode('utf8'))
-        dest = quote_plus(dest.strip().encode('utf8'))
-        logger.debug("Got address: %s", address)
+        origin_param = '|'.join(quote_plus(address.strip().encode('utf8'))
+                                for address in addresses)
+        dest_param = '|'.join(quote_plus(dest.strip().encode('utf8')) for dest in destinations)
+        logger.debug("Got addresses: %s", origin_param)
 
         # get google maps config stuff
         base_url = self.config.get('google_maps_api', {}).get('url')
@@ -62,17 +188,24 @@ class GMapsDurationProcessor(Processor):
             base_url = base_url.replace('&key={key}', '')
 
         # retrieve the result
-        url = base_url.format(dest=dest, mode=mode, origin=address,
+        url = base_url.format(dest=dest_param, mode=mode, origin=origin_param,
                               key=gm_key, arrival=arrival_time)
         result = requests.get(url, timeout=30).json()
         if result['status'] != 'OK':
-            logger.error("Failed retrieving distance to address %s: %s", address, result)
-            return None
+            logger.error("Failed retrieving distance to addresses %s: %s", origin_param, result)
+            return {(address, dest): None for address in addresses for dest in destinations}
+
+        return self.__parse_distances(addresses, destinations, result)
 
-        # get the fastest route
+    @staticmethod
+    def __parse_distances(addresses, destinations, result):
+        """The formatted durations by (address, destination) in a Distance Matrix
+           result; the rows are the origins, the elements the destinations, in
+           request order"""
         distances = {}
-        for row in result['rows']:
-            for element in row['elements']:
+        for address, row in zip(addresses, result['rows']):
+            for dest, element in zip(destinations, row['elements']):
+                distances[(address, dest)] = None
                 if 'status' in element and element['status'] != 'OK':
                     logger.warning("For address %s we got the status message: %s",
                                          address, element['status'])
@@ -84,5 +217,5 @@ class GMapsDurationProcessor(Processor):
                                    element['duration']['value'])
                 duration_text = element['duration']['text']
                 distance_text = element['distance']['text']
-                distances[element['duration']['value']] = f"{duration_text} ({distance_text})"
-        return distances[min(distances.keys())] if distances else None
+                distances[(address, dest)] = f"{duration_text} ({distance_text})"
+        return distances
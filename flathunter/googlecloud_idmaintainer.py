@@ -1,75 +1,330 @@
 """Storage back-end implementation using Google Cloud Firestore"""
 import datetime
+import hashlib
+from typing import Any, Dict, List, Set, Tuple
+
 import pytz
 import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import firestore
+from google.cloud.firestore import Increment
 from google.cloud.firestore_v1.base_query import BaseQuery
 
+from flathunter import expose_statistics
 from flathunter.logging import logger
-from flathunter.exceptions import PersistenceException
+from flathunter.metrics import timed_db
+from flathunter.exceptions import ConfigException, PersistenceException
+from flathunter.utils.list import chunk_list
 
 
 class GoogleCloudIdMaintainer:
     """Storage back-end - implementation of IdMaintainer API"""
 
+    # Firestore rejects write batches with more than 500 operations
+    MAX_BATCH_SIZE = 500
+
+    # Page size and upper bound on the number of exposes read by get_recent_exposes
+    RECENT_EXPOSES_PAGE_SIZE = 100
+    RECENT_EXPOSES_SCAN_BUDGET = 2000
+
+    # Number of exposes remembered as counted in the statistics, when writes are not batched
+    COUNTED_EXPOSES_LIMIT = 10000
+
+    known_processed: Set[str]
+    known_unprocessed: Set[str]
+    pending_writes: List[Tuple[Any, Dict]]
+    pending_statistics: Dict[str, Dict]
+    counted_exposes: Set[str]
+
     def __init__(self, config):
         project_id = config.google_cloud_project_id()
         if project_id is None:
             raise PersistenceException(
                 "Need to project a google_cloud_project_id in config.yaml")
+        if config.notification_outbox():
+            raise ConfigException(
+                "The notification outbox needs the SQLite back-end - "
+                "disable notification_outbox to use Google Cloud")
         firebase_admin.initialize_app(credentials.ApplicationDefault(), {
             'projectId': project_id
         })
         self.database = firestore.client()
+        self.configure_batching(config.google_cloud_batch_writes())
+
+    def configure_batching(self, batch_writes: bool):
+        """Reset the local caches. In batched mode, writes of processed IDs and
+           exposes are queued and only sent to Firestore when 'flush' is called"""
+        self.batch_writes = batch_writes
+        self.known_processed = set()
+        self.known_unprocessed = set()
+        self.pending_writes = []
+        self.pending_statistics = {}
+        self.counted_exposes = set()
+
+    def __write(self, reference, data):
+        """Write a document now, or queue it for the next flush in batched mode"""
+        if self.batch_writes:
+            self.pending_writes.append((reference, data))
+        else:
+            reference.set(data)
 
+    @timed_db('firestore')
+    def flush(self):
+        """Commit all queued writes in as few write batches as possible"""
+        operations = [('set', reference, data) for reference, data in self.pending_writes]
+        for doc_id, increments in self.pending_statistics.items():
+            operations.extend(self.__statistics_operations(doc_id, increments))
+        for chunk in chunk_list(operations, self.MAX_BATCH_SIZE):
+            batch = self.database.batch()
+            for operation, reference, data in chunk:
+                if operation == 'merge':
+                    batch.set(reference, data, merge=True)
+                else:
+                    getattr(batch, operation)(reference, data)
+            batch.commit()
+        if len(operations) > 0:
+            logger.debug('Flushed %d writes to Firestore', len(operations))
+        self.pending_writes = []
+        self.pending_statistics = {}
+        # The prefetched state is only kept for one crawl: other instances may
+        # process these exposes before our next crawl
+        self.known_processed = set()
+        self.known_unprocessed = set()
+        # Flushed exposes are found by the lookup in save_exposes
+        self.counted_exposes = set()
+
+    @timed_db('firestore')
+    def prefetch_processed(self, expose_ids):
+        """Load the processed state of all supplied exposes with a single request,
+           so that subsequent calls to 'is_processed' are answered locally"""
+        unknown = {str(expose_id) for expose_id in expose_ids} \
+            - self.known_processed - self.known_unprocessed
+        if len(unknown) == 0:
+            return
+        collection = self.database.collection('processed')
+        references = [collection.document(expose_id) for expose_id in unknown]
+        for snapshot in self.database.get_all(references):
+            if snapshot.exists:
+                self.known_processed.add(snapshot.id)
+            else:
+                self.known_unprocessed.add(snapshot.id)
+
+    @timed_db('firestore')
     def mark_processed(self, expose_id):
         """Mark exposes as processed when we have processed them"""
         logger.debug('mark_processed(%d)', expose_id)
-        self.database.collection('processed').document(
-            str(expose_id)).set({'id': expose_id})
+        self.known_processed.add(str(expose_id))
+        self.known_unprocessed.discard(str(expose_id))
+        self.__write(self.database.collection('processed').document(
+            str(expose_id)), {'id': expose_id})
 
+    @timed_db('firestore')
     def is_processed(self, expose_id):
         """Returns true if an expose has already been marked as processed"""
         logger.debug('is_processed(%d)', expose_id)
+        if str(expose_id) in self.known_processed:
+            return True
+        if str(expose_id) in self.known_unprocessed:
+            return False
         doc = self.database.collection('processed').document(str(expose_id))
         return doc.get().exists
 
     def save_expose(self, expose):
-        """Writes an expose to the storage backend"""
-        record = expose.copy()
-        record.update({'created_at': pytz.utc.localize(datetime.datetime.now()),
-                       'created_sort': (0 - datetime.datetime.now().timestamp())})
-        self.database.collection('exposes').document(
-            str(expose['id'])).set(record)
-
-    def get_exposes_since(self, min_datetime):
-        """Returns all exposes since the supplied datetime"""
-        localized_datetime = min_datetime.replace(tzinfo=pytz.UTC)
+        """Writes an expose to the storage backend. Exposes saved for the first
+           time are added to the daily statistics"""
+        self.save_exposes([expose])
+
+    @timed_db('firestore')
+    def save_exposes(self, exposes):
+        """Writes several exposes. Which of them are new is looked up with a
+           single request"""
+        collection = self.database.collection('exposes')
+        references = {str(expose['id']): collection.document(str(expose['id']))
+                      for expose in exposes}
+        uncounted = [reference for expose_id, reference in references.items()
+                     if expose_id not in self.counted_exposes]
+        existing = set()
+        if not self.batch_writes and len(self.counted_exposes) > self.COUNTED_EXPOSES_LIMIT:
+            # Without batching, saved exposes are found by the lookup below
+            self.counted_exposes = set()
+        if len(uncounted) > 0:
+            existing = {snapshot.id for snapshot in self.database.get_all(uncounted)
+                        if snapshot.exists}
+        for expose in exposes:
+            expose_id = str(expose['id'])
+            if expose_id not in self.counted_exposes:
+                self.counted_exposes.add(expose_id)
+                if expose_id not in existing:
+                    self.__add_to_statistics(expose)
+            record = expose.copy()
+            record.update({'created_at': pytz.utc.localize(datetime.datetime.now()),
+                           'created_sort': (0 - datetime.datetime.now().timestamp())})
+            self.__write(references[expose_id], record)
+
+    def __add_to_statistics(self, expose):
+        """Adds an expose to the statistics aggregate of the current day and its
+           crawler. The aggregate is updated with increments, so that several
+           instances can count exposes at the same time. In batched mode, the
+           increments are summed up locally until 'flush'"""
+        doc_id = f"{datetime.date.today().isoformat()}_{expose['crawler']}"
+        increments = self.pending_statistics.get(doc_id) if self.batch_writes else None
+        if increments is None:
+            increments = expose_statistics.empty_aggregate()
+            increments['crawler'] = expose['crawler']
+        expose_statistics.add_expose(increments, expose)
+        if self.batch_writes:
+            self.pending_statistics[doc_id] = increments
+            return
+        for operation, reference, data in self.__statistics_operations(doc_id, increments):
+            if operation == 'merge':
+                reference.set(data, merge=True)
+            else:
+                reference.update(data)
+
+    def __statistics_operations(self, doc_id, increments):
+        """The writes that add the increments to a statistics aggregate: the
+           aggregate is created if it does not exist, then its counts are
+           incremented on the server"""
+        reference = self.database.collection('statistics').document(doc_id)
+        fields = {'count': Increment(increments['count'])}
+        for histogram in ['price', 'pps', 'size']:
+            for bucket, count in increments.get(histogram, {}).items():
+                fields[f"{histogram}.{bucket}"] = Increment(count)
+        return [('merge', reference, {'day': doc_id.split('_', 1)[0],
+                                      'crawler': increments['crawler']}),
+                ('update', reference, fields)]
+
+    @timed_db('firestore')
+    def get_statistics_since(self, min_date):
+        """Loads the daily statistics aggregates since the specified date, as a list
+           of (day, crawler, aggregate) tuples"""
+        res = []
+        query = self.database.collection('statistics').where('day', '>=', min_date.isoformat())
+        for doc in query.stream():
+            aggregate = doc.to_dict()
+            if aggregate is None:
+                continue
+            res.append((datetime.date.fromisoformat(aggregate['day']),
+                        aggregate['crawler'], aggregate))
+        return res
+
+    @timed_db('firestore')
+    def get_exposes_since(self, min_datetime, crawlers=None):
+        """Returns all exposes since the supplied datetime. If a list of crawler
+           names is supplied, only exposes from those crawlers are returned.
+           Filtering by crawler relies on the composite (crawler, created_sort)
+           index declared in firestore.indexes.json"""
+        query = self.database.collection('exposes')
+        if crawlers is not None:
+            if len(crawlers) == 0:
+                return []
+            query = query.where('crawler', 'in', list(crawlers))
+        query = query.where('created_sort', '<=', 0 - min_datetime.timestamp())
         res = []
-        for doc in self.database.collection('exposes') \
-                .order_by('created_sort').limit(10000).stream():
+        for doc in query.order_by('created_sort').limit(10000).stream():
             doc_as_dict = doc.to_dict()
             if doc_as_dict is None:
                 continue
-            if doc_as_dict['created_at'] < localized_datetime:
-                break
             res.append(doc_as_dict)
         return res
 
+    @timed_db('firestore')
     def get_recent_exposes(self, count, filter_set=None):
         """Returns recent exposes (no more than 'count'), conforming to
-           the provided filter if supplied"""
+           the provided filter if supplied. Pages through the exposes with
+           a query cursor until enough matches are found, or until the scan
+           budget is exhausted"""
+        page_size = count if filter_set is None else max(count, self.RECENT_EXPOSES_PAGE_SIZE)
         res = []
-        for doc in self.database.collection('exposes') \
-                .order_by('created_sort').limit(100).stream():
-            expose = doc.to_dict()
-            if filter_set is None or filter_set.is_interesting_expose(expose):
-                res.append(expose)
-                if len(res) == count:
-                    break
+        scanned = 0
+        last_doc = None
+        while len(res) < count and scanned < self.RECENT_EXPOSES_SCAN_BUDGET:
+            query = self.database.collection('exposes').order_by('created_sort')
+            if last_doc is not None:
+                query = query.start_after(last_doc)
+            page = list(query.limit(page_size).stream())
+            scanned += len(page)
+            for doc in page:
+                expose = doc.to_dict()
+                if expose is None:
+                    continue
+                if filter_set is None or filter_set.is_interesting_expose(expose):
+                    res.append(expose)
+                    if len(res) == count:
+                        break
+            if len(page) < page_size:
+                break
+            last_doc = page[-1]
+        return res
+
+    def __enrichment_document(self, expose_id, crawler):
+        """Enrichment states are stored by crawler and ID, as IDs of different
+           crawlers can collide"""
+        return self.database.collection('enrichment').document(f"{crawler}_{expose_id}")
+
+    @staticmethod
+    def __enrichment_state(snapshot):
+        state = snapshot.to_dict() if snapshot.exists else None
+        if state is None:
+            return None
+        for field in ['last_detail_fetch', 'last_attempt']:
+            # Firestore hands back timezone-aware timestamps for the naive ones we store
+            if state.get(field) is not None:
+                state[field] = state[field].replace(tzinfo=None)
+        return state
+
+    def get_enrichment_state(self, expose_id, crawler):
+        """Loads the detail enrichment metadata for an expose, or None if the
+           expose has never been enriched"""
+        return self.__enrichment_state(self.__enrichment_document(expose_id, crawler).get())
+
+    @timed_db('firestore')
+    def get_enrichment_states(self, keys):
+        """Loads the detail enrichment metadata for several (expose_id, crawler)
+           pairs with a single request. Returns a dictionary from each pair to
+           its state, or None if the expose has never been enriched"""
+        keys = list(dict.fromkeys(keys))
+        references = {self.__enrichment_document(expose_id, crawler).id: (expose_id, crawler)
+                      for expose_id, crawler in keys}
+        res = dict.fromkeys(keys)
+        if len(keys) == 0:
+            return res
+        for snapshot in self.database.get_all(
+                [self.__enrichment_document(expose_id, crawler) for expose_id, crawler in keys]):
+            res[references[snapshot.id]] = self.__enrichment_state(snapshot)
         return res
 
+    def save_enrichment_state(self, expose_id, crawler, state):
+        """Saves the detail enrichment metadata for an expose"""
+        record = state.copy()
+        record['crawler'] = crawler
+        self.__enrichment_document(expose_id, crawler).set(record)
+
+    def __cache_document(self, namespace, key):
+        """Cache entries are stored under a hash of namespace and key, which can
+           contain characters that are not allowed in document IDs"""
+        doc_id = hashlib.sha256(f"{namespace}:{key}".encode('utf-8')).hexdigest()
+        return self.database.collection('cache').document(doc_id)
+
+    @timed_db('firestore')
+    def get_cached(self, namespace, key, max_age):
+        """Loads a value from the cache, or None if there is no value younger
+           than 'max_age' (a timedelta)"""
+        entry = self.__cache_document(namespace, key).get().to_dict()
+        if not entry or entry.get('key') != key:
+            return None
+        created = entry['created'].replace(tzinfo=None)
+        if created < datetime.datetime.now() - max_age:
+            return None
+        return entry['value']
+
+    @timed_db('firestore')
+    def set_cached(self, namespace, key, value):
+        """Saves a value to the cache"""
+        self.__cache_document(namespace, key).set({
+            'namespace': namespace, 'key': key, 'value': value,
+            'created': datetime.datetime.now()})
+
     def get_settings_for_user(self, user_id):
         """Loads the user settings from the database"""
         doc = self.database.collection('users').document(str(user_id)).get()
@@ -79,6 +334,7 @@ class GoogleCloudIdMaintainer:
         """Saves the user settings to the database"""
         self.database.collection('users').document(str(user_id)).set(settings)
 
+    @timed_db('firestore')
     def get_user_settings(self):
         """Loads all users' settings from the database"""
         res = []
@@ -2,12 +2,13 @@
 from flathunter.abstract_notifier import Notifier
 from flathunter.config import YamlConfig
 from flathunter.logging import logger
+from flathunter.scheduler import Scheduler
 from flathunter.notifiers import SenderApprise, SenderMattermost, SenderTelegram, SenderSlack
 from flathunter.exceptions import HeartbeatException
 
 
-def interval2counter(interval: str) -> int:
-    """Transform the string interval to sleeper counter frequencies"""
+def interval2seconds(interval: str) -> int:
+    """Transform the string interval to the number of seconds between heartbeats"""
     if interval is None:
         return 0
     if interval.lower() == 'hour':
@@ -23,6 +24,7 @@ def interval2counter(interval: str) -> int:
 class Heartbeat:
     """Will inform the user on regular intervals whether the bot is still alive"""
     notifier: Notifier
+    # Seconds between two heartbeat messages, 0 if heartbeats are disabled
     interval: int
 
     def __init__(self, config: YamlConfig, interval: str):
@@ -39,18 +41,20 @@ class Heartbeat:
         else:
             raise HeartbeatException("No notifier configured - check 'notifiers' config section!")
 
-        self.interval = int(interval2counter(interval)/int(config.loop_period_seconds()))
+        self.interval = interval2seconds(interval)
 
-    def send_heartbeat(self, counter) -> int:
+    def send_heartbeat(self) -> None:
         """Send a new heartbeat message"""
         if not self.notifier or not self.interval:  # interval is disabled
-            return counter
-        # it's time for a new heartbeat message and reset counter
-        if counter % self.interval == 0:
-            logger.info('Sending heartbeat message.')
-            self.notifier.notify(
-                'Beep Boop. This is a heartbeat message. '
-                'Your bot is actively searching for flats.'
-            )
-            counter = 0
-        return counter
+            return
+        logger.info('Sending heartbeat message.')
+        self.notifier.notify(
+            'Beep Boop. This is a heartbeat message. '
+            'Your bot is actively searching for flats.'
+        )
+
+    def schedule(self, scheduler: Scheduler) -> None:
+        """Send a heartbeat message every interval, if heartbeats are enabled"""
+        if self.interval:
+            scheduler.every(self.interval, self.send_heartbeat, 'heartbeat',
+                            delay=self.interval)
@@ -1,13 +1,19 @@
 """Default Flathunter implementation for the command line"""
+import re
 import traceback
 from itertools import chain
+from typing import Iterable, List, Optional, Tuple
 import requests
 
+from flathunter import metrics
+from flathunter.abstract_crawler import Crawler
 from flathunter.logging import logger
 from flathunter.config import YamlConfig
 from flathunter.filter import Filter
 from flathunter.processor import ProcessorChain
+from flathunter.profiling import CycleProfile
 from flathunter.captcha.captcha_solver import CaptchaUnsolvableError
+from flathunter.webdriver_crawler import hold_driver
 from flathunter.exceptions import ConfigException
 
 class Hunter:
@@ -20,11 +26,25 @@ class Hunter:
                 "Invalid config for hunter - should be a 'Config' object")
         self.id_watch = id_watch
 
-    def crawl_for_exposes(self, max_pages=None):
-        """Trigger a new crawl of the configured URLs"""
+    def searches(self) -> List[Tuple[Crawler, str]]:
+        """The configured searches: each URL with the crawler that handles it"""
+        return [(searcher, url)
+                for url in self.config.target_urls()
+                for searcher in self.config.searchers()
+                if re.search(searcher.URL_PATTERN, url)]
+
+    def crawl_for_exposes(self, max_pages=None, profile: Optional[CycleProfile] = None,
+                          searches: Optional[Iterable[Tuple[Crawler, str]]] = None):
+        """Trigger a new crawl of the configured URLs, or of the given searches.
+           If a profile is supplied, the crawls are timed"""
+        profile = profile or CycleProfile()
         def try_crawl(searcher, url, max_pages):
             try:
-                return searcher.crawl(url, max_pages)
+                with hold_driver(searcher), \
+                        profile.measure(f"crawl:{searcher.get_name()}") as stats:
+                    results = list(searcher.crawl(url, max_pages))
+                    stats.exposes_out = len(results)
+                return results
             except CaptchaUnsolvableError:
                 logger.info("Error while scraping url %s: the captcha was unsolvable", url)
                 return []
@@ -32,29 +52,45 @@ class Hunter:
                 logger.info("Error while scraping url %s:\n%s", url, traceback.format_exc())
                 return []
 
-        return chain(*[try_crawl(searcher, url, max_pages)
-                       for searcher in self.config.searchers()
-                       for url in self.config.target_urls()])
+        if searches is None:
+            searches = [(searcher, url)
+                        for searcher in self.config.searchers()
+                        for url in self.config.target_urls()]
+        return chain(*[try_crawl(searcher, url, max_pages) for searcher, url in searches])
 
-    def hunt_flats(self, max_pages: None|int = None):
-        """Crawl, process and filter exposes"""
+    def hunt_flats(self, max_pages: None|int = None,
+                   searches: Optional[Iterable[Tuple[Crawler, str]]] = None):
+        """Crawl, process and filter exposes, of all configured URLs or only
+           of the given searches"""
+        # With the outbox, exposes are marked as processed when they are queued
+        use_outbox = self.config.notification_outbox()
         filter_set = Filter.builder() \
                            .read_config(self.config) \
-                           .filter_already_seen(self.id_watch) \
+                           .filter_already_seen(self.id_watch, mark_processed=not use_outbox) \
                            .build()
 
-        processor_chain = ProcessorChain.builder(self.config) \
-                                        .save_all_exposes(self.id_watch) \
-                                        .apply_filter(filter_set) \
-                                        .resolve_addresses() \
-                                        .calculate_durations() \
-                                        .send_messages() \
-                                        .build()
+        chain_builder = ProcessorChain.builder(self.config) \
+                                      .save_all_exposes(self.id_watch) \
+                                      .prefetch_processed(self.id_watch) \
+                                      .apply_filter(filter_set) \
+                                      .resolve_addresses(self.id_watch) \
+                                      .calculate_durations(self.id_watch)
+        if use_outbox:
+            chain_builder.enqueue_notifications(self.id_watch)
+        else:
+            chain_builder.send_messages()
+        processor_chain = chain_builder.build()
+
+        profile = CycleProfile()
+        exposes = self.crawl_for_exposes(max_pages, profile, searches)
 
         result = []
         # We need to iterate over this list to force the evaluation of the pipeline
-        for expose in processor_chain.process(self.crawl_for_exposes(max_pages)):
+        for expose in processor_chain.process(exposes, profile):
             logger.info('New offer: %s', expose['title'])
+            metrics.NEW_EXPOSES.inc(crawler=expose.get('crawler', 'unknown'))
             result.append(expose)
 
+        self.id_watch.flush()
+        profile.log()
         return result
@@ -3,9 +3,13 @@ import threading
 import sqlite3 as lite
 import datetime
 import json
+from typing import Dict, List, Tuple
 
+from flathunter import expose_statistics
 from flathunter.logging import logger
+from flathunter.metrics import timed_db
 from flathunter.abstract_processor import Processor
+from flathunter.utils.list import chunk_list
 
 __author__ = "Nody"
 __version__ = "0.1"
@@ -16,6 +20,8 @@ __status__ = "Prodction"
 class SaveAllExposesProcessor(Processor):
     """Processor that saves all exposes to the database"""
 
+    IO_BOUND = True
+
     def __init__(self, config, id_watch):
         self.config = config
         self.id_watch = id_watch
@@ -25,9 +31,46 @@ class SaveAllExposesProcessor(Processor):
         self.id_watch.save_expose(expose)
         return expose
 
+    def process_batch(self, exposes):
+        """Save a batch of exposes at once"""
+        self.id_watch.save_exposes(exposes)
+        return exposes
+
+class PrefetchProcessedProcessor(Processor):
+    """Processor that loads the processed state of each batch of exposes at
+       once, so that the already-seen filter answers from memory"""
+
+    IO_BOUND = True
+
+    def __init__(self, config, id_watch):
+        self.config = config
+        self.id_watch = id_watch
+
+    def process_batch(self, exposes):
+        """Prefetch the processed state of a batch of exposes"""
+        self.id_watch.prefetch_processed([expose['id'] for expose in exposes])
+        return exposes
+
+class EnqueueNotificationsProcessor(Processor):
+    """Processor that queues exposes in the notification outbox. Exposes that
+       have been queued (or processed) before are dropped from the sequence"""
+
+    IO_BOUND = True
+
+    def __init__(self, config, id_watch):
+        self.config = config
+        self.id_watch = id_watch
+
+    def process_exposes(self, exposes):
+        """Queue the exposes, passing on only those that were new"""
+        return filter(self.id_watch.enqueue_notification, exposes)
+
 class IdMaintainer:
     """SQLite back-end for the database"""
 
+    # Older SQLite versions allow no more than 999 parameters per statement
+    MAX_QUERY_PARAMETERS = 900
+
     def __init__(self, db_name):
         self.db_name = db_name
         self.threadlocal = threading.local()
@@ -41,17 +84,52 @@ class IdMaintainer:
                 connection = self.threadlocal.connection
                 cur = self.threadlocal.connection.cursor()
                 cur.execute('CREATE TABLE IF NOT EXISTS processed (ID INTEGER)')
+                self.__index_processed(cur)
                 cur.execute('CREATE TABLE IF NOT EXISTS executions (timestamp timestamp)')
                 cur.execute('CREATE TABLE IF NOT EXISTS exposes (id INTEGER, created TIMESTAMP, \
                                     crawler STRING, details BLOB, PRIMARY KEY (id, crawler))')
+                cur.execute('CREATE INDEX IF NOT EXISTS exposes_crawler_created \
+                                    ON exposes (crawler, created)')
                 cur.execute('CREATE TABLE IF NOT EXISTS users \
                                     (id INTEGER PRIMARY KEY, settings BLOB)')
+                cur.execute('CREATE TABLE IF NOT EXISTS enrichment (id INTEGER, crawler STRING, \
+                                    last_detail_fetch TIMESTAMP, last_attempt TIMESTAMP, \
+                                    content_hash STRING, failure_count INTEGER, \
+                                    PRIMARY KEY (id, crawler))')
+                cur.execute('CREATE TABLE IF NOT EXISTS outbox \
+                                    (id INTEGER PRIMARY KEY AUTOINCREMENT, expose_id INTEGER, \
+                                    created TIMESTAMP, details BLOB, attempts INTEGER, \
+                                    next_attempt TIMESTAMP, delivered BLOB)')
+                self.__add_outbox_deliveries(cur)
+                cur.execute('CREATE TABLE IF NOT EXISTS cache (namespace STRING, key STRING, \
+                                    value BLOB, created TIMESTAMP, PRIMARY KEY (namespace, key))')
+                cur.execute('CREATE TABLE IF NOT EXISTS statistics (day STRING, \
+                                    crawler STRING, aggregate BLOB, PRIMARY KEY (day, crawler))')
                 self.threadlocal.connection.commit()
             except lite.Error as error:
                 logger.error("Error %s:", error.args[0])
                 raise error
         return connection
 
+    @staticmethod
+    def __index_processed(cur):
+        """Add the unique index on the processed ids, removing the duplicate ids
+           that databases created without it can hold"""
+        cur.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name = 'processed_id'")
+        if cur.fetchone() is not None:
+            return
+        cur.execute('DELETE FROM processed WHERE rowid NOT IN \
+                            (SELECT MIN(rowid) FROM processed GROUP BY id)')
+        cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS processed_id ON processed (id)')
+
+    @staticmethod
+    def __add_outbox_deliveries(cur):
+        """Add the column of delivered notifiers to outboxes created without it"""
+        cur.execute('PRAGMA table_info(outbox)')
+        if 'delivered' not in [row[1] for row in cur.fetchall()]:
+            cur.execute('ALTER TABLE outbox ADD COLUMN delivered BLOB')
+
+    @timed_db('sqlite')
     def is_processed(self, expose_id):
         """Returns true if an expose has already been processed"""
         logger.debug('is_processed(%d)', expose_id)
@@ -60,33 +138,122 @@ class IdMaintainer:
         row = cur.fetchone()
         return row is not None
 
+    @timed_db('sqlite')
     def mark_processed(self, expose_id):
         """Mark an expose as processed in the database"""
         logger.debug('mark_processed(%d)', expose_id)
         cur = self.get_connection().cursor()
-        cur.execute('INSERT INTO processed VALUES(?)', (expose_id,))
+        cur.execute('INSERT OR IGNORE INTO processed VALUES(?)', (expose_id,))
+        self.get_connection().commit()
+
+    @timed_db('sqlite')
+    def enqueue_notification(self, expose) -> bool:
+        """Mark an expose as processed and add it to the notification outbox, in
+           one transaction. Returns False if the expose was already processed"""
+        connection = self.get_connection()
+        with connection:
+            cur = connection.cursor()
+            # The unique index lets only one of several concurrent crawls insert the id
+            cur.execute('INSERT OR IGNORE INTO processed VALUES(?)', (int(expose['id']),))
+            if cur.rowcount == 0:
+                return False
+            now = datetime.datetime.now()
+            cur.execute('INSERT INTO outbox(expose_id, created, details, attempts, next_attempt) \
+                         VALUES (?, ?, ?, 0, ?)', (int(expose['id']), now, json.dumps(expose), now))
+        return True
+
+    @timed_db('sqlite')
+    def get_outbox(self, now, limit=100) -> List[Tuple[int, Dict, int, List[str]]]:
+        """Loads the outbox entries that are due to be sent, oldest first, as a
+           list of (entry id, expose, failed attempts, delivered) tuples, where
+           'delivered' lists the notifiers that have already sent the entry"""
+        cur = self.get_connection().cursor()
+        cur.execute('SELECT id, details, attempts, delivered FROM outbox \
+                     WHERE next_attempt <= ? ORDER BY id LIMIT ?', (now, limit))
+        return [(row[0], json.loads(row[1]), row[2], json.loads(row[3] or '[]'))
+                for row in cur.fetchall()]
+
+    def complete_notification(self, entry_id):
+        """Remove a sent notification from the outbox"""
+        cur = self.get_connection().cursor()
+        cur.execute('DELETE FROM outbox WHERE id = ?', (entry_id,))
         self.get_connection().commit()
 
+    def fail_notification(self, entry_id, next_attempt, delivered=()):
+        """Record a failed attempt to send a notification, when to retry it, and
+           the notifiers that have sent it, which are skipped on the retry"""
+        cur = self.get_connection().cursor()
+        cur.execute('UPDATE outbox SET attempts = attempts + 1, next_attempt = ?, \
+                     delivered = ? WHERE id = ?',
+                    (next_attempt, json.dumps(sorted(delivered)), entry_id))
+        self.get_connection().commit()
+
+    def prefetch_processed(self, expose_ids):
+        """Nothing to prefetch - SQLite lookups are local and cheap"""
+
+    def flush(self):
+        """Nothing to flush - every write is committed immediately"""
+
     def save_expose(self, expose):
-        """Saves an expose to a database"""
+        """Saves an expose to a database. Exposes saved for the first time are
+           added to the daily statistics in the same transaction"""
+        self.save_exposes([expose])
+
+    @timed_db('sqlite')
+    def save_exposes(self, exposes):
+        """Saves several exposes to the database in a single transaction"""
         cur = self.get_connection().cursor()
-        cur.execute('INSERT OR REPLACE INTO exposes(id, created, crawler, details) \
-                     VALUES (?, ?, ?, ?)',
-                    (int(expose['id']), datetime.datetime.now(),
-                     expose['crawler'], json.dumps(expose)))
+        now = datetime.datetime.now()
+        for expose in exposes:
+            cur.execute('SELECT 1 FROM exposes WHERE id = ? AND crawler = ?',
+                        (int(expose['id']), expose['crawler']))
+            is_new = cur.fetchone() is None
+            cur.execute('INSERT OR REPLACE INTO exposes(id, created, crawler, details) \
+                         VALUES (?, ?, ?, ?)',
+                        (int(expose['id']), now, expose['crawler'], json.dumps(expose)))
+            if is_new:
+                self.__add_to_statistics(cur, now.date(), expose)
         self.get_connection().commit()
 
-    def get_exposes_since(self, min_datetime):
-        """Loads all exposes since the specified date"""
+    @staticmethod
+    def __add_to_statistics(cur, day, expose):
+        """Adds an expose to the statistics aggregate of its day and crawler"""
+        cur.execute('SELECT aggregate FROM statistics WHERE day = ? AND crawler = ?',
+                    (day.isoformat(), expose['crawler']))
+        row = cur.fetchone()
+        aggregate = expose_statistics.empty_aggregate() if row is None else json.loads(row[0])
+        expose_statistics.add_expose(aggregate, expose)
+        cur.execute('INSERT OR REPLACE INTO statistics(day, crawler, aggregate) VALUES (?, ?, ?)',
+                    (day.isoformat(), expose['crawler'], json.dumps(aggregate)))
+
+    @timed_db('sqlite')
+    def get_statistics_since(self, min_date):
+        """Loads the daily statistics aggregates since the specified date, as a list
+           of (day, crawler, aggregate) tuples"""
+        cur = self.get_connection().cursor()
+        cur.execute('SELECT day, crawler, aggregate FROM statistics WHERE day >= ? ORDER BY day',
+                    (min_date.isoformat(),))
+        return [(datetime.date.fromisoformat(row[0]), row[1], json.loads(row[2]))
+                for row in cur.fetchall()]
+
+    @timed_db('sqlite')
+    def get_exposes_since(self, min_datetime, crawlers=None):
+        """Loads all exposes since the specified date. If a list of crawler names
+           is supplied, only exposes from those crawlers are loaded"""
         def row_to_expose(row):
             obj = json.loads(row[2])
             obj['created_at'] = row[0]
             return obj
+        query = 'SELECT created, crawler, details FROM exposes WHERE created >= ?'
+        params = [min_datetime]
+        if crawlers is not None:
+            query += f' AND crawler IN ({", ".join("?" * len(crawlers))})'
+            params.extend(crawlers)
         cur = self.get_connection().cursor()
-        cur.execute('SELECT created, crawler, details FROM exposes \
-                     WHERE created >= ? ORDER BY created DESC', (min_datetime,))
+        cur.execute(query + ' ORDER BY created DESC', params)
         return list(map(row_to_expose, cur.fetchall()))
 
+    @timed_db('sqlite')
     def get_recent_exposes(self, count, filter_set=None):
         """Returns up to 'count' recent exposes, filtered by the provided filter"""
         cur = self.get_connection().cursor()
@@ -103,6 +270,75 @@ class IdMaintainer:
                 res.append(expose)
         return res
 
+    @staticmethod
+    def __enrichment_state(row):
+        """The enrichment state in a row of the enrichment table"""
+        def parse_time(value):
+            return None if value is None else datetime.datetime.fromisoformat(value)
+        return {'last_detail_fetch': parse_time(row[0]),
+                'last_attempt': parse_time(row[1]),
+                'content_hash': row[2],
+                'failure_count': row[3]}
+
+    def get_enrichment_state(self, expose_id, crawler):
+        """Loads the detail enrichment metadata for an expose, or None if the
+           expose has never been enriched"""
+        cur = self.get_connection().cursor()
+        cur.execute('SELECT last_detail_fetch, last_attempt, content_hash, failure_count \
+                     FROM enrichment WHERE id = ? AND crawler = ?', (int(expose_id), crawler))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return self.__enrichment_state(row)
+
+    @timed_db('sqlite')
+    def get_enrichment_states(self, keys):
+        """Loads the detail enrichment metadata for several (expose_id, crawler)
+           pairs at once. Returns a dictionary from each pair to its state, or
+           None if the expose has never been enriched"""
+        found = {}
+        cur = self.get_connection().cursor()
+        ids = list(dict.fromkeys(int(expose_id) for expose_id, _ in keys))
+        for chunk in chunk_list(ids, self.MAX_QUERY_PARAMETERS):
+            cur.execute('SELECT last_detail_fetch, last_attempt, content_hash, failure_count, \
+                         id, crawler FROM enrichment WHERE id IN ' \
+                        f'({", ".join("?" * len(chunk))})', chunk)
+            for row in cur.fetchall():
+                found[(row[4], row[5])] = self.__enrichment_state(row)
+        return {(expose_id, crawler): found.get((int(expose_id), crawler))
+                for expose_id, crawler in keys}
+
+    def save_enrichment_state(self, expose_id, crawler, state):
+        """Saves the detail enrichment metadata for an expose"""
+        cur = self.get_connection().cursor()
+        cur.execute('INSERT OR REPLACE INTO enrichment(id, crawler, last_detail_fetch, \
+                     last_attempt, content_hash, failure_count) VALUES (?, ?, ?, ?, ?, ?)',
+                    (int(expose_id), crawler, state.get('last_detail_fetch'),
+                     state.get('last_attempt'), state.get('content_hash'),
+                     state.get('failure_count', 0)))
+        self.get_connection().commit()
+
+    @timed_db('sqlite')
+    def get_cached(self, namespace, key, max_age):
+        """Loads a value from the cache, or None if there is no value younger
+           than 'max_age' (a timedelta)"""
+        cur = self.get_connection().cursor()
+        cur.execute('SELECT value FROM cache WHERE namespace = ? AND key = ? AND created >= ?',
+                    (namespace, key, datetime.datetime.now() - max_age))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    @timed_db('sqlite')
+    def set_cached(self, namespace, key, value):
+        """Saves a (JSON-serializable) value to the cache"""
+        cur = self.get_connection().cursor()
+        cur.execute('INSERT OR REPLACE INTO cache(namespace, key, value, created) \
+                     VALUES (?, ?, ?, ?)',
+                    (namespace, key, json.dumps(value), datetime.datetime.now()))
+        self.get_connection().commit()
+
     def save_settings_for_user(self, user_id, settings):
         """Saves the user settings to the database"""
         cur = self.get_connection().cursor()
@@ -118,6 +354,7 @@ class IdMaintainer:
             return None
         return json.loads(row[0])
 
+    @timed_db('sqlite')
     def get_user_settings(self):
         """Loads all users' settings from the database"""
         cur = self.get_connection().cursor()
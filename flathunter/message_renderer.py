@@ -0,0 +1,99 @@
+"""Renders notification messages for exposes from a message template"""
+import re
+import string
+import threading
+from functools import lru_cache
+from typing import Any, Dict
+
+from flathunter.utils.cache import LRUCache, MISSING
+
+
+class _ExposeFields(dict):
+    """Expose fields for template lookups, with a default for missing fields"""
+
+    def __init__(self, expose: Dict, default: str):
+        super().__init__(expose)
+        self.default = default
+
+    def __missing__(self, key):
+        return self.default
+
+
+class MessageRenderer:
+    """
+    Renders a str.format-style template with the fields of an expose. Any expose
+    field can be used, e.g. {description}, {floor} or {durations}; fields the
+    expose doesn't have are rendered as 'N/A'. The template is parsed once, and
+    shared by all notifiers that use it
+    """
+
+    # The expose field of a replacement field like {images[0]} or {address.street}
+    __FIELD_NAME = re.compile(r'[^.\[]*')
+
+    def __init__(self, template: str, default: str = 'N/A'):
+        self.template = template
+        self.default = default
+        self.__formatter = string.Formatter()
+        self.__parsed = list(self.__formatter.parse(template))
+
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def for_template(template: str) -> 'MessageRenderer':
+        """The shared renderer for a template"""
+        return MessageRenderer(template)
+
+    def render(self, expose: Dict) -> str:
+        """Render the message for an expose"""
+        fields = _ExposeFields(expose, self.default)
+        parts = []
+        for literal, field_name, format_spec, conversion in self.__parsed:
+            parts.append(literal)
+            if field_name is None:
+                continue
+            value = self.__field_value(fields, field_name)
+            if conversion:
+                value = self.__formatter.convert_field(value, conversion)
+            if format_spec and '{' in format_spec:
+                format_spec = self.__formatter.vformat(format_spec, (), fields)
+            try:
+                parts.append(self.__formatter.format_field(value, format_spec or ''))
+            except (TypeError, ValueError):
+                parts.append(str(value))
+        return ''.join(parts).strip()
+
+    def __field_value(self, fields: _ExposeFields, field_name: str) -> Any:
+        """Look up a field, including attribute and index access like {images[0]}"""
+        if self.__FIELD_NAME.match(field_name)[0] not in fields:
+            return self.default
+        try:
+            return self.__formatter.get_field(field_name, (), fields)[0]
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+            return self.default
+
+
+class SharedRenderer(MessageRenderer):
+    """
+    Renderer shared by the notifiers of a processor chain. The message of each
+    expose is rendered once and kept, by crawler and expose id, for the other
+    notifiers. Notifiers come last in the chain, so an expose doesn't change
+    once its message has been rendered
+    """
+
+    CAPACITY = 1024
+
+    def __init__(self, template: str, default: str = 'N/A'):
+        super().__init__(template, default)
+        self.__messages = LRUCache(capacity=self.CAPACITY)
+        self.__lock = threading.Lock()
+
+    def render(self, expose: Dict) -> str:
+        """The message for an expose, rendered by the first notifier that asks"""
+        if expose.get('id') is None:
+            return super().render(expose)
+        key = (expose.get('crawler'), expose['id'])
+        with self.__lock:
+            message = self.__messages.get(key)
+            if message is MISSING:
+                message = super().render(expose)
+                self.__messages.put(key, message)
+        return message
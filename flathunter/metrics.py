@@ -0,0 +1,270 @@
+"""Runtime metrics - counters and histograms that are exposed in the Prometheus
+   text format. Metrics are registered once, at import time, in the global
+   registry, and updated from any thread. The web service serves them on
+   /metrics; the command-line loop can start a small HTTP server for them"""
+import functools
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from flathunter.logging import logger
+
+# Latency buckets in seconds, from a fast processor to a slow crawl
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                   30.0, 60.0, 120.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value"""
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    """Escape a label value"""
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Format a label set, e.g. {crawler="Immowelt"}"""
+    if len(names) == 0:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class _Metric:
+    """Common parts of counters and histograms"""
+
+    TYPE = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        """The label values in the order of the label names"""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        """The sample lines of the metric"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """The metric in the Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.TYPE}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(_Metric):
+    """A value that only goes up, per label set"""
+
+    TYPE = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.__values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """Increase the counter"""
+        key = self._label_values(labels)
+        with self._lock:
+            self.__values[key] = self.__values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """Current value of the counter"""
+        with self._lock:
+            return self.__values.get(self._label_values(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self.__values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in values]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values, in cumulative buckets, per label set"""
+
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.__counts: Dict[LabelValues, List[int]] = {}
+        self.__sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        """Record an observation"""
+        key = self._label_values(labels)
+        with self._lock:
+            counts = self.__counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            index = len(self.buckets)
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    index = position
+                    break
+            counts[index] += 1
+            self.__sums[key] = self.__sums.get(key, 0.0) + value
+
+    def count(self, **labels) -> int:
+        """Number of observations"""
+        with self._lock:
+            return sum(self.__counts.get(self._label_values(labels), []))
+
+    def sum(self, **labels) -> float:
+        """Sum of the observed values"""
+        with self._lock:
+            return self.__sums.get(self._label_values(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, list(counts), self.__sums[key])
+                            for key, counts in self.__counts.items())
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ('le',),
+                                        key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """The set of metrics that is exposed together"""
+
+    def __init__(self):
+        self.__metrics: Dict[str, _Metric] = {}
+        self.__lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Add a metric. Registering the same name twice returns the first metric"""
+        with self.__lock:
+            return self.__metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Register a counter"""
+        metric = self.register(Counter(name, documentation, labelnames))
+        assert isinstance(metric, Counter)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Optional[Sequence[float]] = None) -> Histogram:
+        """Register a histogram"""
+        metric = self.register(Histogram(name, documentation, labelnames,
+                                         buckets or DEFAULT_BUCKETS))
+        assert isinstance(metric, Histogram)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format"""
+        with self.__lock:
+            metrics = [self.__metrics[name] for name in sorted(self.__metrics)]
+        return ''.join(metric.render() for metric in metrics)
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'flathunter_stage_seconds',
+    'Time spent in a pipeline stage (crawler or processor) per expose it produced',
+    ['stage'])
+STAGE_EXPOSES_IN = REGISTRY.counter(
+    'flathunter_stage_exposes_in_total', 'Exposes passed into a pipeline stage', ['stage'])
+STAGE_EXPOSES_OUT = REGISTRY.counter(
+    'flathunter_stage_exposes_out_total', 'Exposes passed on by a pipeline stage', ['stage'])
+STAGE_ERRORS = REGISTRY.counter(
+    'flathunter_stage_errors_total', 'Errors raised in a pipeline stage', ['stage'])
+
+PAGES_FETCHED = REGISTRY.counter(
+    'flathunter_pages_fetched_total', 'Pages fetched from the property portals', ['crawler'])
+BYTES_DOWNLOADED = REGISTRY.counter(
+    'flathunter_downloaded_bytes_total', 'Size of the pages fetched from the property portals',
+    ['crawler'])
+CAPTCHA_SOLVES = REGISTRY.counter(
+    'flathunter_captcha_solves_total', 'Captchas sent to the captcha solving service',
+    ['solver', 'kind', 'result'])
+CAPTCHA_COST = REGISTRY.counter(
+    'flathunter_captcha_cost_total',
+    'Cost of solved captchas, from the configured captcha.cost_per_solve', ['solver'])
+PROXY_FAILURES = REGISTRY.counter(
+    'flathunter_proxy_failures_total', 'Failed requests through a proxy', ['reason'])
+NEW_EXPOSES = REGISTRY.counter(
+    'flathunter_new_exposes_total', 'Exposes that passed the filters for the first time',
+    ['crawler'])
+NOTIFICATIONS_SENT = REGISTRY.counter(
+    'flathunter_notifications_sent_total', 'Messages sent by the notifiers',
+    ['notifier', 'result'])
+SKIPPED_RUNS = REGISTRY.counter(
+    'flathunter_skipped_runs_total',
+    'Scheduled runs of a job that were skipped because the previous run was still going',
+    ['job'])
+DB_SECONDS = REGISTRY.histogram(
+    'flathunter_db_seconds', 'Latency of database operations', ['backend', 'operation'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+
+def timed_db(backend: str) -> Callable[[Callable], Callable]:
+    """Decorator recording the latency of a database method, by method name"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                DB_SECONDS.observe(time.perf_counter() - start,
+                                   backend=backend, operation=func.__name__)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the metrics of the global registry"""
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Answer requests for /metrics"""
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        """Keep scrapes out of the log"""
+        logger.debug("Metrics request: " + format, *args)
+
+
+def start_http_server(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Serve the metrics on http://host:port/metrics from a background thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    logger.info("Serving metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
@@ -1,4 +1,5 @@
 """Package for notifiers."""
+from .sender_digest import SenderDigest
 from .sender_apprise import SenderApprise
 from .sender_mattermost import SenderMattermost
 from .sender_slack import SenderSlack
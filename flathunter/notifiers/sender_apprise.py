@@ -1,42 +1,58 @@
 """Functions and classes related to sending Apprise messages"""
+from typing import Dict, Iterable
+
 import apprise
 
+from flathunter import metrics
 from flathunter.abstract_notifier import Notifier
 from flathunter.abstract_processor import Processor
 from flathunter.config import YamlConfig
+from flathunter.exceptions import NotificationException
+from flathunter.message_renderer import MessageRenderer
+from flathunter.utils.dispatch import KeyedDispatcher
 
 
 class SenderApprise(Processor, Notifier):
-    """Expose processor that sends Apprise messages"""
+    """Expose processor that sends Apprise messages. The Apprise object, with
+       all configured URLs, is built once and reused for every message"""
+
+    IO_BOUND = True
 
-    def __init__(self, config: YamlConfig):
+    def __init__(self, config: YamlConfig, raise_on_failure: bool = False):
         self.config = config
-        self.apprise_urls = self.config.get('apprise', {})
+        self.raise_on_failure = raise_on_failure
+        self.apprise_urls = self.config.apprise_urls()
         self.__notify_with_images: bool = self.config.apprise_notify_with_images()
         self.__image_limit = self.config.apprise_image_limit()
+        self.__message_renderer = MessageRenderer.for_template(self.config.get('message') or '')
+        self.__title_renderer = MessageRenderer.for_template(self.config.get('title') or '')
+        self.__apprise = apprise.Apprise()
+        for apprise_url in self.apprise_urls or []:
+            self.__apprise.add(apprise_url)
 
     def process_expose(self, expose):
         """Send a message to a user describing the expose"""
-        message = (self.config.get('message') or '').format(
-            crawler=expose.get('crawler', 'N/A'),
-            title=expose.get('title', 'N/A'),
-            rooms=expose.get('rooms', 'N/A'),
-            size=expose.get('size', 'N/A'),
-            price=expose.get('price', 'N/A'),
-            url=expose.get('url', 'N/A'),
-            address=expose.get('address', 'N/A'),
-            durations=expose.get('durations', 'N/A')
-        ).strip()
-        title = (self.config.get('title') or '').format(
-            crawler=expose.get('crawler', 'N/A'),
-            title=expose.get('title', 'N/A'),
-            rooms=expose.get('rooms', 'N/A'),
-            size=expose.get('size', 'N/A'),
-            price=expose.get('price', 'N/A'),
-            url=expose.get('url', 'N/A'),
-            address=expose.get('address', 'N/A'),
-            durations=expose.get('durations', 'N/A')
-        ).strip()
+        self.__send_msg(*self.__get_message(expose))
+        return expose
+
+    def process_exposes(self, exposes: Iterable[Dict]):
+        """Send messages for the exposes from a worker thread, passing the exposes
+           on without waiting. Once the sequence is exhausted, wait for the
+           outstanding messages"""
+        with KeyedDispatcher(1, name='apprise') as dispatcher:
+            for expose in exposes:
+                dispatcher.submit(None, self.__send_msg, *self.__get_message(expose))
+                yield expose
+            dispatcher.join()
+
+    def notify(self, message: str):
+        """Send the given message to users"""
+        self.__send_msg(message=message, title=None, attach=None)
+
+    def __get_message(self, expose):
+        """Format the message, title and attachments for an expose"""
+        message = self.__message_renderer.render(expose)
+        title = self.__title_renderer.render(expose)
         images = expose.get("images", [])[: self.__image_limit]
         image = expose.get("image")
         attach = (
@@ -44,24 +60,19 @@ class SenderApprise(Processor, Notifier):
             if self.__notify_with_images
             else None
         )
-        self.__send_msg(message, title, attach)
-        return expose
-
-    def notify(self, message: str):
-        """Send the given message to users"""
-        self.__send_msg(message=message, title=None, attach=None)
+        return message, title, attach
 
     def __send_msg(self, message, title, attach):
-        """Send messages to each of the Apprise urls"""
-        apobj = apprise.Apprise()
-        if self.apprise_urls is None:
+        """Send messages to each of the Apprise urls. Apprise notifies the
+           individual services in parallel"""
+        if len(self.__apprise) == 0:
             return
-        for apprise_url in self.apprise_urls:
-            apobj.add(apprise_url)
-
-        apobj.notify(
+        sent = self.__apprise.notify(
             body=message,
             title=title,
             attach=attach,
             body_format=apprise.NotifyFormat.TEXT,
         )
+        metrics.NOTIFICATIONS_SENT.inc(notifier='apprise', result='sent' if sent else 'failed')
+        if not sent and self.raise_on_failure:
+            raise NotificationException("Apprise could not notify all services")
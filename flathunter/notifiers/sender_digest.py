@@ -0,0 +1,69 @@
+"""Processor that combines the notifications of busy crawls into digests"""
+from itertools import islice
+from typing import Dict, Iterable, List, Protocol
+
+from flathunter.abstract_processor import Processor
+from flathunter.config import YamlConfig
+from flathunter.logging import logger
+from flathunter.message_renderer import MessageRenderer
+from flathunter.utils.list import chunk_list
+
+
+class MessageSender(Protocol):
+    """A notifier that is also a processor, like the senders of the notifiers"""
+
+    def process_exposes(self, exposes: Iterable[Dict]) -> Iterable[Dict]:
+        """Send messages for the exposes, passing them on"""
+
+    def notify(self, message: str) -> None:
+        """Send a message"""
+
+
+class SenderDigest(Processor):
+    """Wraps a notifier processor. Crawls with up to 'digest.threshold' new
+       exposes are passed to the notifier expose by expose. Larger crawls are sent
+       as digest messages listing several exposes each, or as a single summary"""
+
+    IO_BOUND = True
+
+    LISTING_FORMAT = "{title}\n{price} | {size} | {rooms} rooms\n{url}"
+
+    def __init__(self, config: YamlConfig, sender: MessageSender):
+        self.config = config
+        self.sender = sender
+        self.threshold = config.digest_threshold()
+        self.listings_per_message = config.digest_listings_per_message()
+        self.summary_only = config.digest_summary_only()
+
+    def process_exposes(self, exposes: Iterable[Dict]):
+        """Hold back exposes until it is clear whether the crawl exceeds the
+           threshold, then send them individually or as digests"""
+        exposes = iter(exposes)
+        held = list(islice(exposes, self.threshold + 1))
+        if len(held) <= self.threshold:
+            yield from self.sender.process_exposes(held)
+            return
+        held.extend(exposes)
+        logger.info("Sending %d new exposes as a digest", len(held))
+        for message in self.digest_messages(held):
+            self.sender.notify(message)
+        yield from held
+
+    def digest_messages(self, exposes: List[Dict]) -> List[str]:
+        """The messages summarizing the exposes"""
+        website = self.config.website_domain()
+        link = f"\nSee them all at https://{website}/" if website else ""
+        if self.summary_only and website:
+            return [f"{len(exposes)} new listings found.{link}"]
+        chunks = list(chunk_list(exposes, self.listings_per_message))
+        messages = []
+        for index, chunk in enumerate(chunks):
+            header = f"{len(exposes)} new listings ({index + 1}/{len(chunks)}):"
+            listings = [self.__format_listing(expose) for expose in chunk]
+            messages.append("\n\n".join([header] + listings))
+        messages[-1] += link
+        return messages
+
+    def __format_listing(self, expose: Dict) -> str:
+        """One entry in a digest message"""
+        return MessageRenderer.for_template(self.LISTING_FORMAT).render(expose)
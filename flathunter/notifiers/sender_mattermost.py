@@ -3,29 +3,28 @@ import json
 
 import requests
 
+from flathunter import metrics
 from flathunter.abstract_notifier import Notifier
 from flathunter.abstract_processor import Processor
+from flathunter.exceptions import NotificationException, PermanentNotificationException
 from flathunter.logging import logger
+from flathunter.message_renderer import MessageRenderer
 
 
 class SenderMattermost(Processor, Notifier):
     """Expose processor that sends Mattermost messages"""
 
-    def __init__(self, config):
+    IO_BOUND = True
+
+    def __init__(self, config, raise_on_failure=False, renderer=None):
         self.config = config
+        self.raise_on_failure = raise_on_failure
         self.webhook_url = self.config.mattermost_webhook_url()
+        self.__renderer = renderer or MessageRenderer.for_template(self.config.message_format())
 
     def process_expose(self, expose):
         """Send a message to a user describing the expose"""
-        message = self.config.message_format().format(
-            title=expose['title'],
-            rooms=expose['rooms'],
-            size=expose['size'],
-            price=expose['price'],
-            url=expose['url'],
-            address=expose['address'],
-            durations="" if 'durations' not in expose else expose[
-                'durations']).strip()
+        message = self.__renderer.render(expose)
         self.notify(message)
         return expose
 
@@ -46,8 +45,15 @@ class SenderMattermost(Processor, Notifier):
 
         # handle error
         if resp.status_code != 200:
+            metrics.NOTIFICATIONS_SENT.inc(notifier='mattermost', result='failed')
             logger.error(
                 "When sending mattermost bot message, we got status %i with message: %s",
                 resp.status_code,
                 resp.text
             )
+            if self.raise_on_failure:
+                error = PermanentNotificationException \
+                    if self.is_permanent_failure(resp.status_code) else NotificationException
+                raise error(f"Mattermost webhook answered with status {resp.status_code}")
+        else:
+            metrics.NOTIFICATIONS_SENT.inc(notifier='mattermost', result='sent')
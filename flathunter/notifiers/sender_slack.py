@@ -1,33 +1,33 @@
 """Functions and classes related to sending Slack messages"""
 import json
-from typing import Dict
+from typing import Dict, Optional
 
 import requests
 
+from flathunter import metrics
 from flathunter.abstract_notifier import Notifier
 from flathunter.abstract_processor import Processor
 from flathunter.config import YamlConfig
+from flathunter.exceptions import NotificationException, PermanentNotificationException
 from flathunter.logging import logger
+from flathunter.message_renderer import MessageRenderer
 
 
 class SenderSlack(Processor, Notifier):
     """Expose processor that sends Slack messages"""
 
-    def __init__(self, config: YamlConfig) -> None:
+    IO_BOUND = True
+
+    def __init__(self, config: YamlConfig, raise_on_failure: bool = False,
+                 renderer: Optional[MessageRenderer] = None) -> None:
         self.config = config
+        self.raise_on_failure = raise_on_failure
         self.webhook_url = self.config.slack_webhook_url()
+        self.__renderer = renderer or MessageRenderer.for_template(self.config.message_format())
 
     def process_expose(self, expose: Dict) -> Dict:
         """Send a message to a Slack channel describing the expose"""
-        message = self.config.message_format().format(
-            title=expose['title'],
-            rooms=expose['rooms'],
-            size=expose['size'],
-            price=expose['price'],
-            url=expose['url'],
-            address=expose['address'],
-            durations="" if 'durations' not in expose else expose[
-                'durations']).strip()
+        message = self.__renderer.render(expose)
         self.notify(message)
         return expose
 
@@ -47,8 +47,15 @@ class SenderSlack(Processor, Notifier):
         logger.debug("Got response (%i): %s", response.status_code, response.content)
 
         if response.status_code != 200:
+            metrics.NOTIFICATIONS_SENT.inc(notifier='slack', result='failed')
             logger.error(
                 "When sending Slack bot message, we got status %i with message: %s",
                 response.status_code,
                 response.text
             )
+            if self.raise_on_failure:
+                error = PermanentNotificationException \
+                    if self.is_permanent_failure(response.status_code) else NotificationException
+                raise error(f"Slack webhook answered with status {response.status_code}")
+        else:
+            metrics.NOTIFICATIONS_SENT.inc(notifier='slack', result='sent')
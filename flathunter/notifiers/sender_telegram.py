@@ -1,62 +1,162 @@
 """Functions and classes related to sending Telegram messages"""
 import json
+import threading
 import time
-from typing import List, Dict, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import requests
 
+from flathunter import metrics
 from flathunter.abstract_notifier import Notifier
 from flathunter.abstract_processor import Processor
 from flathunter.config import YamlConfig
-from flathunter.exceptions import BotBlockedException
-from flathunter.exceptions import UserDeactivatedException
+from flathunter.exceptions import BotBlockedException, NotificationException
+from flathunter.exceptions import PermanentNotificationException, UserDeactivatedException
 from flathunter.logging import logger
+from flathunter.message_renderer import MessageRenderer
+from flathunter.utils.cache import LRUCache, MISSING
+from flathunter.utils.dispatch import KeyedDispatcher
 from flathunter.utils.list import chunk_list
+from flathunter.utils.rate_limit import TokenBucket
+
+
+class _Broadcast:
+    """
+    A message, with its images, for several receivers. If some of the images
+    have not been uploaded before, the first receiver uploads them; the other
+    receivers send their images once the upload has finished, with the
+    file_ids that Telegram assigned
+    """
+
+    def __init__(self, message: str, images: Optional[List[str]], uploader: Optional[int]):
+        self.message = message
+        self.images = images
+        # The receiver that uploads the images, None if there is nothing to upload
+        self.uploader = uploader
+        self.lock = threading.Lock()
+        self.uploaded = uploader is None
+        # Receivers whose text message has been sent, waiting for the upload
+        self.waiting: List[Tuple[int, Dict]] = []
 
 
 class SenderTelegram(Processor, Notifier):
-    """Expose processor that sends Telegram messages"""
+    """Expose processor that sends Telegram messages. Messages are delivered by
+       a pool of worker threads, so that receivers are served in parallel while
+       the processor chain carries on with the next exposes"""
+
+    # Telegram allows about 30 messages per second per bot, and about one
+    # message per second (with short bursts) per chat
+    GLOBAL_RATE_LIMIT = 30
+    CHAT_RATE_LIMIT = 1
+    CHAT_BURST = 3
+
+    MAX_WORKERS = 8
+
+    IO_BOUND = True
+    PARALLELISM = MAX_WORKERS
+
+    # Number of times a request is retried after a 429 response
+    MAX_RETRIES = 1
+
+    # Rate limits are shared by all senders using the same bot token
+    __rate_limit_lock = threading.Lock()
+    __rate_limits: Dict = {}
 
-    def __init__(self, config: YamlConfig, receivers=None):
+    # Telegram file_ids of images that have been uploaded before, keyed by bot
+    # token and image URL. Resending a file_id doesn't make Telegram fetch the
+    # image again
+    __file_ids = LRUCache(capacity=10000)
+
+    def __init__(self, config: YamlConfig, receivers=None, raise_on_failure: bool = False,
+                 renderer: Optional[MessageRenderer] = None):
         self.config = config
+        self.raise_on_failure = raise_on_failure
         self.bot_token = self.config.telegram_bot_token()
         self.__notify_with_images: bool = self.config.telegram_notify_with_images()
-
-        self.__text_message_url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
-        self.__media_group_url = f"https://api.telegram.org/bot{self.bot_token}/sendMediaGroup"
+        self.__renderer = renderer or MessageRenderer.for_template(self.config.message_format())
+        self.__bot_url = f"{self.config.telegram_api_url()}/bot{self.bot_token}"
 
         if receivers is None:
             self.receiver_ids = self.config.telegram_receiver_ids()
         else:
             self.receiver_ids = receivers
 
+    def __method_url(self, method: str) -> str:
+        """URL of a method of the bot API"""
+        return f"{self.__bot_url}/{method}"
+
     def process_expose(self, expose):
         """Send a message to a user describing the expose"""
-        self.__broadcast(
-            receivers=self.receiver_ids,
-            message=self.__get_text_message(expose),
-            images=self.__get_images(expose),
-        )
+        with KeyedDispatcher(self.MAX_WORKERS, name='telegram') as dispatcher:
+            self.__broadcast(dispatcher, self.receiver_ids,
+                             self.__get_text_message(expose), self.__get_images(expose))
+            dispatcher.join()
         return expose
 
+    def process_exposes(self, exposes: Iterable[Dict]):
+        """Queue messages for every expose in the sequence, passing the exposes on
+           without waiting for them to be sent. Once the sequence is exhausted, wait
+           for the outstanding messages"""
+        with KeyedDispatcher(self.MAX_WORKERS, name='telegram') as dispatcher:
+            for expose in exposes:
+                self.__broadcast(dispatcher, self.receiver_ids,
+                                 self.__get_text_message(expose), self.__get_images(expose))
+                yield expose
+            dispatcher.join()
+
     def __broadcast(self,
+                    dispatcher: KeyedDispatcher,
                     receivers: List[int],
                     message: str,
                     images: Optional[List[str]] = None) -> None:
         """
-        Broadcast given message to the given receiver ids
+        Queue the given message for each of the given receiver ids. Messages to
+        one receiver are sent in order; different receivers are served in parallel
+        :param dispatcher: the dispatcher delivering the messages
         :param receivers: list of user/group ids
         :param message: text message to send to users
         :param images: images to send to users as a reply to message
         :return: None
         """
+        uploader = None
+        if self.__notify_with_images and images and len(receivers) > 1 and any(
+                self.__file_ids.get((self.bot_token, url)) is MISSING for url in images):
+            uploader = receivers[0]
+        broadcast = _Broadcast(message, images, uploader)
         for receiver in receivers:
-            msg = self.__send_text(receiver, message)
+            dispatcher.submit(receiver, self.__deliver, dispatcher, receiver, broadcast)
+
+    def __deliver(self, dispatcher: KeyedDispatcher, chat_id: int,
+                  broadcast: _Broadcast) -> None:
+        """Send the text message to a receiver, followed by the images"""
+        try:
+            msg = self.__send_text(chat_id, broadcast.message)
+            metrics.NOTIFICATIONS_SENT.inc(notifier='telegram',
+                                           result='sent' if msg else 'failed')
             if not msg:
-                continue
+                if self.raise_on_failure:
+                    raise NotificationException(f"Message to chat {chat_id} was not sent")
+                return
+            if not self.__notify_with_images or not broadcast.images:
+                return
+            if chat_id != broadcast.uploader:
+                with broadcast.lock:
+                    if not broadcast.uploaded:
+                        # Sent by __finish_upload, the worker doesn't wait for it
+                        broadcast.waiting.append((chat_id, msg))
+                        return
+            self.__send_images(chat_id=chat_id, msg=msg, images=broadcast.images)
+        finally:
+            if chat_id == broadcast.uploader:
+                self.__finish_upload(dispatcher, broadcast)
 
-            if self.__notify_with_images and images:
-                self.__send_images(chat_id=receiver, msg=msg, images=images)
+    def __finish_upload(self, dispatcher: KeyedDispatcher, broadcast: _Broadcast) -> None:
+        """Queue the images of the receivers that waited for the upload"""
+        with broadcast.lock:
+            broadcast.uploaded = True
+            waiting, broadcast.waiting = broadcast.waiting, []
+        for chat_id, msg in waiting:
+            dispatcher.submit(chat_id, self.__send_images, chat_id, msg, broadcast.images)
 
     def notify(self, message: str):
         """
@@ -64,7 +164,48 @@ class SenderTelegram(Processor, Notifier):
         :param message: a message that should be sent to users
         :return: None
         """
-        self.__broadcast(self.receiver_ids, message, None)
+        with KeyedDispatcher(self.MAX_WORKERS, name='telegram') as dispatcher:
+            self.__broadcast(dispatcher, self.receiver_ids, message, None)
+            dispatcher.join()
+
+    @classmethod
+    def reset_rate_limits(cls):
+        """Forget the state of all rate limits, as if no messages had been sent"""
+        with cls.__rate_limit_lock:
+            cls.__rate_limits.clear()
+
+    def __rate_limits_for(self, chat_id) -> List[TokenBucket]:
+        """The token buckets that a request to the given chat has to pass"""
+        with SenderTelegram.__rate_limit_lock:
+            limits = SenderTelegram.__rate_limits
+            if self.bot_token not in limits:
+                limits[self.bot_token] = TokenBucket(self.GLOBAL_RATE_LIMIT)
+            if (self.bot_token, chat_id) not in limits:
+                limits[(self.bot_token, chat_id)] = \
+                    TokenBucket(self.CHAT_RATE_LIMIT, capacity=self.CHAT_BURST)
+            return [limits[(self.bot_token, chat_id)], limits[self.bot_token]]
+
+    def __post(self, url: str, payload: Dict, chat_id, error_message: str):
+        """
+        Send a request to the bot API, respecting the rate limits. Requests that
+        are rejected with a 429 are retried once Telegram's retry_after has passed
+        :return: the last response, with a status other than 200 if the request failed
+        """
+        attempt = 0
+        while True:
+            for bucket in self.__rate_limits_for(chat_id):
+                bucket.acquire()
+            response = requests.request("POST", url, data=payload, timeout=30)
+            logger.debug("Got response (%i): %s", response.status_code, response.content)
+            if response.status_code == 200:
+                return response
+            if url == self.__method_url('sendMediaGroup'):
+                logger.warning("Error sending media group: %s", json.dumps(payload))
+            retry_after = self.__handle_error(error_message, response, chat_id)
+            if retry_after is None or attempt == self.MAX_RETRIES:
+                return response
+            attempt += 1
+            time.sleep(retry_after)
 
     def __send_text(self, chat_id: int, message: str) -> Dict:
         """
@@ -82,14 +223,13 @@ class SenderTelegram(Processor, Notifier):
         logger.debug(('token:', self.bot_token))
         logger.debug(('chat_id:', chat_id))
         logger.debug(('text:', message))
-        logger.debug("Retrieving URL %s, payload %s", self.__text_message_url, payload)
-        response = requests.request("POST", self.__text_message_url, data=payload, timeout=30)
-        logger.debug("Got response (%i): %s", response.status_code, response.content)
-
-        # handle error
+        logger.debug("Retrieving URL %s, payload %s", self.__method_url('sendMessage'), payload)
+        response = self.__post(self.__method_url('sendMessage'), payload, chat_id,
+                               "When sending bot text message, we got an error.")
         if response.status_code != 200:
-            self.__handle_error("When sending bot text message, we got an error.",
-                response, chat_id)
+            if self.raise_on_failure and self.is_permanent_failure(response.status_code):
+                raise PermanentNotificationException(
+                    f"Message to chat {chat_id} was rejected with status {response.status_code}")
             return {}
 
         return response.json().get('result', {})
@@ -106,33 +246,53 @@ class SenderTelegram(Processor, Notifier):
         # maximum number of images in a media group is 10.
         # if there are more than 10 images, we need to divide it into multiple messages.
         for chunk in chunk_list(images, 10):
-            payload = {
-                'chat_id': str(chat_id),
-                # media expected to be an array of objects in string format
-                'media': json.dumps([{"type": "photo", "media": url} for url in chunk]),
-                'disable_notification': True,
-            }
-            if msg.get('message_id', None):
-                payload['reply_to_message_id'] = msg.get('message_id')
-
-            response = requests.request("POST", self.__media_group_url, data=payload, timeout=30)
-
-            if response.status_code != 200:
-                logger.warning("Error sending media group: %s", json.dumps(payload))
-                self.__handle_error(
-                    "When sending media group, we got an error.",
-                    response=response,
-                    chat_id=str(chat_id)
-                )
+            cached = [self.__file_ids.get((self.bot_token, url)) for url in chunk]
+            response = self.__send_media_group(chat_id, msg, [
+                url if file_id is MISSING else file_id for url, file_id in zip(chunk, cached)])
+            if response is None and any(file_id is not MISSING for file_id in cached):
+                # Cached file_ids can become invalid - retry with the URLs
+                for url in chunk:
+                    self.__file_ids.invalidate((self.bot_token, url))
+                cached = [MISSING] * len(chunk)
+                response = self.__send_media_group(chat_id, msg, chunk)
+            if response is None:
                 return
+            self.__remember_file_ids(chunk, cached, response)
 
-    def __handle_error(self, msg: str, response, chat_id) -> None:
+    def __send_media_group(self, chat_id: int, msg: Dict, media: List[str]):
+        """Send one media group of up to 10 photos, given as URLs or file_ids"""
+        payload = {
+            'chat_id': str(chat_id),
+            # media expected to be an array of objects in string format
+            'media': json.dumps([{"type": "photo", "media": item} for item in media]),
+            'disable_notification': True,
+        }
+        if msg.get('message_id', None):
+            payload['reply_to_message_id'] = msg.get('message_id')
+
+        response = self.__post(self.__method_url('sendMediaGroup'), payload, chat_id,
+                               "When sending media group, we got an error.")
+        return response if response.status_code == 200 else None
+
+    def __remember_file_ids(self, urls: List[str], cached: List, response) -> None:
+        """Cache the file_ids Telegram assigned to the photos uploaded from URLs"""
+        messages = response.json().get('result', [])
+        if not isinstance(messages, list):
+            return
+        for url, file_id, message in zip(urls, cached, messages):
+            photos = message.get('photo') or []
+            if file_id is MISSING and len(photos) > 0:
+                # Telegram lists the sizes it generated, the original size last
+                self.__file_ids.put((self.bot_token, url), photos[-1]['file_id'])
+
+    def __handle_error(self, msg: str, response, chat_id) -> Optional[int]:
         """
         Handles telegram API error responses
         :param msg: the message for logging
         :param response: the response that is received form the API
         :param chat_id: the receiver that was supposed to get the message
-        :return: None
+        :return: the number of seconds to wait before retrying, or None if the
+            request should not be retried
 
         :raise BotBlockedException: Happens when bot trys to send a message to a user that
             has already blocked the bot
@@ -152,8 +312,7 @@ class SenderTelegram(Processor, Notifier):
         if response.status_code == 429:
             if "Too Many Requests" in data.get("description", ""):
                 backoff = data.get("parameters", {}).get("retry_after", 30)
-                time.sleep(min(backoff, 30))
-                return None
+                return min(backoff, 30)
         return None
 
     def __get_images(self, expose: Dict) -> List[str]:
@@ -166,13 +325,4 @@ class SenderTelegram(Processor, Notifier):
         :return: str
         """
 
-        return self.config.message_format().format(
-            crawler=expose.get('crawler', 'N/A'),
-            title=expose.get('title', 'N/A'),
-            rooms=expose.get('rooms', 'N/A'),
-            size=expose.get('size', 'N/A'),
-            price=expose.get('price', 'N/A'),
-            url=expose.get('url', 'N/A'),
-            address=expose.get('address', 'N/A'),
-            durations=expose.get('durations', 'N/A')
-        ).strip()
+        return self.__renderer.render(expose)
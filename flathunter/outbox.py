@@ -0,0 +1,137 @@
+"""Sends the notifications queued in the outbox of the SQLite database"""
+import datetime
+import threading
+from typing import Dict, Optional, Set
+
+from flathunter.abstract_processor import Processor
+from flathunter.config import YamlConfig
+from flathunter.exceptions import BotBlockedException, PermanentNotificationException
+from flathunter.exceptions import UserDeactivatedException
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.logging import logger
+from flathunter.message_renderer import SharedRenderer
+from flathunter.notifiers import SenderMattermost, SenderTelegram, SenderApprise, SenderSlack
+
+
+class OutboxDispatcher:
+    """Drains the notification outbox, sending messages through the configured
+       notifiers. Every notifier, and every Telegram receiver, is a delivery of
+       its own: the deliveries that succeed are recorded on the entry, and a
+       retry only sends the missing ones. Entries are only removed once all
+       deliveries are done - the notifiers raise if a service does not accept a
+       message - so every queued notification is delivered at least once - a
+       crash after sending but before recording a delivery leads to a duplicate
+       message"""
+
+    POLL_INTERVAL_SECONDS = 5
+    BATCH_SIZE = 100
+
+    # Failed entries are retried with exponential backoff, and given up on
+    # after MAX_ATTEMPTS attempts
+    MAX_ATTEMPTS = 10
+    RETRY_BACKOFF = datetime.timedelta(seconds=30)
+    MAX_RETRY_BACKOFF = datetime.timedelta(hours=1)
+
+    # Failures that sending the message again won't fix. The delivery counts
+    # as done
+    PERMANENT_FAILURES = (BotBlockedException, UserDeactivatedException,
+                          PermanentNotificationException)
+
+    def __init__(self, config: YamlConfig, id_watch: IdMaintainer):
+        self.config = config
+        self.id_watch = id_watch
+        self.deliveries = self.build_deliveries(config)
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def build_deliveries(config: YamlConfig) -> Dict[str, Processor]:
+        """The senders of the configured notifiers, by delivery name"""
+        notifiers = config.notifiers()
+        renderer = SharedRenderer(config.message_format())
+        deliveries: Dict[str, Processor] = {}
+        if 'telegram' in notifiers:
+            for receiver in config.telegram_receiver_ids():
+                deliveries[f"telegram:{receiver}"] = SenderTelegram(
+                    config, receivers=[receiver], raise_on_failure=True, renderer=renderer)
+        if 'mattermost' in notifiers:
+            deliveries['mattermost'] = SenderMattermost(
+                config, raise_on_failure=True, renderer=renderer)
+        if 'apprise' in notifiers:
+            deliveries['apprise'] = SenderApprise(config, raise_on_failure=True)
+        if 'slack' in notifiers:
+            deliveries['slack'] = SenderSlack(config, raise_on_failure=True, renderer=renderer)
+        return deliveries
+
+    def retry_delay(self, attempts: int) -> datetime.timedelta:
+        """Time to wait before retrying an entry that failed 'attempts' times"""
+        return min(self.RETRY_BACKOFF * 2 ** min(attempts - 1, 16), self.MAX_RETRY_BACKOFF)
+
+    def drain(self) -> int:
+        """Send all notifications that are due. Returns the number completed"""
+        sent = 0
+        while True:
+            entries = self.id_watch.get_outbox(datetime.datetime.now(), limit=self.BATCH_SIZE)
+            if len(entries) == 0:
+                return sent
+            for entry_id, expose, attempts, delivered in entries:
+                done = set(delivered)
+                errors = self.__deliver(expose, done)
+                if len(errors) > 0:
+                    self.__handle_failure(entry_id, expose, attempts + 1, done, errors)
+                    continue
+                self.id_watch.complete_notification(entry_id)
+                sent += 1
+
+    def __deliver(self, expose: Dict, delivered: Set[str]) -> Dict[str, Exception]:
+        """Send the expose through the deliveries that are not done yet, adding
+           them to 'delivered'. Returns the errors of the failed deliveries"""
+        errors = {}
+        for name, sender in self.deliveries.items():
+            if name in delivered:
+                continue
+            try:
+                sender.process_expose(expose)
+            except self.PERMANENT_FAILURES as error:
+                logger.error("Not sending notification for expose %s to %s: %s",
+                             expose.get('id'), name, error)
+            except Exception as error: # pylint: disable=broad-except
+                errors[name] = error
+                continue
+            delivered.add(name)
+        return errors
+
+    def __handle_failure(self, entry_id, expose, attempts, delivered, errors):
+        """Schedule a retry of the failed deliveries of an entry, or drop it if
+           it keeps failing"""
+        if attempts >= self.MAX_ATTEMPTS:
+            logger.error("Giving up on notification for expose %s after %d attempts: %s",
+                         expose.get('id'), attempts, errors)
+            self.id_watch.complete_notification(entry_id)
+            return
+        delay = self.retry_delay(attempts)
+        logger.warning("Sending notification for expose %s failed, retrying in %s: %s",
+                       expose.get('id'), delay, errors)
+        self.id_watch.fail_notification(entry_id, datetime.datetime.now() + delay, delivered)
+
+    def run(self):
+        """Drain the outbox every few seconds until stopped"""
+        while not self.stopped.is_set():
+            try:
+                self.drain()
+            except Exception as error: # pylint: disable=broad-except
+                logger.error("Error draining the notification outbox: %s", error)
+            self.stopped.wait(self.POLL_INTERVAL_SECONDS)
+
+    def start(self):
+        """Drain the outbox in a background thread"""
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='outbox', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the background thread, after it finishes the current batch"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
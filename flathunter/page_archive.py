@@ -0,0 +1,105 @@
+"""Recording and replaying the pages fetched by the crawlers. An archive is a
+   directory with an index.jsonl, with one line per fetched page, and a blob
+   store holding the page contents by their SHA-256 hash. Recorded archives
+   can be replayed through the whole pipeline without network access"""
+import datetime
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Tuple, Union
+
+from flathunter.logging import logger
+
+
+class PageArchive:
+    """
+    Pages recorded from the property portals, by crawler and URL. When
+    replaying, the recordings of a URL are served in the order they were
+    recorded, and the last one is repeated once they have all been served.
+    URLs that were not recorded get an empty page
+    """
+
+    RECORD = 'record'
+    REPLAY = 'replay'
+
+    INDEX_FILE = 'index.jsonl'
+    BLOB_DIRECTORY = 'blobs'
+
+    def __init__(self, path: str, mode: str = REPLAY):
+        if mode not in (self.RECORD, self.REPLAY):
+            raise ValueError(f"Unknown page archive mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.__lock = threading.Lock()
+        self.__recordings: Dict[Tuple[str, str], List[str]] = {}
+        self.__served: Dict[Tuple[str, str], int] = {}
+        os.makedirs(os.path.join(self.path, self.BLOB_DIRECTORY), exist_ok=True)
+        self.__load_index()
+
+    @property
+    def recording(self) -> bool:
+        """True if fetched pages are added to the archive"""
+        return self.mode == self.RECORD
+
+    @property
+    def replaying(self) -> bool:
+        """True if pages are served from the archive instead of being fetched"""
+        return self.mode == self.REPLAY
+
+    def __load_index(self) -> None:
+        index = os.path.join(self.path, self.INDEX_FILE)
+        if not os.path.exists(index):
+            return
+        with open(index, encoding='utf-8') as lines:
+            for line in lines:
+                if line.strip() == '':
+                    continue
+                entry = json.loads(line)
+                self.__recordings.setdefault(
+                    (entry['crawler'], entry['url']), []).append(entry['blob'])
+
+    def __blob_path(self, digest: str) -> str:
+        return os.path.join(self.path, self.BLOB_DIRECTORY, digest[:2], digest)
+
+    def record(self, crawler: str, url: str, content: Union[str, bytes]) -> None:
+        """Add a fetched page to the archive"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        digest = hashlib.sha256(content).hexdigest()
+        blob = self.__blob_path(digest)
+        entry = {'crawler': crawler, 'url': url, 'blob': digest, 'size': len(content),
+                 'recorded': datetime.datetime.now().isoformat(timespec='seconds')}
+        with self.__lock:
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                with open(blob, 'wb') as blob_file:
+                    blob_file.write(content)
+            with open(os.path.join(self.path, self.INDEX_FILE), 'a', encoding='utf-8') as index:
+                index.write(json.dumps(entry) + '\n')
+            self.__recordings.setdefault((crawler, url), []).append(digest)
+        logger.debug("Recorded %s page %s (%d bytes)", crawler, url, len(content))
+
+    def replay(self, crawler: str, url: str) -> bytes:
+        """The next recorded page for the URL, or an empty page"""
+        key = (crawler, url)
+        with self.__lock:
+            recordings = self.__recordings.get(key, [])
+            if len(recordings) == 0:
+                logger.warning("No recorded %s page for %s", crawler, url)
+                return b''
+            served = self.__served.get(key, 0)
+            self.__served[key] = served + 1
+            digest = recordings[min(served, len(recordings) - 1)]
+        with open(self.__blob_path(digest), 'rb') as blob_file:
+            return blob_file.read()
+
+    def rewind(self) -> None:
+        """Serve the recordings from the start again"""
+        with self.__lock:
+            self.__served.clear()
+
+    def urls(self) -> List[Tuple[str, str]]:
+        """The (crawler, URL) pairs in the archive"""
+        with self.__lock:
+            return list(self.__recordings)
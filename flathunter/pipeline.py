@@ -0,0 +1,159 @@
+"""Staged execution of processor chains. Each stage runs on its own thread and
+   the stages are connected by bounded queues, so that slow, I/O-bound
+   processors (fetching details, resolving addresses, sending messages) work on
+   different exposes at the same time"""
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, reduce
+from typing import Iterable, Iterator, List, Optional
+
+from flathunter.abstract_processor import Processor
+from flathunter.profiling import CycleProfile
+from flathunter.utils.list import IDLE
+
+# Marks the end of the exposes in a queue
+_DONE = object()
+
+
+def apply_processor(exposes: Iterable, processor: Processor,
+                    batch_size: Optional[int] = None,
+                    batch_timeout: Optional[float] = None) -> Iterable:
+    """Apply a processor to a stream of exposes, in batches if it supports them"""
+    if processor.supports_batches():
+        return processor.process_batches(exposes, batch_size, batch_timeout)
+    return processor.process_exposes(exposes)
+
+
+class _Failure:
+    """Passed down the queues when a stage raises an exception"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class StagedPipeline:
+    """
+    Runs a chain of processors as a pipeline of stages. Consecutive CPU-bound
+    processors share a stage; every I/O-bound processor gets a stage of its
+    own. I/O-bound processors that handle one expose at a time run on as many
+    threads as their declared parallelism, keeping the order of the exposes.
+    The queues between the stages are bounded, so a slow stage holds back the
+    stages before it. Processors that support batches get batches of exposes;
+    an incomplete batch is processed once it has waited for the batch timeout.
+    Exceptions are re-raised to the consumer of the exposes
+    """
+
+    # How often blocked stages check whether the pipeline has been stopped
+    POLL_INTERVAL_SECONDS = 0.1
+
+    def __init__(self, processors: List[Processor], queue_size: int = 16,
+                 batch_size: Optional[int] = None, batch_timeout: Optional[float] = None):
+        self.stages = self.plan_stages(processors)
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+
+    @staticmethod
+    def plan_stages(processors: List[Processor]) -> List[List[Processor]]:
+        """Group the processors into stages"""
+        stages: List[List[Processor]] = []
+        for processor in processors:
+            if processor.IO_BOUND or len(stages) == 0 or stages[-1][-1].IO_BOUND:
+                stages.append([processor])
+            else:
+                stages[-1].append(processor)
+        return stages
+
+    def process(self, exposes: Iterable, profile: Optional[CycleProfile] = None) -> Iterator:
+        """Run the exposes through the pipeline, timing the processors if a
+           profile is supplied"""
+        stopped = threading.Event()
+        queues: List[queue.Queue] = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = []
+        source = exposes
+        for index, (stage, output) in enumerate(zip(self.stages, queues)):
+            thread = threading.Thread(target=self.__run_stage,
+                                      args=(stage, source, output, stopped, profile),
+                                      name=f"pipeline-{index}", daemon=True)
+            threads.append(thread)
+            # Batching stages are told when no exposes arrive, to flush their batch
+            idle = index + 1 < len(self.stages) and self.stages[index + 1][0].supports_batches()
+            source = self.__read(output, stopped, idle)
+        for thread in threads:
+            thread.start()
+        try:
+            yield from source
+        finally:
+            stopped.set()
+            for thread in threads:
+                thread.join()
+
+    def __run_stage(self, stage: List[Processor], exposes: Iterable, output: queue.Queue,
+                    stopped: threading.Event, profile: Optional[CycleProfile]):
+        """Process the exposes of a stage and pass them on to the next"""
+        def step(exposes, processor):
+            if profile is None:
+                return self.__apply(exposes, processor)
+            return profile.instrument(type(processor).__name__, exposes,
+                                      partial(self.__apply, processor=processor))
+        try:
+            for expose in reduce(step, stage, exposes):
+                if not self.__write(output, expose, stopped):
+                    return
+        except Exception as error: # pylint: disable=broad-except
+            self.__write(output, _Failure(error), stopped)
+            return
+        self.__write(output, _DONE, stopped)
+
+    def __apply(self, exposes: Iterable, processor: Processor) -> Iterable:
+        """Apply a processor, in parallel if it is I/O-bound and processes
+           exposes one by one"""
+        parallel = processor.IO_BOUND and processor.PARALLELISM > 1 \
+            and not processor.supports_batches() \
+            and type(processor).process_exposes is Processor.process_exposes
+        if not parallel:
+            return apply_processor(exposes, processor, self.batch_size, self.batch_timeout)
+        return StagedPipeline.ordered_map(processor.process_expose, exposes,
+                                          processor.PARALLELISM)
+
+    @staticmethod
+    def ordered_map(func, exposes: Iterable, parallelism: int) -> Iterator:
+        """Map the function over the exposes on several threads, keeping the order"""
+        with ThreadPoolExecutor(max_workers=parallelism,
+                                thread_name_prefix='pipeline-worker') as executor:
+            pending: deque = deque()
+            for expose in exposes:
+                pending.append(executor.submit(func, expose))
+                if len(pending) >= parallelism:
+                    yield pending.popleft().result()
+            while len(pending) > 0:
+                yield pending.popleft().result()
+
+    def __write(self, output: queue.Queue, item, stopped: threading.Event) -> bool:
+        """Put an item in the queue, waiting for space. False if the pipeline
+           was stopped while waiting"""
+        while not stopped.is_set():
+            try:
+                output.put(item, timeout=self.POLL_INTERVAL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __read(self, source: queue.Queue, stopped: threading.Event, idle: bool) -> Iterator:
+        """Read the exposes from a queue until the previous stage is done. If
+           requested, IDLE is yielded while the queue is empty"""
+        while not stopped.is_set():
+            try:
+                item = source.get(timeout=self.POLL_INTERVAL_SECONDS)
+            except queue.Empty:
+                if idle:
+                    yield IDLE
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
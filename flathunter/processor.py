@@ -1,15 +1,20 @@
 """Utility classes for building chains for processors"""
-from functools import reduce
-from typing import List
+from functools import partial, reduce
+from typing import List, Optional
 
 from flathunter.default_processors import AddressResolver
 from flathunter.default_processors import Filter
 from flathunter.default_processors import LambdaProcessor
 from flathunter.default_processors import CrawlExposeDetails
 from flathunter.notifiers import SenderMattermost, SenderTelegram, SenderApprise, SenderSlack
+from flathunter.notifiers import SenderDigest
 from flathunter.gmaps_duration_processor import GMapsDurationProcessor
-from flathunter.idmaintainer import SaveAllExposesProcessor
+from flathunter.idmaintainer import SaveAllExposesProcessor, EnqueueNotificationsProcessor
+from flathunter.idmaintainer import PrefetchProcessedProcessor
+from flathunter.message_renderer import SharedRenderer
 from flathunter.abstract_processor import Processor
+from flathunter.pipeline import StagedPipeline, apply_processor
+from flathunter.profiling import CycleProfile
 
 class ProcessorChainBuilder:
     """Builder pattern for building chains of processors"""
@@ -19,30 +24,50 @@ class ProcessorChainBuilder:
         self.processors = []
         self.config = config
 
-    def send_messages(self, receivers=None):
-        """Add processor that sends messages for exposes"""
+    def send_messages(self, receivers=None, raise_on_failure=False):
+        """Add processor that sends messages for exposes. If a digest threshold is
+           configured, busy crawls are sent as digests. With raise_on_failure,
+           messages that are not delivered raise a NotificationException, so
+           that they can be retried"""
         notifiers = self.config.notifiers()
+        # Telegram, Mattermost and Slack send the same message, rendered once
+        renderer = SharedRenderer(self.config.message_format())
+        senders = []
         if 'telegram' in notifiers:
-            self.processors.append(SenderTelegram(self.config, receivers=receivers))
+            senders.append(SenderTelegram(self.config, receivers=receivers,
+                                          raise_on_failure=raise_on_failure, renderer=renderer))
         if 'mattermost' in notifiers:
-            self.processors.append(SenderMattermost(self.config))
+            senders.append(SenderMattermost(self.config, raise_on_failure=raise_on_failure,
+                                            renderer=renderer))
         if 'apprise' in notifiers:
-            self.processors.append(SenderApprise(self.config))
+            senders.append(SenderApprise(self.config, raise_on_failure=raise_on_failure))
         if 'slack' in notifiers:
-            self.processors.append(SenderSlack(self.config))
+            senders.append(SenderSlack(self.config, raise_on_failure=raise_on_failure,
+                                       renderer=renderer))
+        if self.config.digest_threshold() is not None:
+            senders = [SenderDigest(self.config, sender) for sender in senders]
+        self.processors.extend(senders)
         return self
 
-    def resolve_addresses(self):
-        """Add processor that resolves addresses from expose pages"""
-        self.processors.append(AddressResolver(self.config))
+    def enqueue_notifications(self, id_watch):
+        """Add processor that queues exposes in the notification outbox, instead
+           of sending messages directly"""
+        self.processors.append(EnqueueNotificationsProcessor(self.config, id_watch))
         return self
 
-    def calculate_durations(self):
-        """Add processor to calculate durations, if enabled"""
+    def resolve_addresses(self, id_watch=None):
+        """Add processor that resolves addresses from expose pages. If a storage
+           back-end is supplied, resolved addresses are cached there"""
+        self.processors.append(AddressResolver(self.config, id_watch))
+        return self
+
+    def calculate_durations(self, id_watch=None):
+        """Add processor to calculate durations, if enabled. If a storage back-end
+           is supplied, durations are cached there"""
         durations_enabled = "google_maps_api" in self.config \
                             and self.config["google_maps_api"]["enable"]
         if durations_enabled:
-            self.processors.append(GMapsDurationProcessor(self.config))
+            self.processors.append(GMapsDurationProcessor(self.config, id_watch))
         return self
 
     def crawl_expose_details(self):
@@ -65,21 +90,47 @@ class ProcessorChainBuilder:
         self.processors.append(SaveAllExposesProcessor(self.config, id_watch))
         return self
 
+    def prefetch_processed(self, id_watch):
+        """Add processor that loads the processed state of the exposes from the
+           storage back-end batch by batch, ahead of the already-seen filter"""
+        self.processors.append(PrefetchProcessedProcessor(self.config, id_watch))
+        return self
+
     def build(self):
         """Build the processor chain"""
-        return ProcessorChain(self.processors)
+        batch_size = self.config.pipeline_batch_size()
+        batch_timeout = self.config.pipeline_batch_timeout()
+        pipeline = None
+        if self.config.staged_pipeline():
+            pipeline = StagedPipeline(self.processors, self.config.pipeline_queue_size(),
+                                      batch_size, batch_timeout)
+        return ProcessorChain(self.processors, pipeline, batch_size, batch_timeout)
 
 class ProcessorChain:
     """Class to hold a chain of processors"""
     processors: List[Processor]
 
-    def __init__(self, processors):
+    def __init__(self, processors, pipeline: Optional[StagedPipeline] = None,
+                 batch_size: Optional[int] = None, batch_timeout: Optional[float] = None):
         self.processors = processors
+        self.pipeline = pipeline
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
 
-    def process(self, exposes):
-        """Process the sequences of exposes with the processor chain"""
-        return reduce((lambda exposes, processor: processor.process_exposes(exposes)),
-                      self.processors, exposes)
+    def process(self, exposes, profile: Optional[CycleProfile] = None):
+        """Process the sequences of exposes with the processor chain. With a
+           staged pipeline, the processors run concurrently. Processors that
+           support batches are passed batches of exposes. If a profile is
+           supplied, the processors are timed"""
+        if self.pipeline is not None:
+            return self.pipeline.process(exposes, profile)
+        def step(exposes, processor):
+            apply = partial(apply_processor, processor=processor, batch_size=self.batch_size,
+                            batch_timeout=self.batch_timeout)
+            if profile is None:
+                return apply(exposes)
+            return profile.instrument(type(processor).__name__, exposes, apply)
+        return reduce(step, self.processors, exposes)
 
     @staticmethod
     def builder(config):
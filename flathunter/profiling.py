@@ -0,0 +1,129 @@
+"""Timing and throughput of the stages of a crawl cycle. The crawlers and the
+   processors of the pipeline are measured per cycle, for a log line at the
+   end of the cycle, and in the global metrics"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator
+
+from flathunter import metrics
+from flathunter.logging import logger
+from flathunter.utils.list import IDLE
+
+
+class StageStats:
+    """Counts and time of a stage in one cycle"""
+
+    def __init__(self, seconds: float = 0.0, exposes_in: int = 0, exposes_out: int = 0,
+                 errors: int = 0):
+        self.exposes_in = exposes_in
+        self.exposes_out = exposes_out
+        self.errors = errors
+        self.seconds = seconds
+
+    def add(self, other: 'StageStats') -> None:
+        """Add the counts and time of another measurement"""
+        self.seconds += other.seconds
+        self.exposes_in += other.exposes_in
+        self.exposes_out += other.exposes_out
+        self.errors += other.errors
+
+    def to_dict(self) -> Dict:
+        """The stats, for the cycle log line"""
+        return {'in': self.exposes_in, 'out': self.exposes_out,
+                'errors': self.errors, 'seconds': round(self.seconds, 3)}
+
+
+class CycleProfile:
+    """
+    Collects the stage statistics of one cycle. The time of a processor is the
+    time spent in the processor itself, without the time it waited for the
+    exposes from the stages before it. Safe to use from several threads
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.stages: Dict[str, StageStats] = {}
+        self.__lock = threading.Lock()
+
+    def record(self, stage: str, stats: StageStats, observe: bool = True) -> None:
+        """Add a measurement to the statistics of a stage"""
+        with self.__lock:
+            self.stages.setdefault(stage, StageStats()).add(stats)
+        if observe:
+            metrics.STAGE_SECONDS.observe(stats.seconds, stage=stage)
+        if stats.exposes_in > 0:
+            metrics.STAGE_EXPOSES_IN.inc(stats.exposes_in, stage=stage)
+        if stats.exposes_out > 0:
+            metrics.STAGE_EXPOSES_OUT.inc(stats.exposes_out, stage=stage)
+        if stats.errors > 0:
+            metrics.STAGE_ERRORS.inc(stats.errors, stage=stage)
+
+    @contextmanager
+    def measure(self, stage: str):
+        """Time a block, such as a crawl. The block can set 'exposes_in' and
+           'exposes_out' on the yielded stats"""
+        stats = StageStats()
+        start = time.perf_counter()
+        try:
+            yield stats
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.seconds = time.perf_counter() - start
+            self.record(stage, stats)
+
+    def instrument(self, stage: str, exposes: Iterable,
+                   apply: Callable[[Iterable], Iterable]) -> Iterator:
+        """Apply a processing step to the exposes, measuring the exposes going in
+           and out, and the time spent in the step for each expose it passes on"""
+        waited = [0.0]
+        upstream_failed = [False]
+
+        def incoming():
+            source = iter(exposes)
+            while True:
+                start = time.perf_counter()
+                try:
+                    expose = next(source)
+                except StopIteration:
+                    return
+                except Exception:
+                    upstream_failed[0] = True
+                    raise
+                finally:
+                    waited[0] += time.perf_counter() - start
+                if expose is not IDLE:
+                    self.record(stage, StageStats(exposes_in=1), observe=False)
+                yield expose
+
+        outgoing = iter(apply(incoming()))
+        while True:
+            waited[0] = 0.0
+            start = time.perf_counter()
+            try:
+                expose = next(outgoing)
+            except StopIteration:
+                self.record(stage, StageStats(time.perf_counter() - start - waited[0]),
+                            observe=False)
+                return
+            except Exception:
+                self.record(stage, StageStats(time.perf_counter() - start - waited[0],
+                                              errors=0 if upstream_failed[0] else 1),
+                            observe=False)
+                raise
+            self.record(stage, StageStats(time.perf_counter() - start - waited[0],
+                                          exposes_out=1))
+            yield expose
+
+    def summary(self) -> Dict:
+        """Statistics of the cycle so far"""
+        with self.__lock:
+            stages = {name: stats.to_dict() for name, stats in self.stages.items()}
+        return {'seconds': round(time.monotonic() - self.started, 3), 'stages': stages}
+
+    def log(self) -> None:
+        """Write the statistics of the cycle as a single log line"""
+        logger.info("Cycle profile: %s", json.dumps(self.summary()))
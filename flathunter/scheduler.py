@@ -0,0 +1,198 @@
+"""Runs the jobs of the command-line loop - crawls and heartbeats - at their
+   planned times. The times are kept on the monotonic clock, in a heap, so a
+   job fires when it is due, no matter how long the other jobs take"""
+import heapq
+import itertools
+import random
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple, Union
+
+from flathunter import metrics
+from flathunter.logging import logger
+
+
+@dataclass
+class Interval:
+    """The interval of a job that runs at a fixed rate. With jitter, up to ten
+       percent of the interval are added at random to each run"""
+    seconds: float
+    jitter: bool = False
+
+
+@dataclass
+class Clock:
+    """The time source of a scheduler"""
+    now: Callable[[], float] = time.monotonic
+    sleep: Callable[[float], None] = time.sleep
+
+
+class Job:
+    """
+    A function that is run repeatedly. Jobs with an interval run at a fixed
+    rate: every run is planned one interval after the previous planned run.
+    Jobs without an interval return the delay until their next run, or None
+    to stop. Jobs in the background run on the worker pool of the scheduler
+    """
+
+    def __init__(self, name: str, func: Callable, interval: Optional[Interval] = None,
+                 background: bool = False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.background = background
+        self.next_run = 0.0
+        self.cancelled = False
+        # The latest run of a background job
+        self.running: Optional[Future] = None
+
+    def cancel(self) -> None:
+        """Do not run the job again"""
+        self.cancelled = True
+
+    def __repr__(self):
+        return f"Job({self.name})"
+
+
+class Scheduler:
+    """
+    Keeps the planned runs of the jobs in a heap, and runs each job once it is
+    due. If a pause is configured, jobs that come due in the pause are put off
+    until its end. A job that misses runs, because it or the jobs before it
+    took too long, runs once and continues at its regular times. Background
+    jobs run on a pool of worker threads; a run that comes due while the
+    previous run of the job is still going is skipped
+    """
+
+    # Largest random delay added to the interval of jobs with jitter
+    JITTER = 0.1
+
+    def __init__(self, pause: Optional[Callable[[], float]] = None,
+                 clock: Optional[Clock] = None, workers: int = 4):
+        """
+        :param pause: returns the seconds until the end of the current pause,
+                      or 0 outside of pauses
+        :param clock: the time source, the monotonic clock by default
+        :param workers: number of threads for the background jobs
+        """
+        self.pause = pause
+        self.clock = clock or Clock()
+        self.workers = workers
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__heap: List[Tuple[float, int, Job]] = []
+        self.__sequence = itertools.count()
+        self.__paused_until: Optional[float] = None
+
+    def every(self, interval: Union[float, Interval], func: Callable, name: str,
+              delay: float = 0.0, background: bool = False) -> Job:
+        """Run the function every interval, given as an Interval or in seconds,
+           starting after the delay"""
+        if not isinstance(interval, Interval):
+            interval = Interval(interval)
+        job = Job(name, func, interval, background)
+        self.__push(job, self.clock.now() + delay)
+        return job
+
+    def schedule(self, func: Callable[[], Optional[float]], name: str,
+                 delay: float = 0.0) -> Job:
+        """Run the function after the delay, and again after the delay it returns"""
+        job = Job(name, func)
+        self.__push(job, self.clock.now() + delay)
+        return job
+
+    def __push(self, job: Job, next_run: float) -> None:
+        job.next_run = next_run
+        heapq.heappush(self.__heap, (next_run, next(self.__sequence), job))
+
+    def jobs(self) -> List[Job]:
+        """The scheduled jobs, in the order of their next run"""
+        return [job for _, _, job in sorted(self.__heap) if not job.cancelled]
+
+    def seconds_until_next(self) -> Optional[float]:
+        """Time until the next job is due, None if there are no jobs"""
+        while len(self.__heap) > 0 and self.__heap[0][2].cancelled:
+            heapq.heappop(self.__heap)
+        if len(self.__heap) == 0:
+            return None
+        return max(0.0, self.__heap[0][0] - self.clock.now())
+
+    def run_pending(self) -> None:
+        """Run all jobs that are due"""
+        while len(self.__heap) > 0 and self.__heap[0][0] <= self.clock.now():
+            planned, _, job = heapq.heappop(self.__heap)
+            if job.cancelled:
+                continue
+            paused = self.pause() if self.pause is not None else 0
+            if paused > 0:
+                self.__defer(job, paused)
+                continue
+            self.__run(job, planned)
+
+    def __defer(self, job: Job, paused: float) -> None:
+        """Put off a job until the end of the pause"""
+        resume = self.clock.now() + paused
+        if self.__paused_until is None or resume > self.__paused_until + 1:
+            logger.info("Paused loop. Waiting %d seconds.", paused)
+            self.__paused_until = resume
+        self.__push(job, resume)
+
+    def __run(self, job: Job, planned: float) -> None:
+        """Run a job, and plan its next run"""
+        if job.background:
+            self.__submit(job)
+            result = None
+        else:
+            logger.debug("Running %s", job)
+            result = job.func()
+        if job.cancelled:
+            return
+        if job.interval is None:
+            if result is not None:
+                self.__push(job, self.clock.now() + result)
+            return
+        interval = job.interval.seconds
+        if job.interval.jitter:
+            interval += random.uniform(0, self.JITTER * job.interval.seconds)
+        next_run = planned + interval
+        now = self.clock.now()
+        if next_run < now:
+            missed = int((now - next_run) // job.interval.seconds) + 1
+            logger.info("%s took too long, skipping %d runs", job, missed)
+            next_run += missed * job.interval.seconds
+        self.__push(job, next_run)
+
+    def __submit(self, job: Job) -> None:
+        """Start a run of a background job, unless the previous one is still going"""
+        if job.running is not None and not job.running.done():
+            logger.info("%s is still running, skipping this run", job)
+            metrics.SKIPPED_RUNS.inc(job=job.name)
+            return
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                 thread_name_prefix='scheduler')
+        logger.debug("Starting %s", job)
+        job.running = self.__executor.submit(job.func)
+        job.running.add_done_callback(lambda future: self.__done(job, future))
+
+    @staticmethod
+    def __done(job: Job, future: Future) -> None:
+        """Log the failure of a background job. The job keeps its schedule"""
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("%s failed", job, exc_info=future.exception())
+
+    def run(self, until: Optional[Callable[[], bool]] = None) -> None:
+        """Run the jobs as they come due, until there are no more jobs or the
+           'until' condition is met. Then waits for the background jobs"""
+        try:
+            while until is None or not until():
+                self.run_pending()
+                delay = self.seconds_until_next()
+                if delay is None:
+                    return
+                if delay > 0:
+                    self.clock.sleep(delay)
+        finally:
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=True)
+                self.__executor = None
@@ -0,0 +1,282 @@
+"""Local stand-ins for the external services that flathunter calls - the
+   Telegram Bot API, the Google Maps Distance Matrix API, Slack and Mattermost
+   webhooks, and the 2Captcha and Capmonster captcha solvers. They answer like
+   the real services, without sending anything, so recorded crawls can be
+   replayed offline and notification dispatch can be load tested. Latency,
+   rate limiting (429) and failures can be injected at configurable rates.
+   Requests are counted by service and status.
+
+   Run them on their own with `python -m flathunter.stand_ins`, and point
+   flathunt.py at them with `--stand-ins http://127.0.0.1:8099`"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from flathunter.logging import logger
+
+
+def point_at_stand_ins(config, base_url: str) -> None:
+    """Send the requests to external services to the stand-ins at base_url,
+       in place of the URLs from the config file or the environment. Apprise
+       and ImageTyperz cannot be sent to the stand-ins, so they are disabled.
+       Google Maps is only redirected if configured"""
+    base_url = base_url.rstrip('/')
+    if 'apprise' in (config.notifiers() or []):
+        logger.warning("Apprise notifications cannot be sent to the stand-ins, "
+                       "and are disabled")
+    config.set_stand_ins_url(base_url)
+    if config.config.get('google_maps_api') is not None:
+        config.config['google_maps_api']['url'] = (
+            base_url + "/maps/api/distancematrix/json?origins={origin}"
+            "&destinations={dest}&mode={mode}&sensor=true&key={key}&arrival_time={arrival}")
+    logger.info("Sending requests to external services to the stand-ins at %s. "
+                "ImageTyperz is not used for captchas", base_url)
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Answers the requests for all stand-in services"""
+
+    server: 'StandInServer'
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Answer a GET request"""
+        self.__answer(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self): # pylint: disable=invalid-name
+        """Answer a POST request. Form-encoded and JSON bodies are understood"""
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        params = parse_qs(urlparse(self.path).query)
+        try:
+            decoded = json.loads(body or '{}')
+            if isinstance(decoded, dict):
+                params.update({key: [value] for key, value in decoded.items()})
+        except json.JSONDecodeError:
+            params.update(parse_qs(body))
+        self.__answer(params)
+
+    def __answer(self, params: Dict[str, List]):
+        status, body, headers = self.server.answer(urlparse(self.path).path, params)
+        if isinstance(body, str):
+            content, content_type = body.encode('utf-8'), 'text/plain'
+        else:
+            content, content_type = json.dumps(body).encode('utf-8'), 'application/json'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        """Keep the requests out of the log"""
+        logger.debug("Stand-in request: " + format, *args)
+
+
+@dataclass
+class Faults:
+    """
+    The faults that the stand-ins inject. Every request is delayed by the
+    latency; then it is rejected with a 429 at the throttle rate, or fails
+    with a 500 at the failure rate
+    """
+    # Seconds that every answer is delayed
+    latency: float = 0.0
+    # Share of the requests that are rejected with a 429
+    throttle_rate: float = 0.0
+    # Share of the requests that fail with a 500
+    failure_rate: float = 0.0
+    # Seconds to wait after a 429, as told to the client
+    retry_after: int = 1
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Serves the stand-in services from a background thread, injecting faults"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 faults: Optional[Faults] = None, seed: Optional[int] = None):
+        """
+        :param faults: the faults to inject, none by default
+        :param seed: seed of the random draws of the faults
+        """
+        super().__init__((host, port), _StandInHandler)
+        self.faults = faults or Faults()
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__requests: Counter = Counter()
+        self.__next_id = 0
+        self.__captchas: Dict[str, str] = {}
+        self.__thread = threading.Thread(
+            target=self.serve_forever, name='stand-ins', daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        """The URL that replaces the base URL of the real services"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'StandInServer':
+        """Start serving in the background"""
+        self.__thread.start()
+        logger.info("Serving stand-in services on %s", self.base_url)
+        return self
+
+    def stop(self) -> None:
+        """Stop serving"""
+        self.shutdown()
+        self.server_close()
+
+    def configure(self, config) -> None:
+        """Point the external services of the config at the stand-ins"""
+        point_at_stand_ins(config, self.base_url)
+
+    def requests(self, service: str, status: Optional[int] = None) -> int:
+        """Number of requests to a service, or of its answers with the given status"""
+        with self.__lock:
+            if status is not None:
+                return self.__requests[(service, status)]
+            return sum(count for (counted, _), count in self.__requests.items()
+                       if counted == service)
+
+    def __new_id(self) -> int:
+        with self.__lock:
+            self.__next_id += 1
+            return self.__next_id
+
+    def __fault(self) -> Optional[int]:
+        """The status of an injected fault, or None"""
+        with self.__lock:
+            draw = self.__random.random()
+        if draw < self.faults.throttle_rate:
+            return 429
+        if draw < self.faults.throttle_rate + self.faults.failure_rate:
+            return 500
+        return None
+
+    def answer(self, path: str, params: Dict[str, List]) -> Tuple[int, Any, Dict[str, str]]:
+        """The status, body and headers of the answer to a request"""
+        service, handler = self.__route(path)
+        if handler is None:
+            return 404, {'ok': False, 'description': 'Not Found'}, {}
+        if self.faults.latency > 0:
+            time.sleep(self.faults.latency)
+        status = self.__fault()
+        if status == 429:
+            retry_after = self.faults.retry_after
+            body: Any = {'ok': False, 'error_code': 429,
+                         'description': f"Too Many Requests: retry after {retry_after}",
+                         'parameters': {'retry_after': retry_after}}
+            headers = {'Retry-After': str(retry_after)}
+        elif status == 500:
+            body, headers = {'ok': False, 'error_code': 500,
+                             'description': 'Internal Server Error'}, {}
+        else:
+            status, body, headers = 200, handler(path, params), {}
+        with self.__lock:
+            self.__requests[(service, status)] += 1
+        return status, body, headers
+
+    def __route(self, path: str):
+        """The service and handler for a request path"""
+        if path.startswith('/bot'):
+            return 'telegram', self.telegram
+        if path == '/maps/api/distancematrix/json':
+            return 'distance_matrix', self.distance_matrix
+        routes = {'slack': self.webhook, 'mattermost': self.webhook,
+                  '2captcha': self.twocaptcha, 'capmonster': self.capmonster}
+        service = path.strip('/').split('/')[0]
+        return service, routes.get(service)
+
+    def telegram(self, path: str, params: Dict[str, List]) -> Dict:
+        """Answer a Bot API call with the messages that would have been sent"""
+        method = path.rsplit('/', 1)[-1]
+        chat = {'id': int((params.get('chat_id') or ['0'])[0])}
+        if method == 'sendMediaGroup':
+            media = json.loads((params.get('media') or ['[]'])[0])
+            return {'ok': True, 'result': [
+                {'message_id': self.__new_id(), 'chat': chat,
+                 'photo': [{'file_id': f"stand-in-{index}"}]}
+                for index, _ in enumerate(media)]}
+        return {'ok': True, 'result': {'message_id': self.__new_id(), 'chat': chat}}
+
+    @staticmethod
+    def distance_matrix(_path: str, params: Dict[str, List]) -> Dict:
+        """Answer a Distance Matrix query with the same duration for every pair"""
+        origins = (params.get('origins') or [''])[0].split('|')
+        destinations = (params.get('destinations') or [''])[0].split('|')
+        element = {'status': 'OK',
+                   'distance': {'text': '5.0 km', 'value': 5000},
+                   'duration': {'text': '15 mins', 'value': 900}}
+        return {'status': 'OK', 'origin_addresses': origins,
+                'destination_addresses': destinations,
+                'rows': [{'elements': [element] * len(destinations)} for _ in origins]}
+
+    @staticmethod
+    def webhook(_path: str, _params: Dict[str, List]) -> str:
+        """Accept a Slack or Mattermost webhook message"""
+        return 'ok'
+
+    def twocaptcha(self, path: str, params: Dict[str, List]) -> str:
+        """Accept a 2Captcha task, and solve it at once"""
+        if path.endswith('/in.php'):
+            captcha_id = str(self.__new_id())
+            with self.__lock:
+                self.__captchas[captcha_id] = (params.get('method') or [''])[0]
+            return f"OK|{captcha_id}"
+        with self.__lock:
+            method = self.__captchas.pop((params.get('id') or [''])[0], None)
+        if method is None:
+            return 'ERROR_WRONG_CAPTCHA_ID'
+        if method == 'geetest':
+            return 'OK|' + json.dumps({'geetest_challenge': 'stand-in',
+                                       'geetest_validate': 'stand-in',
+                                       'geetest_seccode': 'stand-in'})
+        return 'OK|stand-in-token'
+
+    def capmonster(self, path: str, _params: Dict[str, List]) -> Dict:
+        """Accept a Capmonster task, and solve it at once"""
+        if path.endswith('/createTask'):
+            return {'errorId': 0, 'taskId': self.__new_id()}
+        return {'errorId': 0, 'status': 'ready',
+                'solution': {'cookies': {'aws-waf-token': 'stand-in-token'}}}
+
+
+def main():
+    """Serve the stand-ins until interrupted"""
+    parser = argparse.ArgumentParser(
+        description="Local stand-ins for the services that flathunter calls")
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8099, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds that every answer is delayed')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='Share of the requests that are rejected with a 429')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Share of the requests that fail with a 500')
+    parser.add_argument('--retry-after', type=int, default=1,
+                        help='Seconds to wait after a 429, as told to the client')
+    args = parser.parse_args()
+    server = StandInServer(args.host, args.port, Faults(args.latency, args.throttle_rate,
+                                                        args.failure_rate, args.retry_after))
+    print(f"Serving stand-ins on {server.base_url} - "
+          f"start flathunt.py with --stand-ins {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
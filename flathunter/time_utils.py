@@ -25,6 +25,13 @@ def get_time_span_in_secs(time_a, time_b):
     return (24*60*60) - a_secs + b_secs
 
 
+def seconds_until_end_of_period(time_from, time_till) -> int:
+    """Seconds until the end of the pause period, or 0 if it is not paused."""
+    if not is_current_time_between(time_from, time_till):
+        return 0
+    return get_time_span_in_secs(datetime.now().time(), time_till)
+
+
 def wait_during_period(time_from, time_till):
     """Waits for the end of the pause period if necessary."""
     if is_current_time_between(time_from, time_till):
@@ -0,0 +1,67 @@
+"""Thread-safe, size-bounded LRU cache with an optional time-to-live"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# Returned by 'get' for keys that are not cached, so that None can be cached
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Least-recently-used cache. Entries expire 'ttl' seconds after they were
+    written; with a ttl of None they only leave the cache when it is full
+    """
+
+    def __init__(self,
+                 capacity: int = 1024,
+                 ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        self.__entries: OrderedDict = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """
+        Look up a key, marking it as recently used
+        :param key: the cache key
+        :param default: returned if the key is missing or has expired
+        :return: the cached value or the default
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires is not None and expires <= self.clock():
+                del self.__entries[key]
+                return default
+            self.__entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entry if the cache is full"""
+        with self.__lock:
+            expires = None if self.ttl is None else self.clock() + self.ttl
+            self.__entries[key] = (expires, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.capacity:
+                self.__entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Remove a key from the cache, if present"""
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def clear(self):
+        """Remove all entries"""
+        with self.__lock:
+            self.__entries.clear()
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__entries)
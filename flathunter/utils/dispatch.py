@@ -0,0 +1,81 @@
+"""Thread pool that runs tasks in parallel while keeping per-key ordering"""
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Hashable, List, Set, Tuple
+
+
+class KeyedDispatcher:
+    """
+    Runs tasks on a pool of worker threads. Tasks submitted with the same key
+    run one at a time, in the order they were submitted; tasks with different
+    keys run in parallel. Exceptions raised by tasks are collected and
+    re-raised by 'join'
+    """
+
+    def __init__(self, max_workers: int, name: str = 'dispatch'):
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers,
+                                             thread_name_prefix=name)
+        self.__condition = threading.Condition()
+        self.__queues: Dict[Hashable, Deque[Tuple[Callable, Tuple]]] = {}
+        self.__active: Set[Hashable] = set()
+        self.__errors: List[Exception] = []
+        self.__pending = 0
+
+    def submit(self, key: Hashable, func: Callable[..., Any], *args) -> None:
+        """
+        Queue a task
+        :param key: tasks with equal keys are run sequentially
+        :param func: the task
+        :param args: arguments for the task
+        :return: None
+        """
+        with self.__condition:
+            self.__queues.setdefault(key, deque()).append((func, args))
+            self.__pending += 1
+            if key in self.__active:
+                return
+            self.__active.add(key)
+        self.__executor.submit(self.__drain, key)
+
+    def __drain(self, key: Hashable) -> None:
+        """Run the queued tasks for a key until its queue is empty"""
+        while True:
+            with self.__condition:
+                queue = self.__queues[key]
+                if len(queue) == 0:
+                    del self.__queues[key]
+                    self.__active.discard(key)
+                    return
+                func, args = queue.popleft()
+            try:
+                func(*args)
+            except Exception as error: # pylint: disable=broad-except
+                with self.__condition:
+                    self.__errors.append(error)
+            finally:
+                with self.__condition:
+                    self.__pending -= 1
+                    self.__condition.notify_all()
+
+    def join(self) -> None:
+        """
+        Wait for all submitted tasks to finish
+        :raise Exception: the first exception raised by a task since the last join
+        """
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__pending == 0)
+            errors, self.__errors = self.__errors, []
+        if len(errors) > 0:
+            raise errors[0]
+
+    def close(self) -> None:
+        """Wait for running tasks and stop the worker threads"""
+        self.__executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
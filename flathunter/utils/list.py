@@ -1,9 +1,14 @@
-"""Utility type for chunking lists"""
+"""Utility type for chunking lists and streams"""
 
-from typing import List, TypeVar, Generator
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, TypeVar, Generator
 
 CLT = TypeVar("CLT")
 
+# Can be yielded by a stream that has nothing to deliver yet, so that
+# 'chunk_stream' can flush a batch that has waited too long
+IDLE = object()
+
 def chunk_list(list_var: List[CLT], size: int) -> Generator[List[CLT], None, None]:
     """
     split a list into the given chunk size
@@ -13,3 +18,29 @@ def chunk_list(list_var: List[CLT], size: int) -> Generator[List[CLT], None, Non
     """
     for i in range(0, len(list_var), size):
         yield list_var[i:i + size]
+
+def chunk_stream(items: Iterable, size: int, timeout: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic) -> Iterator[List]:
+    """
+    split a stream into chunks of up to the given size. A chunk is also emitted
+    once its first item has waited longer than the timeout, which is checked
+    whenever an item (or the IDLE marker) arrives
+    :param items: input stream, which may contain IDLE markers
+    :param size: maximum chunk size
+    :param timeout: seconds after which an incomplete chunk is emitted
+    :return: generator of chunks
+    """
+    chunk: List = []
+    started = 0.0
+    for item in items:
+        if item is not IDLE:
+            if len(chunk) == 0:
+                started = clock()
+            chunk.append(item)
+        if len(chunk) == 0:
+            continue
+        if len(chunk) >= size or (timeout is not None and clock() - started >= timeout):
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
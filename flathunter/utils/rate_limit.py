@@ -0,0 +1,48 @@
+"""Thread-safe token bucket rate limiter"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TokenBucket:
+    """
+    Token bucket allowing 'rate' operations per second on average, with bursts
+    of up to 'capacity' operations. Callers that find the bucket empty reserve
+    the next token and sleep until it is due, so waiting callers are served
+    in order
+    """
+
+    def __init__(self,
+                 rate: float,
+                 capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.__tokens = self.capacity
+        self.__updated = clock()
+        self.__lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take a token from the bucket
+        :return: the number of seconds until the token may be used
+        """
+        with self.__lock:
+            now = self.clock()
+            self.__tokens = min(self.capacity,
+                                self.__tokens + (now - self.__updated) * self.rate)
+            self.__updated = now
+            self.__tokens -= 1
+            if self.__tokens >= 0:
+                return 0
+            return -self.__tokens / self.rate
+
+    def acquire(self) -> None:
+        """Take a token from the bucket, waiting until it is available"""
+        delay = self.reserve()
+        if delay > 0:
+            self.sleep(delay)
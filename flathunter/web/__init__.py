@@ -8,3 +8,4 @@ log = create_logger(app)
 
 import flathunter.web.views
 import flathunter.web.stats
+import flathunter.web.metrics
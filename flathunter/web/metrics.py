@@ -0,0 +1,10 @@
+"""Flask endpoint exposing the runtime metrics to Prometheus"""
+from flask import Response
+
+from flathunter import metrics
+from flathunter.web import app
+
+@app.route('/metrics')
+def metrics_view():
+    """Render all metrics in the Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
@@ -70,9 +70,10 @@ def filter_values_for_user():
 
 def filter_for_user():
     """Load the filter for the current user"""
-    if filter_values_for_user() is None:
+    filters = filter_values_for_user()
+    if filters is None:
         return None
-    return FilterBuilder().read_config(YamlConfig({'filters': filter_values_for_user()})).build()
+    return FilterBuilder().read_config(YamlConfig({'filters': filters})).build()
 
 def form_filter_values():
     """Extract the filter settings from the submitted form"""
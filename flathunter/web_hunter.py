@@ -1,35 +1,77 @@
 """Flathunter implementation for website"""
+from typing import Iterable, Optional, Tuple
+
+from flathunter import expose_statistics, metrics
+from flathunter.abstract_crawler import Crawler
 from flathunter.config import YamlConfig
 from flathunter.logging import logger
 from flathunter.hunter import Hunter
 from flathunter.filter import Filter
 from flathunter.processor import ProcessorChain
+from flathunter.profiling import CycleProfile
 from flathunter.exceptions import BotBlockedException, UserDeactivatedException
+from flathunter.utils.cache import LRUCache, MISSING
 
 class WebHunter(Hunter):
     """Flathunter implementation for website. Designed to hunt all exposes from
        all sites and save them to the database. Includes support for multiple users
        with individual filters implemented in-app"""
 
-    def hunt_flats(self, max_pages=1):
-        """Crawl all URLs, and send notifications to users of new flats"""
+    # User settings are cached in-process, shared by all requests to this worker.
+    # The TTL bounds how long other workers' writes can go unnoticed.
+    SETTINGS_CACHE_SIZE = 1024
+    SETTINGS_CACHE_TTL = 300
+
+    # Statistics change with every new expose, but the page doesn't need to
+    # reflect them immediately
+    STATISTICS_CACHE_TTL = 300
+
+    def __init__(self, config: YamlConfig, id_watch):
+        super().__init__(config, id_watch)
+        self.settings_cache = LRUCache(capacity=self.SETTINGS_CACHE_SIZE,
+                                       ttl=self.SETTINGS_CACHE_TTL)
+        self.statistics_cache = LRUCache(capacity=8, ttl=self.STATISTICS_CACHE_TTL)
+
+    def __settings_for_user(self, user_id):
+        """Load the settings for a user, from the cache if possible. The returned
+           dictionary is shared with the cache and must not be modified"""
+        settings = self.settings_cache.get(user_id)
+        if settings is MISSING:
+            settings = self.id_watch.get_settings_for_user(user_id)
+            self.settings_cache.put(user_id, settings)
+        return settings
+
+    def __save_settings_for_user(self, user_id, settings):
+        """Write the settings to the database and the cache"""
+        self.id_watch.save_settings_for_user(user_id, settings)
+        self.settings_cache.put(user_id, settings)
+
+    def hunt_flats(self, max_pages=1, searches: Optional[Iterable[Tuple[Crawler, str]]] = None):
+        """Crawl all URLs, or only the given searches, and send notifications
+           to users of new flats"""
         filter_set = Filter.builder() \
                        .read_config(self.config) \
                        .filter_already_seen(self.id_watch) \
                        .build()
 
         processor_chain = ProcessorChain.builder(self.config) \
+                                        .prefetch_processed(self.id_watch) \
                                         .apply_filter(filter_set) \
                                         .crawl_expose_details() \
                                         .save_all_exposes(self.id_watch) \
-                                        .resolve_addresses() \
-                                        .calculate_durations() \
+                                        .resolve_addresses(self.id_watch) \
+                                        .calculate_durations(self.id_watch) \
                                         .send_messages() \
                                         .build()
 
+        profile = CycleProfile()
+        exposes = self.crawl_for_exposes(max_pages, profile, searches)
+
         new_exposes = []
-        for expose in processor_chain.process(self.crawl_for_exposes(max_pages=max_pages)):
+        for expose in processor_chain.process(exposes, profile):
+            metrics.NEW_EXPOSES.inc(crawler=expose.get('crawler', 'unknown'))
             new_exposes.append(expose)
+        self.id_watch.flush()
 
         for (user_id, settings) in self.id_watch.get_user_settings():
             if 'mute_notifications' in settings:
@@ -40,19 +82,20 @@ class WebHunter(Hunter):
                                                 .apply_filter(filter_set) \
                                                 .send_messages([user_id]) \
                                                 .build()
-                for message in processor_chain.process(new_exposes):
+                for message in processor_chain.process(new_exposes, profile):
                     logger.debug("Sent expose %d to user %d", message['id'], user_id)
             except BotBlockedException:
                 logger.warning("Bot has been blocked by user %d - updating settings", user_id)
                 settings["mute_notifications"] = True
-                self.id_watch.save_settings_for_user(user_id, settings)
+                self.__save_settings_for_user(user_id, settings)
             except UserDeactivatedException:
                 logger.warning(
                     "User %d has deactivated their telegram account - updating settings", user_id)
                 settings["mute_notifications"] = True
-                self.id_watch.save_settings_for_user(user_id, settings)
+                self.__save_settings_for_user(user_id, settings)
 
         self.id_watch.update_last_run_time()
+        profile.log()
         return list(new_exposes)
 
     def get_last_run_time(self):
@@ -67,17 +110,25 @@ class WebHunter(Hunter):
         """Return exposes since the provided datetime"""
         return self.id_watch.get_exposes_since(min_datetime)
 
+    def get_statistics_since(self, min_date):
+        """Return the per-day, per-crawler statistics since the provided date,
+           summarized for display on the website"""
+        statistics = self.statistics_cache.get(min_date)
+        if statistics is MISSING:
+            statistics = expose_statistics.summarize(
+                self.id_watch.get_statistics_since(min_date))
+            self.statistics_cache.put(min_date, statistics)
+        return statistics
+
     def set_filters_for_user(self, user_id, filters):
         """Set the filters for a given user"""
-        settings = self.id_watch.get_settings_for_user(user_id)
-        if settings is None:
-            settings = {}
+        settings = dict(self.__settings_for_user(user_id) or {})
         settings['filters'] = filters
-        self.id_watch.save_settings_for_user(user_id, settings)
+        self.__save_settings_for_user(user_id, settings)
 
     def get_filters_for_user(self, user_id):
         """Return the filters for a given user"""
-        settings = self.id_watch.get_settings_for_user(user_id)
+        settings = self.__settings_for_user(user_id)
         if settings is None:
             return None
         if 'filters' in settings:
@@ -86,16 +137,17 @@ class WebHunter(Hunter):
 
     def set_notification_status(self, user_id, receives_notifications):
         """Enable or disable notifications for a user"""
-        settings = self.id_watch.get_settings_for_user(user_id)
+        settings = self.__settings_for_user(user_id)
         if settings is None:
             if receives_notifications:
                 return
             settings = {}
+        settings = dict(settings)
         if 'mute_notifications' in settings and receives_notifications:
             del settings['mute_notifications']
         if 'mute_notifications' not in settings and not receives_notifications:
             settings['mute_notifications'] = True
-        self.id_watch.save_settings_for_user(user_id, settings)
+        self.__save_settings_for_user(user_id, settings)
 
     def toggle_notification_status(self, user_id):
         """Toggle notification status for the given user"""
@@ -105,7 +157,7 @@ class WebHunter(Hunter):
 
     def notifications_muted_for_user(self, user_id):
         """Returns true if the user has muted notifications"""
-        settings = self.id_watch.get_settings_for_user(user_id)
+        settings = self.__settings_for_user(user_id)
         if settings is None:
             return False
         return 'mute_notifications' in settings
@@ -1,6 +1,8 @@
 """Expose crawler for Kleinanzeigen"""
 from typing import Optional
+import contextlib
 import re
+import threading
 
 from selenium.webdriver import Chrome
 from bs4 import BeautifulSoup
@@ -13,15 +15,24 @@ from flathunter.logging import logger
 class WebdriverCrawler(Crawler):
     """Parent class of crawlers that use webdriver rather than `requests` to fetch pages"""
 
+    # Driving a browser is much slower, and more likely to run into captchas
+    CRAWL_COST = 4
+
     def __init__(self, config):
         super().__init__(config)
         self.config = config
         self.driver = None
+        # Held while the driver loads a page, by crawls and by the processors
+        self.driver_lock = threading.RLock()
 
     def get_driver(self) -> Optional[Chrome]:
         """Lazy method to fetch the driver as required at runtime"""
         if self.driver is not None:
             return self.driver
+        archive = self._page_archive()
+        if archive is not None and archive.replaying:
+            # Replayed pages come from the archive, there is no browser to start
+            return None
         driver_arguments = self.config.captcha_driver_arguments()
         self.driver = get_chrome_driver(driver_arguments)
         return self.driver
@@ -97,3 +108,12 @@ class WebdriverCrawler(Crawler):
         except Exception as e:  # pylint: disable=broad-except
             logger.warning("Error fetching details for expose %s: %s", expose.get('url', 'unknown'), str(e))
             return expose
+
+def hold_driver(searcher):
+    """Context manager to hold while the searcher loads a page. Every webdriver
+       crawler drives its own browser, which loads one page at a time - also
+       across crawls and processors that run at the same time. Other crawlers
+       load pages in parallel"""
+    if isinstance(searcher, WebdriverCrawler):
+        return searcher.driver_lock
+    return contextlib.nullcontext()
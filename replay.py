@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Replays a recorded page archive through the whole pipeline - crawling,
+   filtering, processing and notifying - without network access. Telegram and
+   Google Maps are answered by local stand-ins, which can be made slow or
+   unreliable to see how the pipeline copes. Prints the throughput and
+   latency of each cycle as JSON, to compare changes to the pipeline offline"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from flathunter.config import Config
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.logging import configure_logging
+from flathunter.page_archive import PageArchive
+from flathunter.stand_ins import Faults, StandInServer
+
+
+def parse():
+    """Processes and return command-line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Replays a recorded page archive through the flathunter pipeline")
+    parser.add_argument('--config', '-c',
+                        type=argparse.FileType('r', encoding='UTF-8'),
+                        default=f"{os.path.dirname(os.path.abspath(__file__))}/config.yaml",
+                        help='Config file with the searches and filters to replay')
+    parser.add_argument('--archive', '-a', required=True,
+                        help='Directory of the page archive, as recorded by flathunt.py')
+    parser.add_argument('--cycles', '-n', type=int, default=3,
+                        help='Number of times to replay the archive. Defaults to 3.')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds that every answer of the stand-ins is delayed')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='Share of the requests to the stand-ins rejected with a 429')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Share of the requests to the stand-ins that fail with a 500')
+    return parser.parse_args()
+
+
+def replay_cycle(config, database: str):
+    """Runs the searches once against an empty database; returns the new exposes"""
+    hunter = Hunter(config, IdMaintainer(database))
+    return hunter.hunt_flats()
+
+
+def main():
+    """Replays the archive, and prints a summary of every cycle"""
+    args = parse()
+    config = Config(args.config.name)
+    configure_logging(config)
+    config.init_searchers()
+    archive = PageArchive(args.archive, PageArchive.REPLAY)
+    config.set_page_archive(archive)
+    stand_ins = StandInServer(faults=Faults(latency=args.latency,
+                                            throttle_rate=args.throttle_rate,
+                                            failure_rate=args.failure_rate)).start()
+    stand_ins.configure(config)
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for cycle in range(args.cycles):
+                archive.rewind()
+                messages = stand_ins.requests('telegram')
+                distances = stand_ins.requests('distance_matrix')
+                start = time.perf_counter()
+                exposes = replay_cycle(config, os.path.join(directory, f"cycle-{cycle}.db"))
+                seconds = time.perf_counter() - start
+                print(json.dumps({
+                    'cycle': cycle,
+                    'seconds': round(seconds, 3),
+                    'exposes': len(exposes),
+                    'exposes_per_second': round(len(exposes) / seconds, 1) if seconds else None,
+                    'telegram_requests': stand_ins.requests('telegram') - messages,
+                    'distance_matrix_requests':
+                        stand_ins.requests('distance_matrix') - distances,
+                }))
+    finally:
+        stand_ins.stop()
+
+
+if __name__ == "__main__":
+    main()
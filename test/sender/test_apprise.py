@@ -1,6 +1,7 @@
 import json
 import unittest
 import requests_mock
+from unittest import mock
 
 from test.utils.config import StringConfig
 from flathunter.notifiers import SenderApprise
@@ -12,4 +13,24 @@ class SenderAppriseTest(unittest.TestCase):
     def test_send_no_message_if_no_receivers(self, m):
         config = StringConfig(string=json.dumps({"apprise": []}))
         sender = SenderApprise(config=config)
-        self.assertEqual(None, sender.notify("result"), "Expected no message to be sent")
\ No newline at end of file
+        self.assertEqual(None, sender.notify("result"), "Expected no message to be sent")
+
+    @mock.patch('flathunter.notifiers.sender_apprise.apprise.Apprise')
+    def test_apprise_object_is_reused(self, apprise_class):
+        config = StringConfig(string=json.dumps({
+            "apprise": ["json://localhost/one", "json://localhost/two"],
+            "message": "{title} for {price}",
+            "title": "New flat from {crawler}"
+        }))
+        apprise_object = apprise_class.return_value
+        apprise_object.__len__.return_value = 2
+        sender = SenderApprise(config=config)
+        exposes = [{"title": "Flat %d" % i, "price": "500", "crawler": "Dummy"} for i in range(3)]
+        self.assertEqual(exposes, list(sender.process_exposes(exposes)))
+        sender.notify("heartbeat")
+        apprise_class.assert_called_once()
+        self.assertEqual(2, apprise_object.add.call_count)
+        self.assertEqual(4, apprise_object.notify.call_count)
+        first_call = apprise_object.notify.call_args_list[0]
+        self.assertEqual("Flat 0 for 500", first_call.kwargs['body'])
+        self.assertEqual("New flat from Dummy", first_call.kwargs['title'])
@@ -0,0 +1,64 @@
+import unittest
+
+import requests_mock
+
+from flathunter.config import YamlConfig
+from flathunter.exceptions import ConfigException
+from flathunter.notifiers import SenderDigest, SenderSlack
+from flathunter.processor import ProcessorChain
+from test.utils.request_matcher import RequestCounter
+
+WEBHOOK_URL = "http://hooks.slack.com/dummy_webhook_url"
+
+
+def make_exposes(number):
+    return [{"id": i, "title": f"Flat {i}", "rooms": "2", "size": "50 m²",
+             "price": "800 €", "url": f"https://www.example.com/expose/{i}",
+             "address": "Berlin"} for i in range(number)]
+
+
+def make_config(**digest):
+    return YamlConfig({"notifiers": ["slack"],
+                       "slack": {"webhook_url": WEBHOOK_URL},
+                       "digest": {"threshold": 3, **digest}})
+
+
+class SenderDigestTest(unittest.TestCase):
+
+    @requests_mock.Mocker()
+    def test_small_crawls_are_sent_individually(self, m):
+        counter = RequestCounter()
+        m.post(WEBHOOK_URL, additional_matcher=counter.count)
+        config = make_config()
+        sender = SenderDigest(config, SenderSlack(config))
+        exposes = make_exposes(3)
+        self.assertEqual(exposes, list(sender.process_exposes(exposes)))
+        self.assertEqual(3, counter.i)
+
+    @requests_mock.Mocker()
+    def test_large_crawls_are_sent_as_digests(self, m):
+        counter = RequestCounter()
+        m.post(WEBHOOK_URL, additional_matcher=counter.count)
+        config = make_config(listings_per_message=10)
+        sender = SenderDigest(config, SenderSlack(config))
+        exposes = make_exposes(25)
+        self.assertEqual(exposes, list(sender.process_exposes(exposes)))
+        self.assertEqual(3, counter.i)
+        self.assertIn("25 new listings (3/3)", m.last_request.json()["text"])
+        self.assertIn("https://www.example.com/expose/24", m.last_request.json()["text"])
+
+    def test_summary_links_to_website(self):
+        config = YamlConfig({"digest": {"threshold": 3, "summary_only": True},
+                             "website": {"domain": "flathunter.example.com"}})
+        sender = SenderDigest(config, SenderSlack(config))
+        self.assertEqual(["25 new listings found.\nSee them all at https://flathunter.example.com/"],
+                         sender.digest_messages(make_exposes(25)))
+
+    def test_chain_uses_digest_when_configured(self):
+        chain = ProcessorChain.builder(make_config()).send_messages().build()
+        self.assertEqual(1, len(chain.processors))
+        self.assertIsInstance(chain.processors[0], SenderDigest)
+
+    def test_negative_threshold_is_rejected(self):
+        with self.assertRaises(ConfigException):
+            make_config(threshold=-1).digest_threshold()
@@ -1,16 +1,26 @@
 import json
+import threading
+import time
 import unittest
 import datetime
+from unittest import mock
+from urllib.parse import parse_qs
+
+import requests
 
 from requests_mock import Mocker
 from test.utils.request_matcher import RequestCounter
 from test.utils.config import StringConfig
 
+from flathunter.exceptions import BotBlockedException
 from flathunter.notifiers import SenderTelegram
 
 
 class SenderTelegramTest(unittest.TestCase):
 
+    def setUp(self):
+        SenderTelegram.reset_rate_limits()
+
     @Mocker()
     def test_send_message(self, m: Mocker):
         config = StringConfig(string=json.dumps({"telegram": {"bot_token": "dummy_token", "receiver_ids": [123]}}))
@@ -112,4 +122,142 @@ class SenderTelegramTest(unittest.TestCase):
         before = datetime.datetime.now()
         self.assertEqual(None, sender.notify("result"), "Expected no message to be sent")
         after = datetime.datetime.now()
-        self.assertEqual(2, (after - before).seconds)
\ No newline at end of file
+        self.assertEqual(2, (after - before).seconds)
+
+    def test_receivers_are_served_in_parallel(self):
+        c = StringConfig(string=json.dumps(
+            {"telegram": {"bot_token": "dummy_token", "receiver_ids": [1, 2, 3, 4]}}
+        ))
+        sender = SenderTelegram(config=c)
+
+        # requests_mock serialises requests, so stub out the transport instead
+        def slow_request(method, url, data=None, timeout=None):
+            time.sleep(0.5)
+            response = requests.Response()
+            response.status_code = 200
+            response._content = b'{"ok":true,"result":{"message_id":456}}'
+            return response
+
+        with mock.patch('flathunter.notifiers.sender_telegram.requests.request',
+                        side_effect=slow_request) as request:
+            before = time.monotonic()
+            self.assertIsNone(sender.notify("result"))
+            self.assertLess(time.monotonic() - before, 1.5)
+        self.assertEqual(4, request.call_count)
+
+    @Mocker()
+    def test_process_exposes_raises_when_bot_is_blocked(self, m: Mocker):
+        c = StringConfig(string=json.dumps(
+            {"telegram": {"bot_token": "dummy_token", "receiver_ids": [1234567]}}
+        ))
+        sender = SenderTelegram(config=c)
+        m.post('https://api.telegram.org/botdummy_token/sendMessage', status_code=403,
+               text='{"ok":false,"description":"Forbidden: bot was blocked by the user"}')
+        with self.assertRaises(BotBlockedException):
+            list(sender.process_exposes([{"id": 1, "title": "one"}]))
+
+    @Mocker()
+    def test_uploaded_images_are_reused_by_later_messages(self, m: Mocker):
+        c = StringConfig(string=json.dumps(
+            {"telegram": {"bot_token": "dummy_token", "receiver_ids": [1, 2, 3],
+                          "notify_with_images": "true"}}
+        ))
+        sender = SenderTelegram(config=c)
+        images = ["https://example.com/reused/1.jpg", "https://example.com/reused/2.jpg"]
+        media_group_response = json.dumps({"ok": True, "result": [
+            {"message_id": 10, "photo": [{"file_id": "small-1"}, {"file_id": "large-1"}]},
+            {"message_id": 11, "photo": [{"file_id": "small-2"}, {"file_id": "large-2"}]}
+        ]})
+        m.post('https://api.telegram.org/botdummy_token/sendMessage',
+               text='{"ok":true,"result":{"message_id":456}}')
+        m.post('https://api.telegram.org/botdummy_token/sendMediaGroup', text=media_group_response)
+
+        sender.process_expose({"title": "dummy title", "images": images})
+        first = len(m.request_history)
+        sender.process_expose({"title": "dummy title", "images": images})
+
+        media = [json.loads(parse_qs(request.text)['media'][0])
+                 for request in m.request_history[first:]
+                 if request.url.endswith('sendMediaGroup')]
+        self.assertEqual(3, len(media))
+        for later in media:
+            self.assertEqual(["large-1", "large-2"], [item['media'] for item in later])
+
+    @Mocker()
+    def test_images_are_uploaded_once_per_broadcast(self, m: Mocker):
+        c = StringConfig(string=json.dumps(
+            {"telegram": {"bot_token": "dummy_token", "receiver_ids": [1, 2, 3],
+                          "notify_with_images": "true"}}
+        ))
+        sender = SenderTelegram(config=c)
+        images = ["https://example.com/broadcast/1.jpg", "https://example.com/broadcast/2.jpg"]
+        m.post('https://api.telegram.org/botdummy_token/sendMessage',
+               text='{"ok":true,"result":{"message_id":456}}')
+        m.post('https://api.telegram.org/botdummy_token/sendMediaGroup', text=json.dumps(
+            {"ok": True, "result": [{"message_id": 10, "photo": [{"file_id": "id-1"}]},
+                                    {"message_id": 11, "photo": [{"file_id": "id-2"}]}]}))
+
+        sender.process_expose({"title": "dummy title", "images": images})
+
+        media = [[item['media'] for item in json.loads(parse_qs(request.text)['media'][0])]
+                 for request in m.request_history if request.url.endswith('sendMediaGroup')]
+        self.assertEqual(3, len(media))
+        self.assertEqual(1, len([sent for sent in media if sent == images]))
+        self.assertEqual(2, len([sent for sent in media if sent == ["id-1", "id-2"]]))
+
+    def test_receivers_do_not_wait_for_slow_uploads(self):
+        c = StringConfig(string=json.dumps(
+            {"telegram": {"bot_token": "dummy_token", "receiver_ids": [1, 2],
+                          "notify_with_images": "true"}}
+        ))
+        sender = SenderTelegram(config=c)
+        other_receiver_served = threading.Event()
+        waited = []
+        media = []
+
+        def post(method, url, data, timeout):
+            response = mock.Mock(status_code=200, content=b'')
+            if url.endswith('sendMessage'):
+                if data['chat_id'] == '2':
+                    other_receiver_served.set()
+                response.json.return_value = {"ok": True, "result": {"message_id": 456}}
+                return response
+            if data['chat_id'] == '1':
+                waited.append(other_receiver_served.wait(5))
+            media.append((data['chat_id'], json.loads(data['media'])[0]['media']))
+            response.json.return_value = {"ok": True, "result": [
+                {"message_id": 10, "photo": [{"file_id": "id"}]}]}
+            return response
+
+        with mock.patch('flathunter.notifiers.sender_telegram.requests.request', side_effect=post):
+            sender.process_expose({"title": "dummy title",
+                                   "images": ["https://example.com/slow.jpg"]})
+        self.assertEqual([True], waited)
+        self.assertEqual([('1', "https://example.com/slow.jpg"), ('2', "id")], media)
+
+    @Mocker()
+    def test_invalid_file_ids_fall_back_to_urls(self, m: Mocker):
+        c = StringConfig(string=json.dumps(
+            {"telegram": {"bot_token": "dummy_token", "receiver_ids": [1],
+                          "notify_with_images": "true"}}
+        ))
+        sender = SenderTelegram(config=c)
+        images = ["https://example.com/expired/1.jpg"]
+
+        def media_group(request, context):
+            media = json.loads(parse_qs(request.text)['media'][0])
+            if media[0]['media'] == 'expired-id':
+                context.status_code = 400
+                return '{"ok":false,"description":"Bad Request: wrong file identifier"}'
+            return '{"ok":true,"result":[{"message_id":10,"photo":[{"file_id":"expired-id"}]}]}'
+
+        m.post('https://api.telegram.org/botdummy_token/sendMessage',
+               text='{"ok":true,"result":{"message_id":456}}')
+        m.post('https://api.telegram.org/botdummy_token/sendMediaGroup', text=media_group)
+
+        sender.process_expose({"title": "dummy title", "images": images})
+        sender.process_expose({"title": "dummy title", "images": images})
+        media_requests = [request for request in m.request_history
+                          if request.url.endswith('sendMediaGroup')]
+        self.assertEqual(3, len(media_requests))
+        self.assertEqual(images[0], json.loads(parse_qs(media_requests[2].text)['media'][0])[0]['media'])
@@ -0,0 +1,94 @@
+import unittest
+
+from flathunter.adaptive_schedule import AdaptiveSchedule
+from flathunter.config import YamlConfig
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+from test.dummy_crawler import DummyCrawler
+
+
+class ExpensiveCrawler(DummyCrawler):
+    CRAWL_COST = 4
+
+
+class AdaptiveScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.cheap = DummyCrawler()
+        self.expensive = ExpensiveCrawler()
+
+    def schedule(self, searches):
+        return AdaptiveSchedule(searches, 600, 60, 3600, clock=lambda: self.now)
+
+    def test_searches_start_at_the_base_interval(self):
+        schedule = self.schedule([(self.cheap, 'a'), (self.cheap, 'b')])
+        self.assertEqual([600, 600], [search.interval for search in schedule.searches])
+
+    def test_expensive_searches_start_with_a_longer_interval(self):
+        schedule = self.schedule([(self.cheap, 'a'), (self.expensive, 'b')])
+        cheap, expensive = schedule.searches
+        schedule.record(cheap, 3)
+        schedule.record(expensive, 3)
+        self.assertEqual(600, cheap.interval)
+        self.assertEqual(2400, expensive.interval)
+
+    def test_busy_searches_run_more_often(self):
+        schedule = self.schedule([(self.cheap, 'busy'), (self.cheap, 'quiet')])
+        busy, quiet = schedule.searches
+        for _ in range(5):
+            schedule.record(busy, 20)
+            schedule.record(quiet, 0)
+            self.now += 600
+        self.assertEqual(60, busy.interval)
+        self.assertEqual(3600, quiet.interval)
+
+    def test_rate_is_smoothed(self):
+        schedule = self.schedule([(self.cheap, 'a')])
+        search = schedule.searches[0]
+        schedule.record(search, 0)
+        self.now += 1000
+        schedule.record(search, 10)
+        self.assertAlmostEqual(0.01, search.rate)
+        self.assertEqual(100, search.interval)
+        self.now += 1000
+        schedule.record(search, 0)
+        self.assertAlmostEqual(0.007, search.rate)
+
+    def test_expensive_searches_need_more_new_listings(self):
+        schedule = self.schedule([(self.cheap, 'a'), (self.expensive, 'b')])
+        for search in schedule.searches:
+            schedule.record(search, 0)
+        self.now += 1000
+        for search in schedule.searches:
+            schedule.record(search, 5)
+        cheap, expensive = schedule.searches
+        self.assertEqual(4 * cheap.interval, expensive.interval)
+        self.assertEqual(expensive.interval, schedule.interval_for(expensive))
+
+    def test_searches_without_new_listings_slow_down_to_the_maximum(self):
+        schedule = self.schedule([(self.cheap, 'a')])
+        search = schedule.searches[0]
+        schedule.record(search, 0)
+        self.now += 600
+        schedule.record(search, 0)
+        self.assertEqual(3600, schedule.interval_for(search))
+
+    def test_schedule_from_config(self):
+        config = YamlConfig({'loop': {'sleeping_time': 600}})
+        self.assertEqual('sequential', config.loop_schedule())
+        schedule = AdaptiveSchedule.from_config(config, [])
+        self.assertEqual(150, schedule.min_interval)
+        self.assertEqual(2400, schedule.max_interval)
+
+
+class HunterSearchesTest(unittest.TestCase):
+
+    def test_searches_pair_urls_with_their_crawler(self):
+        crawler = DummyCrawler()
+        config = YamlConfig({'urls': ['https://www.example.com/a', 'https://other.com/b']})
+        config.set_searchers([crawler])
+        hunter = Hunter(config, IdMaintainer(":memory:"))
+        self.assertEqual([(crawler, 'https://www.example.com/a')], hunter.searches())
+        exposes = hunter.hunt_flats(searches=hunter.searches())
+        self.assertGreater(len(exposes), 0)
@@ -0,0 +1,53 @@
+import unittest
+
+from flathunter.utils.cache import LRUCache, MISSING
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_get_after_put(self):
+        cache = LRUCache()
+        cache.put('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIs(MISSING, cache.get('b'))
+
+    def test_none_can_be_cached(self):
+        cache = LRUCache()
+        cache.put('a', None)
+        self.assertIsNone(cache.get('a'))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(capacity=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIs(MISSING, cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = LRUCache(ttl=10, clock=clock)
+        cache.put('a', 1)
+        clock.now = 9
+        self.assertEqual(1, cache.get('a'))
+        clock.now = 10
+        self.assertIs(MISSING, cache.get('a'))
+        self.assertEqual(0, len(cache))
+
+    def test_invalidate(self):
+        cache = LRUCache()
+        cache.put('a', 1)
+        cache.invalidate('a')
+        cache.invalidate('b')
+        self.assertIs(MISSING, cache.get('a'))
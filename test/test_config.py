@@ -44,6 +44,18 @@ filters:
     max_rooms: 5
 """
 
+    PERIODS_CONFIG = """
+urls:
+  - https://www.immowelt.de/liste/berlin/wohnungen/mieten?roomi=2&prima=1500&wflmi=70&sort=createdate%2Bdesc
+
+loop:
+    schedule: fixed_rate
+    sleeping_time: 600
+    periods:
+        Immowelt: 300
+        https://www.example.com/search: 120
+"""
+
     def test_loads_config(self):
         created = False
         if not os.path.isfile("config.yaml"):
@@ -87,3 +99,10 @@ filters:
        config = StringConfig(string=self.FILTERS_CONFIG)
        self.assertIsNotNone(config)
        self.assertEqual(config.database_location(), os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/.."))
+
+    def test_loop_periods_by_url_and_crawler(self):
+       config = StringConfig(string=self.PERIODS_CONFIG)
+       self.assertEqual('fixed_rate', config.loop_schedule())
+       self.assertEqual(120, config.loop_search_period_seconds('Immowelt', 'https://www.example.com/search'))
+       self.assertEqual(300, config.loop_search_period_seconds('Immowelt', 'https://www.immowelt.de/'))
+       self.assertEqual(600, config.loop_search_period_seconds('Kleinanzeigen', 'https://www.kleinanzeigen.de/'))
@@ -4,7 +4,7 @@ import datetime
 from unittest.mock import Mock, MagicMock, patch
 from bs4 import BeautifulSoup
 
-from detail_scraper import DetailScraper
+from detail_scraper import DetailScraper, content_hash
 from test.utils.config import StringConfig
 
 DUMMY_CONFIG = """
@@ -37,6 +37,9 @@ def mock_id_watch():
     mock = Mock()
     mock.get_exposes_since = Mock(return_value=[])
     mock.save_expose = Mock()
+    mock.get_enrichment_state = Mock(return_value=None)
+    mock.get_enrichment_states = Mock(side_effect=lambda keys: dict.fromkeys(keys))
+    mock.save_enrichment_state = Mock()
     return mock
 
 
@@ -55,11 +58,10 @@ def test_detail_scraper_initialization(scraper):
 
 
 def test_get_listings_to_update_filters_correctly(scraper, mock_id_watch):
-    """Test that get_listings_to_update filters for Storia and ImobiliareRo only"""
+    """Test that get_listings_to_update asks the database for Storia and ImobiliareRo only"""
     mock_exposes = [
         {'id': 1, 'crawler': 'Storia', 'title': 'Test 1'},
         {'id': 2, 'crawler': 'ImobiliareRo', 'title': 'Test 2'},
-        {'id': 3, 'crawler': 'Immobilienscout', 'title': 'Test 3'},  # Should be filtered out
         {'id': 4, 'crawler': 'Storia', 'title': 'Test 4'},
     ]
     mock_id_watch.get_exposes_since.return_value = mock_exposes
@@ -67,8 +69,9 @@ def test_get_listings_to_update_filters_correctly(scraper, mock_id_watch):
     result = scraper.get_listings_to_update(hours_ago=24)
     
     assert len(result) == 3
-    assert all(e['crawler'] in ['Storia', 'ImobiliareRo'] for e in result)
     assert mock_id_watch.get_exposes_since.called
+    _, kwargs = mock_id_watch.get_exposes_since.call_args
+    assert sorted(kwargs['crawlers']) == ['ImobiliareRo', 'Storia']
 
 
 def test_update_listing_details_storia(scraper, mock_id_watch):
@@ -198,3 +201,83 @@ def test_scrape_details_with_listings(scraper, mock_id_watch):
             scraper.scrape_details(hours_ago=24)
         
         assert mock_update.call_count == 2
+
+
+def test_get_listings_to_update_prioritises_never_enriched(scraper, mock_id_watch):
+    """Test that never-enriched listings come before stale ones, and fresh ones are skipped"""
+    now = datetime.datetime.now()
+    states = {
+        1: {'last_detail_fetch': now - datetime.timedelta(hours=30), 'last_attempt': None,
+            'content_hash': 'a', 'failure_count': 0},
+        2: None,
+        3: {'last_detail_fetch': now - datetime.timedelta(hours=1), 'last_attempt': None,
+            'content_hash': 'b', 'failure_count': 0},
+        4: {'last_detail_fetch': now - datetime.timedelta(hours=48), 'last_attempt': None,
+            'content_hash': 'c', 'failure_count': 0},
+    }
+    mock_id_watch.get_exposes_since.return_value = [
+        {'id': expose_id, 'crawler': 'Storia', 'title': f'Test {expose_id}'}
+        for expose_id in states
+    ]
+    mock_id_watch.get_enrichment_states.side_effect = \
+        lambda keys: {key: states[key[0]] for key in keys}
+
+    result = scraper.get_listings_to_update(hours_ago=24)
+
+    assert [expose['id'] for expose in result] == [2, 4, 1]
+
+
+def test_get_listings_to_update_backs_off_failures(scraper, mock_id_watch):
+    """Test that repeatedly failing listings back off exponentially"""
+    now = datetime.datetime.now()
+    states = {
+        1: {'last_detail_fetch': None, 'last_attempt': now - datetime.timedelta(minutes=45),
+            'content_hash': None, 'failure_count': 1},
+        2: {'last_detail_fetch': None, 'last_attempt': now - datetime.timedelta(minutes=45),
+            'content_hash': None, 'failure_count': 3},
+    }
+    mock_id_watch.get_exposes_since.return_value = [
+        {'id': expose_id, 'crawler': 'Storia', 'title': f'Test {expose_id}'}
+        for expose_id in states
+    ]
+    mock_id_watch.get_enrichment_states.side_effect = \
+        lambda keys: {key: states[key[0]] for key in keys}
+
+    result = scraper.get_listings_to_update(hours_ago=24)
+
+    assert [expose['id'] for expose in result] == [1]
+    assert scraper.retry_delay(3) == datetime.timedelta(minutes=120)
+
+
+def test_update_listing_details_records_failure(scraper, mock_id_watch):
+    """Test that a failed fetch increments the failure count"""
+    expose = {'id': 1, 'crawler': 'Storia', 'url': 'https://www.storia.ro/ro/oferta/test'}
+    mock_id_watch.get_enrichment_state.return_value = {
+        'last_detail_fetch': None, 'last_attempt': None, 'content_hash': None, 'failure_count': 2}
+
+    with patch.object(scraper.storia_crawler, 'get_expose_details') as mock_get_details:
+        mock_get_details.side_effect = Exception("Network error")
+        scraper.update_listing_details(expose)
+
+    (expose_id, crawler, state), _ = mock_id_watch.save_enrichment_state.call_args
+    assert (expose_id, crawler) == (1, 'Storia')
+    assert state['failure_count'] == 3
+    assert state['last_attempt'] is not None
+
+
+def test_update_listing_details_skips_unchanged_content(scraper, mock_id_watch):
+    """Test that a listing whose content hash is unchanged is not saved again"""
+    expose = {'id': 1, 'crawler': 'Storia', 'url': 'https://www.storia.ro/ro/oferta/test'}
+    enriched = {**expose, 'description': 'Full description'}
+    mock_id_watch.get_enrichment_state.return_value = {
+        'last_detail_fetch': None, 'last_attempt': None,
+        'content_hash': content_hash(enriched), 'failure_count': 0}
+
+    with patch.object(scraper.storia_crawler, 'get_expose_details') as mock_get_details:
+        mock_get_details.return_value = enriched
+        assert scraper.update_listing_details(expose) is False
+
+    assert not mock_id_watch.save_expose.called
+    (_, _, state), _ = mock_id_watch.save_enrichment_state.call_args
+    assert state['failure_count'] == 0
+    assert state['last_detail_fetch'] is not None
@@ -0,0 +1,36 @@
+import threading
+import time
+import unittest
+
+from flathunter.utils.dispatch import KeyedDispatcher
+
+
+class KeyedDispatcherTest(unittest.TestCase):
+
+    def test_tasks_with_same_key_run_in_order(self):
+        results = []
+        with KeyedDispatcher(4) as dispatcher:
+            for i in range(20):
+                dispatcher.submit('chat', results.append, i)
+            dispatcher.join()
+        self.assertEqual(list(range(20)), results)
+
+    def test_tasks_with_different_keys_run_in_parallel(self):
+        barrier = threading.Barrier(3, timeout=5)
+        with KeyedDispatcher(3) as dispatcher:
+            for key in range(3):
+                dispatcher.submit(key, barrier.wait)
+            dispatcher.join()
+
+    def test_errors_are_raised_by_join(self):
+        def fail():
+            time.sleep(0.01)
+            raise ValueError("failed")
+        results = []
+        with KeyedDispatcher(2) as dispatcher:
+            dispatcher.submit('a', fail)
+            dispatcher.submit('a', results.append, 1)
+            with self.assertRaises(ValueError):
+                dispatcher.join()
+            dispatcher.join()
+        self.assertEqual([1], results)
@@ -0,0 +1,31 @@
+import datetime
+
+from flathunter import expose_statistics
+
+def test_medians_are_approximated_from_histograms():
+    aggregate = expose_statistics.empty_aggregate()
+    for price in ['800 €', '1.000 €', '1.200 €', '3.500 €', '990 €']:
+        expose_statistics.add_expose(aggregate, {'price': price, 'size': '50 m²'})
+    assert aggregate['count'] == 5
+    assert abs(expose_statistics.histogram_median(aggregate['price']) - 1000) < 20
+    assert abs(expose_statistics.histogram_median(aggregate['pps']) - 20) < 0.4
+
+def test_unparseable_values_are_counted_but_not_histogrammed():
+    aggregate = expose_statistics.add_expose(expose_statistics.empty_aggregate(),
+                                             {'price': 'on request', 'size': 42})
+    assert aggregate == {'count': 1, 'price': {}, 'pps': {}, 'size': {}}
+    assert expose_statistics.histogram_median(aggregate['price']) is None
+
+def test_summary_is_sorted_by_day_and_crawler():
+    monday = datetime.date(2024, 1, 1)
+    aggregate = expose_statistics.add_expose(expose_statistics.empty_aggregate(),
+                                             {'price': '500', 'size': '25'})
+    summary = expose_statistics.summarize([
+        (monday + datetime.timedelta(days=1), 'Storia', aggregate),
+        (monday, 'WgGesucht', aggregate),
+        (monday, 'Immowelt', aggregate)
+    ])
+    assert [(entry['day'], entry['crawler']) for entry in summary] == [
+        ('2024-01-01', 'Immowelt'), ('2024-01-01', 'WgGesucht'), ('2024-01-02', 'Storia')]
+    assert summary[2]['weekday'] == 1
+    assert summary[0]['sizes'] == {20: 1}
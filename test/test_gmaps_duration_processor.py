@@ -1,12 +1,15 @@
+import json
 import unittest
 import yaml
 import re
 import requests_mock
+from flathunter.gmaps_duration_processor import GMapsDurationProcessor
 from flathunter.hunter import Hunter
 from flathunter.idmaintainer import IdMaintainer
 from test.dummy_crawler import DummyCrawler
 from test.test_util import count
 from test.utils.config import StringConfig
+from test.utils.request_matcher import RequestCounter
 
 class GMapsDurationProcessorTest(unittest.TestCase):
 
@@ -47,4 +50,78 @@ durations:
         if len(without_durations) > 0:
             for expose in without_durations:
                 print("Got expose: ", expose)
-        self.assertTrue(len(without_durations) == 0, "Expected durations to be calculated")
\ No newline at end of file
+        self.assertTrue(len(without_durations) == 0, "Expected durations to be calculated")
+
+    @requests_mock.Mocker()
+    def test_durations_are_cached(self, m):
+        config = StringConfig(string=self.DUMMY_CONFIG)
+        id_watch = IdMaintainer(":memory:")
+        processor = GMapsDurationProcessor(config, id_watch)
+        counter = RequestCounter()
+        matcher = re.compile('maps.googleapis.com/maps/api/distancematrix/json')
+        m.get(matcher, additional_matcher=counter.count, text='{"status": "OK", "rows": [ { "elements": [ { "distance": { "text": "far", "value": 123 }, "duration": { "text": "days", "value": 123 } } ] } ]}')
+        first = processor.get_formatted_durations("Alexanderplatz 1, Berlin")
+        self.assertEqual(3, counter.i)
+        second = GMapsDurationProcessor(config, id_watch) \
+            .get_formatted_durations("  alexanderplatz 1 ,berlin ")
+        self.assertEqual(first, second)
+        self.assertEqual(3, counter.i)
+        processor.get_formatted_durations("Alexanderplatz 2, Berlin")
+        self.assertEqual(6, counter.i)
+
+    @requests_mock.Mocker()
+    def test_failed_lookups_are_not_cached(self, m):
+        config = StringConfig(string=self.DUMMY_CONFIG)
+        processor = GMapsDurationProcessor(config, IdMaintainer(":memory:"))
+        counter = RequestCounter()
+        matcher = re.compile('maps.googleapis.com/maps/api/distancematrix/json')
+        m.get(matcher, additional_matcher=counter.count, text='{"status": "REQUEST_DENIED"}')
+        processor.get_formatted_durations("Alexanderplatz 1, Berlin")
+        processor.get_formatted_durations("Alexanderplatz 1, Berlin")
+        self.assertEqual(6, counter.i)
+
+    BATCH_CONFIG = """
+google_maps_api:
+  key: SOME_KEY
+  url: https://maps.googleapis.com/maps/api/distancematrix/json?origins={origin}&destinations={dest}&mode={mode}&sensor=true&key={key}&arrival_time={arrival}
+  enable: true
+
+durations:
+  - destination: Brandenburger Tor
+    name: Tor
+    modes:
+      - gm_id: transit
+        title: Bus
+  - destination: Alexanderplatz
+    name: Alex
+    modes:
+      - gm_id: transit
+        title: Bus
+      - gm_id: bicycling
+        title: Bike
+    """
+
+    @staticmethod
+    def matrix_response(request, context):
+        origins = request.qs['origins'][0].split('|')
+        destinations = request.qs['destinations'][0].split('|')
+        return json.dumps({"status": "OK", "rows": [{"elements": [
+            {"distance": {"text": f"{o}-{d}", "value": 1}, "duration": {"text": "x", "value": 1}}
+            for d in destinations]} for o in origins]})
+
+    @requests_mock.Mocker()
+    def test_destinations_and_origins_are_batched(self, m):
+        config = StringConfig(string=self.BATCH_CONFIG)
+        processor = GMapsDurationProcessor(config, IdMaintainer(":memory:"))
+        counter = RequestCounter()
+        matcher = re.compile('maps.googleapis.com/maps/api/distancematrix/json')
+        m.get(matcher, additional_matcher=counter.count, text=self.matrix_response)
+        exposes = [{"id": i, "address": f"Street {i}"} for i in range(12)]
+        processed = list(processor.process_exposes(exposes))
+        self.assertEqual(12, len(processed))
+        # one request per mode for each batch of 10 exposes
+        self.assertEqual(4, counter.i)
+        self.assertEqual("> Tor (Bus): x (street 11-brandenburger tor)\n"
+                         "> Alex (Bus): x (street 11-alexanderplatz)\n"
+                         "> Alex (Bike): x (street 11-alexanderplatz)",
+                         processed[11]['durations'])
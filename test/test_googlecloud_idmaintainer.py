@@ -4,18 +4,50 @@ import re
 from typing import Dict
 from mockfirestore import MockFirestore
 
+from flathunter.exceptions import ConfigException
 from flathunter.googlecloud_idmaintainer import GoogleCloudIdMaintainer
 from flathunter.hunter import Hunter
 from flathunter.web_hunter import WebHunter
 from flathunter.filter import Filter
+from flathunter.processor import ProcessorChain
 from test.dummy_crawler import DummyCrawler
 from test.test_util import count
 from test.utils.config import StringConfig
 
-class MockGoogleCloudIdMaintainer(GoogleCloudIdMaintainer):
+class MockWriteBatch:
+
+    def __init__(self, database):
+        self.database = database
+        self.writes = []
+
+    def set(self, reference, data, merge=False):
+        self.writes.append((reference.set, data, merge))
+
+    def update(self, reference, data):
+        self.writes.append((reference.update, data, None))
+
+    def commit(self):
+        self.database.commits += 1
+        for write, data, merge in self.writes:
+            if merge is None:
+                write(data)
+            else:
+                write(data, merge=merge)
+
+class MockBatchingFirestore(MockFirestore):
 
     def __init__(self):
-        self.database = MockFirestore()
+        super().__init__()
+        self.commits = 0
+
+    def batch(self):
+        return MockWriteBatch(self)
+
+class MockGoogleCloudIdMaintainer(GoogleCloudIdMaintainer):
+
+    def __init__(self, batch_writes=False):
+        self.database = MockBatchingFirestore()
+        self.configure_batching(batch_writes)
 
 CONFIG_WITH_FILTERS = """
 urls:
@@ -28,6 +60,10 @@ filters:
 @pytest.fixture
 def id_watch():
     return MockGoogleCloudIdMaintainer()
+
+@pytest.fixture
+def batched_id_watch():
+    return MockGoogleCloudIdMaintainer(batch_writes=True)
     
 def test_read_after_write(id_watch):
     id_watch.mark_processed(12345)
@@ -41,6 +77,31 @@ def test_get_list_run_time_is_updated(id_watch):
     assert time != None
     assert time == id_watch.get_last_run_time()
 
+def test_enrichment_state_round_trip(id_watch):
+    assert id_watch.get_enrichment_state(12345, 'Storia') is None
+    fetched = datetime.datetime.now()
+    id_watch.save_enrichment_state(12345, 'Storia', {
+        'last_detail_fetch': fetched, 'last_attempt': fetched,
+        'content_hash': 'abc', 'failure_count': 0})
+    state = id_watch.get_enrichment_state(12345, 'Storia')
+    assert state['last_detail_fetch'] == fetched
+    assert state['failure_count'] == 0
+    assert id_watch.get_enrichment_state(12345, 'ImobiliareRo') is None
+
+def test_enrichment_states_of_colliding_ids(id_watch):
+    fetched = datetime.datetime.now()
+    id_watch.save_enrichment_state(12345, 'Storia', {
+        'last_detail_fetch': fetched, 'last_attempt': fetched,
+        'content_hash': 'storia', 'failure_count': 0})
+    id_watch.save_enrichment_state(12345, 'ImobiliareRo', {
+        'last_detail_fetch': fetched, 'last_attempt': fetched,
+        'content_hash': 'imobiliare', 'failure_count': 0})
+    states = id_watch.get_enrichment_states(
+        [(12345, 'Storia'), (12345, 'ImobiliareRo'), (678, 'Storia')])
+    assert states[(12345, 'Storia')]['content_hash'] == 'storia'
+    assert states[(12345, 'ImobiliareRo')]['content_hash'] == 'imobiliare'
+    assert states[(678, 'Storia')] is None
+
 def test_is_processed_works(id_watch):
     config = StringConfig(string=CONFIG_WITH_FILTERS)
     config.set_searchers([DummyCrawler()])
@@ -71,6 +132,16 @@ def test_exposes_are_returned_as_dictionaries(id_watch):
     assert expose['title'] is not None
     assert expose['created_at'] is not None
 
+def test_exposes_since_can_be_filtered_by_crawler(id_watch):
+    id_watch.save_expose({'id': 1, 'crawler': 'Storia', 'title': 'one'})
+    id_watch.save_expose({'id': 2, 'crawler': 'WgGesucht', 'title': 'two'})
+    id_watch.save_expose({'id': 3, 'crawler': 'ImobiliareRo', 'title': 'three'})
+    since = datetime.datetime.now() - datetime.timedelta(seconds=10)
+    saved = id_watch.get_exposes_since(since, crawlers=['Storia', 'ImobiliareRo'])
+    assert sorted(expose['id'] for expose in saved) == [1, 3]
+    assert len(id_watch.get_exposes_since(since)) == 3
+    assert id_watch.get_exposes_since(datetime.datetime.now() + datetime.timedelta(seconds=10)) == []
+
 def test_exposes_are_returned_with_limit(id_watch):
     config = StringConfig(string=CONFIG_WITH_FILTERS)
     config.set_searchers([DummyCrawler()])
@@ -100,6 +171,26 @@ def test_exposes_are_returned_filtered(id_watch):
     for expose in saved:
         assert compare_int_less_equal(expose, 'size', 70)
 
+def test_recent_exposes_are_paginated(id_watch):
+    id_watch.RECENT_EXPOSES_PAGE_SIZE = 10
+    for expose_id in range(50):
+        id_watch.save_expose({'id': expose_id, 'crawler': 'Storia', 'title': str(expose_id),
+                              'price': '500 EUR' if expose_id < 5 else '1500 EUR',
+                              'size': '50', 'rooms': '2'})
+    filter = Filter.builder().read_config(StringConfig('{"filters":{"max_price":1000}}')).build()
+    saved = id_watch.get_recent_exposes(5, filter_set=filter)
+    assert sorted(expose['id'] for expose in saved) == [0, 1, 2, 3, 4]
+
+def test_recent_exposes_respect_scan_budget(id_watch):
+    id_watch.RECENT_EXPOSES_PAGE_SIZE = 10
+    id_watch.RECENT_EXPOSES_SCAN_BUDGET = 20
+    for expose_id in range(50):
+        id_watch.save_expose({'id': expose_id, 'crawler': 'Storia', 'title': str(expose_id),
+                              'price': '500 EUR' if expose_id < 5 else '1500 EUR',
+                              'size': '50', 'rooms': '2'})
+    filter = Filter.builder().read_config(StringConfig('{"filters":{"max_price":1000}}')).build()
+    assert id_watch.get_recent_exposes(5, filter_set=filter) == []
+
 def test_filters_for_user_are_saved(id_watch):
     filter = { 'fish': 'cat' }
     config = StringConfig(string=CONFIG_WITH_FILTERS)
@@ -120,3 +211,125 @@ def test_all_filters_can_be_loaded(id_watch):
     hunter.set_filters_for_user(123, filter)
     hunter.set_filters_for_user(124, filter)
     assert id_watch.get_user_settings() == [ (123, { 'filters': filter }), (124, { 'filters': filter }) ]
+
+def test_batched_writes_are_deferred_until_flush(batched_id_watch):
+    batched_id_watch.mark_processed(12345)
+    batched_id_watch.save_expose({'id': 12345, 'crawler': 'Storia', 'title': 'one'})
+    assert batched_id_watch.is_processed(12345)
+    assert len(batched_id_watch.pending_writes) == 2
+    assert batched_id_watch.database.commits == 0
+    batched_id_watch.flush()
+    assert batched_id_watch.database.commits == 1
+    since = datetime.datetime.now() - datetime.timedelta(seconds=10)
+    assert len(batched_id_watch.get_exposes_since(since)) == 1
+    assert batched_id_watch.database.collection('processed').document('12345').get().exists
+
+def test_prefetch_answers_is_processed_locally(id_watch, mocker):
+    id_watch.mark_processed(1)
+    id_watch.configure_batching(False)
+    id_watch.prefetch_processed([1, 2])
+    spy = mocker.spy(id_watch.database, 'collection')
+    assert id_watch.is_processed(1)
+    assert not id_watch.is_processed(2)
+    assert spy.call_count == 0
+
+def test_exposes_are_prefetched_batch_by_batch(id_watch, mocker):
+    config = StringConfig(string=CONFIG_WITH_FILTERS)
+    prefetch = mocker.spy(id_watch, 'prefetch_processed')
+    processor_chain = ProcessorChain.builder(config).prefetch_processed(id_watch).build()
+    exposes = [{'id': expose_id} for expose_id in range(45)]
+    assert count(processor_chain.process(exposes)) == 45
+    assert [len(call.args[0]) for call in prefetch.call_args_list] == [20, 20, 5]
+
+def test_flush_forgets_prefetched_exposes(batched_id_watch):
+    batched_id_watch.mark_processed(1)
+    batched_id_watch.prefetch_processed([1, 2])
+    batched_id_watch.flush()
+    assert batched_id_watch.known_processed == set()
+    assert batched_id_watch.known_unprocessed == set()
+    assert batched_id_watch.is_processed(1)
+    assert not batched_id_watch.is_processed(2)
+
+def test_batched_hunt_commits_once(batched_id_watch):
+    config = StringConfig(string=CONFIG_WITH_FILTERS)
+    config.set_searchers([DummyCrawler()])
+    hunter = Hunter(config, batched_id_watch)
+    exposes = hunter.hunt_flats()
+    assert count(exposes) > 4
+    assert batched_id_watch.database.commits == 1
+    assert batched_id_watch.pending_writes == []
+    for expose in exposes:
+        assert batched_id_watch.database.collection('processed') \
+            .document(str(expose['id'])).get().exists
+
+def test_statistics_count_each_expose_once(id_watch):
+    id_watch.save_expose({'id': 1, 'crawler': 'Storia', 'price': '1000', 'size': '50'})
+    id_watch.save_expose({'id': 1, 'crawler': 'Storia', 'price': '1000', 'size': '50'})
+    id_watch.configure_batching(False)
+    id_watch.save_expose({'id': 1, 'crawler': 'Storia', 'price': '1000', 'size': '50'})
+    id_watch.save_expose({'id': 2, 'crawler': 'Storia', 'price': '2000', 'size': '55'})
+    statistics = id_watch.get_statistics_since(datetime.date.today())
+    assert len(statistics) == 1
+    day, crawler, aggregate = statistics[0]
+    assert day == datetime.date.today()
+    assert crawler == 'Storia'
+    assert aggregate['count'] == 2
+    assert aggregate['size'] == {'50': 2}
+
+def test_batched_statistics_are_written_on_flush(batched_id_watch):
+    batched_id_watch.save_expose({'id': 1, 'crawler': 'Storia', 'price': '1000', 'size': '50'})
+    batched_id_watch.save_expose({'id': 2, 'crawler': 'Storia', 'price': '2000', 'size': '55'})
+    assert [aggregate['count'] for aggregate in batched_id_watch.pending_statistics.values()] == [2]
+    batched_id_watch.flush()
+    assert batched_id_watch.pending_statistics == {}
+    assert batched_id_watch.database.commits == 1
+    statistics = batched_id_watch.get_statistics_since(datetime.date.today())
+    assert [aggregate['count'] for _, _, aggregate in statistics] == [2]
+
+def test_statistics_are_incremented_on_the_server(batched_id_watch):
+    other = MockGoogleCloudIdMaintainer(batch_writes=True)
+    other.database = batched_id_watch.database
+    batched_id_watch.save_expose({'id': 1, 'crawler': 'Storia', 'price': '1000', 'size': '50'})
+    other.save_expose({'id': 2, 'crawler': 'Storia', 'price': '2000', 'size': '55'})
+    batched_id_watch.flush()
+    other.flush()
+    statistics = batched_id_watch.get_statistics_since(datetime.date.today())
+    assert [aggregate['count'] for _, _, aggregate in statistics] == [2]
+    assert statistics[0][2]['size'] == {'50': 2}
+
+def test_counted_exposes_are_forgotten_on_flush(batched_id_watch):
+    batched_id_watch.save_expose({'id': 1, 'crawler': 'Storia', 'price': '1000', 'size': '50'})
+    batched_id_watch.flush()
+    assert batched_id_watch.counted_exposes == set()
+    batched_id_watch.save_expose({'id': 1, 'crawler': 'Storia', 'price': '1000', 'size': '50'})
+    batched_id_watch.flush()
+    statistics = batched_id_watch.get_statistics_since(datetime.date.today())
+    assert [aggregate['count'] for _, _, aggregate in statistics] == [1]
+
+def test_cache_round_trip(id_watch):
+    key = '["alexanderplatz 1, berlin", "główny/plac", "transit", "0 09:00"]'
+    assert id_watch.get_cached('gmaps_duration', key, datetime.timedelta(days=1)) is None
+    id_watch.set_cached('gmaps_duration', key, '1 hour (5 km)')
+    assert id_watch.get_cached('gmaps_duration', key, datetime.timedelta(days=1)) == '1 hour (5 km)'
+    assert id_watch.get_cached('gmaps_duration', key, datetime.timedelta(0)) is None
+    assert id_watch.get_cached('address', key, datetime.timedelta(days=1)) is None
+
+def test_save_exposes_looks_up_new_exposes_at_once(id_watch, mocker):
+    id_watch.save_expose({'id': 1, 'crawler': 'Storia', 'price': '1000', 'size': '50'})
+    id_watch.counted_exposes = set()
+    get_all = mocker.spy(id_watch.database, 'get_all')
+    id_watch.save_exposes([{'id': 1, 'crawler': 'Storia', 'price': '1000', 'size': '50'},
+                           {'id': 2, 'crawler': 'Storia', 'price': '2000', 'size': '55'}])
+    assert get_all.call_count == 1
+    statistics = id_watch.get_statistics_since(datetime.date.today())
+    assert [aggregate['count'] for _, _, aggregate in statistics] == [2]
+
+def test_notification_outbox_is_rejected(mocker):
+    initialize_app = mocker.patch('firebase_admin.initialize_app')
+    config = StringConfig(string="""
+google_cloud_project_id: dummy
+notification_outbox: true
+    """)
+    with pytest.raises(ConfigException):
+        GoogleCloudIdMaintainer(config)
+    assert initialize_app.call_count == 0
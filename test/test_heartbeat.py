@@ -3,6 +3,7 @@ from unittest.mock import Mock
 
 from flathunter.heartbeat import Heartbeat, HeartbeatException
 from flathunter.config import YamlConfig
+from flathunter.scheduler import Clock, Scheduler
 
 class HeartbeatTest(unittest.TestCase):
 
@@ -16,15 +17,43 @@ class HeartbeatTest(unittest.TestCase):
         with self.assertRaises(HeartbeatException):
             Heartbeat(partial_config, "hour")
 
-    def test_heartbeat_off_interval_does_nothing(self):
+    def test_heartbeat_interval_in_seconds(self):
+        partial_config = YamlConfig({ "notifiers": [ "telegram" ], "loop": { "sleeping_time": 900 }})
+        self.assertEqual(3600, Heartbeat(partial_config, "hour").interval)
+        self.assertEqual(86400, Heartbeat(partial_config, "day").interval)
+
+    def test_disabled_heartbeat_does_nothing(self):
         partial_config = YamlConfig({ "notifiers": [ "telegram" ]})
-        heartbeat = Heartbeat(partial_config, "hour")
-        heartbeat.send_heartbeat(5)
+        heartbeat = Heartbeat(partial_config, None)
+        notifier = Mock()
+        heartbeat.notifier = notifier
+        scheduler = Scheduler()
+        heartbeat.schedule(scheduler)
+        self.assertEqual([], scheduler.jobs())
+        heartbeat.send_heartbeat()
+        notifier.notify.assert_not_called()
 
     def test_heartbeat_send(self):
         partial_config = YamlConfig({ "notifiers": [ "telegram" ]})
         heartbeat = Heartbeat(partial_config, "hour")
         notifier = Mock()
         heartbeat.notifier = notifier
-        heartbeat.send_heartbeat(6)
-        notifier.notify.assert_called_once()
\ No newline at end of file
+        heartbeat.send_heartbeat()
+        notifier.notify.assert_called_once()
+
+    def test_heartbeat_is_sent_every_interval(self):
+        partial_config = YamlConfig({ "notifiers": [ "telegram" ]})
+        heartbeat = Heartbeat(partial_config, "hour")
+        notifier = Mock()
+        heartbeat.notifier = notifier
+        now = [0.0]
+        scheduler = Scheduler(clock=Clock(lambda: now[0]))
+        heartbeat.schedule(scheduler)
+        now[0] = 3599
+        scheduler.run_pending()
+        notifier.notify.assert_not_called()
+        now[0] = 3600
+        scheduler.run_pending()
+        now[0] = 7300
+        scheduler.run_pending()
+        self.assertEqual(2, notifier.notify.call_count)
\ No newline at end of file
@@ -38,6 +38,22 @@ filters:
     def test_get_last_run_time_none_by_default(self):
         self.assertIsNone(self.maintainer.get_last_run_time(), "Expected last run time to be none")
 
+    def test_enrichment_state_round_trip(self):
+        self.assertIsNone(self.maintainer.get_enrichment_state(12345, 'Storia'))
+        fetched = datetime.datetime.now()
+        self.maintainer.save_enrichment_state(12345, 'Storia', {
+            'last_detail_fetch': fetched, 'last_attempt': fetched,
+            'content_hash': 'abc', 'failure_count': 0})
+        state = self.maintainer.get_enrichment_state(12345, 'Storia')
+        self.assertEqual(fetched, state['last_detail_fetch'])
+        self.assertEqual('abc', state['content_hash'])
+        self.assertIsNone(self.maintainer.get_enrichment_state(12345, 'ImobiliareRo'))
+        states = self.maintainer.get_enrichment_states(
+            [(12345, 'Storia'), (12345, 'ImobiliareRo'), (678, 'Storia')])
+        self.assertEqual('abc', states[(12345, 'Storia')]['content_hash'])
+        self.assertIsNone(states[(12345, 'ImobiliareRo')])
+        self.assertIsNone(states[(678, 'Storia')])
+
     def test_get_list_run_time_is_updated(self):
         time = self.maintainer.update_last_run_time()
         self.assertIsNotNone(time, "Expected time not to be none")
@@ -86,6 +102,17 @@ def test_exposes_are_returned_as_dictionaries():
     assert expose['title'] is not None
     assert expose['created_at'] is not None
 
+def test_exposes_since_can_be_filtered_by_crawler():
+    id_watch = IdMaintainer(":memory:")
+    id_watch.save_expose({'id': 1, 'crawler': 'Storia', 'title': 'one'})
+    id_watch.save_expose({'id': 2, 'crawler': 'WgGesucht', 'title': 'two'})
+    id_watch.save_expose({'id': 3, 'crawler': 'ImobiliareRo', 'title': 'three'})
+    since = datetime.datetime.now() - datetime.timedelta(seconds=10)
+    saved = id_watch.get_exposes_since(since, crawlers=['Storia', 'ImobiliareRo'])
+    assert sorted(expose['id'] for expose in saved) == [1, 3]
+    assert len(id_watch.get_exposes_since(since)) == 3
+    assert id_watch.get_exposes_since(since, crawlers=[]) == []
+
 def test_exposes_are_returned_with_limit():
     config = StringConfig(string=IdMaintainerTest.CONFIG_WITH_FILTERS)
     config.set_searchers([DummyCrawler()])
@@ -133,3 +160,72 @@ def test_all_filters_can_be_loaded():
     hunter.set_filters_for_user(123, filter)
     hunter.set_filters_for_user(124, filter)
     assert id_watch.get_user_settings() == [ (123, { 'filters': filter }), (124, { 'filters': filter }) ]
+
+def test_user_settings_are_cached(mocker):
+    config = StringConfig(string=IdMaintainerTest.CONFIG_WITH_FILTERS)
+    id_watch = IdMaintainer(":memory:")
+    hunter = WebHunter(config, id_watch)
+    hunter.set_filters_for_user(123, { 'fish': 'cat' })
+    spy = mocker.spy(id_watch, "get_settings_for_user")
+    assert hunter.get_filters_for_user(123) == { 'fish': 'cat' }
+    assert not hunter.notifications_muted_for_user(123)
+    assert hunter.get_filters_for_user(124) is None
+    assert hunter.get_filters_for_user(124) is None
+    assert spy.call_count == 1
+
+def test_user_settings_cache_is_written_through():
+    config = StringConfig(string=IdMaintainerTest.CONFIG_WITH_FILTERS)
+    id_watch = IdMaintainer(":memory:")
+    hunter = WebHunter(config, id_watch)
+    hunter.set_filters_for_user(123, { 'fish': 'cat' })
+    hunter.set_notification_status(123, False)
+    assert hunter.notifications_muted_for_user(123)
+    assert id_watch.get_settings_for_user(123) == { 'filters': { 'fish': 'cat' }, 'mute_notifications': True }
+    hunter.set_filters_for_user(123, { 'dog': 'cat' })
+    assert hunter.get_filters_for_user(123) == { 'dog': 'cat' }
+    assert hunter.notifications_muted_for_user(123)
+
+def test_statistics_count_each_expose_once():
+    id_watch = IdMaintainer(":memory:")
+    id_watch.save_expose({'id': 1, 'crawler': 'Storia', 'price': '1.000 €', 'size': '50 m²'})
+    id_watch.save_expose({'id': 1, 'crawler': 'Storia', 'price': '1.000 €', 'size': '50 m²'})
+    id_watch.save_expose({'id': 1, 'crawler': 'WgGesucht', 'price': '500 €', 'size': '20 m²'})
+    id_watch.save_expose({'id': 2, 'crawler': 'Storia', 'price': 'on request', 'size': '75 m²'})
+    statistics = id_watch.get_statistics_since(datetime.date.today())
+    assert [(crawler, aggregate['count']) for _, crawler, aggregate in statistics] \
+        == [('Storia', 2), ('WgGesucht', 1)]
+    storia = statistics[0][2]
+    assert storia['size'] == {'50': 1, '70': 1}
+    assert sum(storia['price'].values()) == 1
+    assert sum(storia['pps'].values()) == 1
+    assert id_watch.get_statistics_since(datetime.date.today() + datetime.timedelta(days=1)) == []
+
+def test_statistics_are_cached_by_web_hunter(mocker):
+    config = StringConfig(string=IdMaintainerTest.CONFIG_WITH_FILTERS)
+    id_watch = IdMaintainer(":memory:")
+    id_watch.save_expose({'id': 1, 'crawler': 'Storia', 'price': '1000', 'size': '50'})
+    hunter = WebHunter(config, id_watch)
+    spy = mocker.spy(id_watch, "get_statistics_since")
+    statistics = hunter.get_statistics_since(datetime.date.today())
+    assert hunter.get_statistics_since(datetime.date.today()) == statistics
+    assert spy.call_count == 1
+    assert statistics[0]['count'] == 1
+    assert 19 < statistics[0]['median_pps'] < 21
+
+def test_cache_round_trip():
+    id_watch = IdMaintainer(":memory:")
+    assert id_watch.get_cached('gmaps_duration', 'key', datetime.timedelta(days=1)) is None
+    id_watch.set_cached('gmaps_duration', 'key', '1 hour (5 km)')
+    assert id_watch.get_cached('gmaps_duration', 'key', datetime.timedelta(days=1)) == '1 hour (5 km)'
+    assert id_watch.get_cached('gmaps_duration', 'key', datetime.timedelta(0)) is None
+    assert id_watch.get_cached('address', 'key', datetime.timedelta(days=1)) is None
+
+def test_save_exposes_counts_each_expose_once():
+    id_watch = IdMaintainer(":memory:")
+    id_watch.save_exposes([{'id': 1, 'crawler': 'Storia', 'price': '1000', 'size': '50'},
+                           {'id': 2, 'crawler': 'Storia', 'price': '2000', 'size': '55'},
+                           {'id': 1, 'crawler': 'Storia', 'price': '1000', 'size': '50'}])
+    saved = id_watch.get_exposes_since(datetime.datetime.now() - datetime.timedelta(seconds=10))
+    assert sorted(expose['id'] for expose in saved) == [1, 2]
+    statistics = id_watch.get_statistics_since(datetime.date.today())
+    assert [aggregate['count'] for _, _, aggregate in statistics] == [2]
@@ -0,0 +1,56 @@
+import unittest
+from unittest.mock import patch
+from urllib.parse import unquote_plus
+
+import requests_mock
+
+from flathunter.config import YamlConfig
+from flathunter.message_renderer import MessageRenderer
+from flathunter.processor import ProcessorChain
+
+
+class MessageRendererTest(unittest.TestCase):
+
+    def test_arbitrary_fields_are_rendered(self):
+        renderer = MessageRenderer("{title} on floor {floor}\n{description}\n")
+        expose = {"title": "Nice flat", "floor": 3, "description": "Sunny"}
+        self.assertEqual("Nice flat on floor 3\nSunny", renderer.render(expose))
+
+    def test_missing_fields_are_rendered_as_na(self):
+        renderer = MessageRenderer("{title}: {durations} {images[0]} {address.street}")
+        self.assertEqual("Flat: N/A N/A N/A", renderer.render({"title": "Flat"}))
+
+    def test_format_specs_and_conversions(self):
+        renderer = MessageRenderer("|{price:>6}|{title!r}|{images[1]}")
+        expose = {"price": "500", "title": "Flat", "images": ["a", "b"]}
+        self.assertEqual("|   500|'Flat'|b", renderer.render(expose))
+
+    def test_changed_exposes_are_rendered_again(self):
+        renderer = MessageRenderer("{title}")
+        expose = {"title": "Flat"}
+        self.assertEqual("Flat", renderer.render(expose))
+        expose["title"] = "Changed"
+        self.assertEqual("Changed", renderer.render(expose))
+
+    def test_renderers_are_shared_per_template(self):
+        self.assertIs(MessageRenderer.for_template("{title}"),
+                      MessageRenderer.for_template("{title}"))
+
+    def test_notifiers_of_a_chain_render_each_expose_once(self):
+        config = YamlConfig({"notifiers": ["telegram", "slack"],
+                             "telegram": {"bot_token": "dummy", "receiver_ids": [1]},
+                             "slack": {"webhook_url": "https://hooks.slack.com/hook"}})
+        chain = ProcessorChain.builder(config).send_messages().build()
+        expose = {"id": 1, "crawler": "Dummy", "title": "Flat", "price": "500",
+                  "size": "50", "rooms": "2", "address": "Street", "url": "https://a"}
+        with requests_mock.Mocker() as mock, \
+                patch.object(MessageRenderer, 'render', autospec=True,
+                             side_effect=MessageRenderer.render) as render:
+            mock.post("https://api.telegram.org/botdummy/sendMessage",
+                      json={"ok": True, "result": {"message_id": 1}})
+            mock.post("https://hooks.slack.com/hook")
+            list(chain.process([expose]))
+            self.assertEqual(1, render.call_count)
+            texts = [request.text for request in mock.request_history]
+        self.assertEqual(2, len(texts))
+        self.assertTrue(all('Flat' in unquote_plus(text) for text in texts))
@@ -0,0 +1,123 @@
+import pytest
+import requests
+import requests_mock
+
+from flathunter import metrics
+from flathunter.captcha.captcha_solver import (
+    CaptchaSolver, CaptchaUnsolvableError, RecaptchaResponse)
+from flathunter.config import YamlConfig
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.metrics import MetricsRegistry
+from flathunter.notifiers import SenderSlack, SenderTelegram
+from test.dummy_crawler import DummyCrawler
+
+
+def test_counter_renders_labelled_samples():
+    registry = MetricsRegistry()
+    counter = registry.counter('test_requests_total', 'Requests', ['crawler'])
+    counter.inc(crawler='Immowelt')
+    counter.inc(2, crawler='Immowelt')
+    counter.inc(crawler='Wg"Gesucht')
+    assert counter.value(crawler='Immowelt') == 3
+    assert registry.render() == (
+        '# HELP test_requests_total Requests\n'
+        '# TYPE test_requests_total counter\n'
+        'test_requests_total{crawler="Immowelt"} 3\n'
+        'test_requests_total{crawler="Wg\\"Gesucht"} 1\n')
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('test_seconds', 'Latency', buckets=[0.1, 1])
+    for value in [0.05, 0.5, 0.5, 5]:
+        histogram.observe(value)
+    assert histogram.count() == 4
+    assert histogram.sum() == 6.05
+    lines = registry.render().splitlines()
+    assert lines[2:] == ['test_seconds_bucket{le="0.1"} 1',
+                         'test_seconds_bucket{le="1"} 3',
+                         'test_seconds_bucket{le="+Inf"} 4',
+                         'test_seconds_sum 6.05',
+                         'test_seconds_count 4']
+
+def test_labels_must_match():
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', 'Test', ['crawler'])
+    with pytest.raises(ValueError):
+        counter.inc(portal='Immowelt')
+
+def test_metrics_are_registered_once():
+    registry = MetricsRegistry()
+    assert registry.counter('test_total', 'Test') is registry.counter('test_total', 'Test')
+
+def test_http_server_serves_metrics():
+    metrics.PROXY_FAILURES.inc(reason='timeout')
+    server = metrics.start_http_server(0)
+    try:
+        port = server.server_address[1]
+        response = requests.get(f"http://127.0.0.1:{port}/metrics", timeout=5)
+        assert response.status_code == 200
+        assert response.headers['Content-Type'] == metrics.CONTENT_TYPE
+        assert 'flathunter_proxy_failures_total{reason="timeout"}' in response.text
+        assert requests.get(f"http://127.0.0.1:{port}/other", timeout=5).status_code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_database_latency_is_recorded():
+    before = metrics.DB_SECONDS.count(backend='sqlite', operation='save_exposes')
+    IdMaintainer(":memory:").save_expose({'id': 1, 'crawler': 'Storia'})
+    assert metrics.DB_SECONDS.count(backend='sqlite', operation='save_exposes') == before + 1
+
+def test_notifications_are_counted():
+    sender = SenderSlack(YamlConfig({"slack": {"webhook_url": "http://hooks.slack.com/hook"}}))
+    sent = metrics.NOTIFICATIONS_SENT.value(notifier='slack', result='sent')
+    failed = metrics.NOTIFICATIONS_SENT.value(notifier='slack', result='failed')
+    with requests_mock.Mocker() as mock:
+        mock.post("http://hooks.slack.com/hook")
+        sender.notify("one")
+        mock.post("http://hooks.slack.com/hook", status_code=500)
+        sender.notify("two")
+    assert metrics.NOTIFICATIONS_SENT.value(notifier='slack', result='sent') == sent + 1
+    assert metrics.NOTIFICATIONS_SENT.value(notifier='slack', result='failed') == failed + 1
+
+def test_telegram_counts_each_delivered_expose_once():
+    SenderTelegram.reset_rate_limits()
+    sender = SenderTelegram(YamlConfig({"telegram": {
+        "bot_token": "dummy", "receiver_ids": [1, 2], "notify_with_images": True}}))
+    sent = metrics.NOTIFICATIONS_SENT.value(notifier='telegram', result='sent')
+    with requests_mock.Mocker() as mock:
+        mock.post("https://api.telegram.org/botdummy/sendMessage",
+                  json={"ok": True, "result": {"message_id": 1}})
+        mock.post("https://api.telegram.org/botdummy/sendMediaGroup",
+                  json={"ok": True, "result": []})
+        sender.process_expose({"title": "flat", "images": ["https://example.com/1.jpg"]})
+    assert metrics.NOTIFICATIONS_SENT.value(notifier='telegram', result='sent') == sent + 2
+
+def test_pages_and_bytes_are_counted():
+    crawler = DummyCrawler()
+    crawler.config = YamlConfig({})
+    pages = metrics.PAGES_FETCHED.value(crawler='DummyCrawler')
+    downloaded = metrics.BYTES_DOWNLOADED.value(crawler='DummyCrawler')
+    with requests_mock.Mocker() as mock:
+        mock.get("https://www.example.com/page", text="<html>12345</html>")
+        crawler.get_soup_from_url("https://www.example.com/page")
+    assert metrics.PAGES_FETCHED.value(crawler='DummyCrawler') == pages + 1
+    assert metrics.BYTES_DOWNLOADED.value(crawler='DummyCrawler') == downloaded + 18
+
+def test_captcha_solves_and_cost_are_counted():
+    crawler = DummyCrawler()
+    crawler.config = YamlConfig({'captcha': {'cost_per_solve': 0.5}})
+    crawler.captcha_solver = CaptchaSolver('key')
+    solved = metrics.CAPTCHA_SOLVES.value(solver='CaptchaSolver', kind='recaptcha',
+                                          result='solved')
+    cost = metrics.CAPTCHA_COST.value(solver='CaptchaSolver')
+    def solve(site_key, url):
+        return RecaptchaResponse('token')
+    def unsolvable(site_key, url):
+        raise CaptchaUnsolvableError()
+    assert crawler._solve_captcha('recaptcha', solve, 'site', 'url').result == 'token'
+    with pytest.raises(CaptchaUnsolvableError):
+        crawler._solve_captcha('recaptcha', unsolvable, 'site', 'url')
+    assert metrics.CAPTCHA_SOLVES.value(solver='CaptchaSolver', kind='recaptcha',
+                                        result='solved') == solved + 1
+    assert metrics.CAPTCHA_COST.value(solver='CaptchaSolver') == cost + 0.5
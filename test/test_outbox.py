@@ -0,0 +1,220 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+import threading
+from urllib.parse import parse_qs
+import pytest
+import requests_mock
+
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.outbox import OutboxDispatcher
+from flathunter.default_processors import LambdaProcessor
+from test.dummy_crawler import DummyCrawler
+from test.test_util import count
+from test.utils.config import StringConfig
+
+OUTBOX_CONFIG = """
+urls:
+  - https://www.example.com/liste/berlin/wohnungen/mieten?roomi=2&prima=1500&wflmi=70&sort=createdate%2Bdesc
+
+notification_outbox: true
+    """
+
+@pytest.fixture
+def id_watch():
+    return IdMaintainer(":memory:")
+
+@pytest.fixture
+def hunter(id_watch):
+    config = StringConfig(string=OUTBOX_CONFIG)
+    config.set_searchers([DummyCrawler()])
+    return Hunter(config, id_watch)
+
+def recording_sender(config, sent, fail=False):
+    def send(expose):
+        if fail:
+            raise ConnectionError("notifier is down")
+        sent.append(expose['id'])
+        return expose
+    return LambdaProcessor(config, send)
+
+def recording_dispatcher(hunter, id_watch, sent, fail=False):
+    dispatcher = OutboxDispatcher(hunter.config, id_watch)
+    dispatcher.deliveries = {'recorder': recording_sender(hunter.config, sent, fail)}
+    return dispatcher
+
+def make_due(id_watch):
+    connection = id_watch.get_connection()
+    connection.execute('UPDATE outbox SET next_attempt = ?', (datetime.datetime.now(),))
+    connection.commit()
+
+def test_new_exposes_are_queued_and_marked_processed(hunter, id_watch):
+    exposes = hunter.hunt_flats()
+    assert count(exposes) > 4
+    queued = id_watch.get_outbox(datetime.datetime.now(), limit=1000)
+    assert sorted(expose['id'] for _, expose, _, _ in queued) == sorted(e['id'] for e in exposes)
+    for expose in exposes:
+        assert id_watch.is_processed(expose['id'])
+
+def test_exposes_are_only_queued_once(id_watch):
+    assert id_watch.enqueue_notification({'id': 1, 'title': 'one'})
+    assert not id_watch.enqueue_notification({'id': 1, 'title': 'one'})
+    assert len(id_watch.get_outbox(datetime.datetime.now())) == 1
+
+def test_concurrent_crawls_queue_an_expose_once():
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'processed_ids.db')
+        IdMaintainer(database).get_connection()
+        start = threading.Barrier(8)
+        queued = []
+        def enqueue():
+            id_watch = IdMaintainer(database)
+            id_watch.get_connection()
+            start.wait()
+            queued.append(id_watch.enqueue_notification({'id': 1, 'title': 'one'}))
+        threads = [threading.Thread(target=enqueue) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(queued) == [False] * 7 + [True]
+        assert len(IdMaintainer(database).get_outbox(datetime.datetime.now())) == 1
+
+def test_duplicate_processed_ids_are_removed_from_older_databases():
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'processed_ids.db')
+        with sqlite3.connect(database) as connection:
+            connection.execute('CREATE TABLE processed (ID INTEGER)')
+            connection.executemany('INSERT INTO processed VALUES(?)', [(1,), (1,), (2,)])
+        id_watch = IdMaintainer(database)
+        assert not id_watch.enqueue_notification({'id': 1, 'title': 'one'})
+        assert id_watch.enqueue_notification({'id': 3, 'title': 'three'})
+        cur = id_watch.get_connection().cursor()
+        cur.execute('SELECT id FROM processed ORDER BY id')
+        assert cur.fetchall() == [(1,), (2,), (3,)]
+
+def test_drain_sends_and_removes_entries(hunter, id_watch):
+    exposes = hunter.hunt_flats()
+    sent = []
+    dispatcher = recording_dispatcher(hunter, id_watch, sent)
+    assert dispatcher.drain() == len(exposes)
+    assert sent == [expose['id'] for expose in exposes]
+    assert id_watch.get_outbox(datetime.datetime.now()) == []
+
+def test_failed_entries_are_retried_later(hunter, id_watch):
+    exposes = hunter.hunt_flats()
+    dispatcher = recording_dispatcher(hunter, id_watch, [], fail=True)
+    assert dispatcher.drain() == 0
+    assert id_watch.get_outbox(datetime.datetime.now()) == []
+    later = datetime.datetime.now() + dispatcher.RETRY_BACKOFF
+    queued = id_watch.get_outbox(later, limit=1000)
+    assert len(queued) == len(exposes)
+    assert all(attempts == 1 for _, _, attempts, _ in queued)
+
+SLACK_OUTBOX_CONFIG = OUTBOX_CONFIG + """
+notifiers:
+  - slack
+slack:
+  webhook_url: https://hooks.slack.com/dummy
+    """
+
+TELEGRAM_OUTBOX_CONFIG = OUTBOX_CONFIG + """
+notifiers:
+  - telegram
+telegram:
+  bot_token: dummy
+  receiver_ids:
+    - 123
+    """
+
+@pytest.mark.parametrize('config, url', [
+    (SLACK_OUTBOX_CONFIG, 'https://hooks.slack.com/dummy'),
+    (TELEGRAM_OUTBOX_CONFIG, 'https://api.telegram.org/botdummy/sendMessage')])
+def test_rejected_notifications_stay_in_the_outbox(id_watch, config, url):
+    assert id_watch.enqueue_notification({'id': 1, 'title': 'one', 'url': 'https://a'})
+    dispatcher = OutboxDispatcher(StringConfig(string=config), id_watch)
+    with requests_mock.Mocker() as mock:
+        mock.post(url, status_code=500, json={'ok': False, 'description': 'error'})
+        assert dispatcher.drain() == 0
+        assert mock.call_count > 0
+    later = datetime.datetime.now() + dispatcher.RETRY_BACKOFF
+    assert [attempts for _, _, attempts, _ in id_watch.get_outbox(later)] == [1]
+
+def test_retries_only_send_the_failed_deliveries(id_watch):
+    config = StringConfig(string=OUTBOX_CONFIG)
+    assert id_watch.enqueue_notification({'id': 1, 'title': 'one'})
+    sent, failed = [], []
+    dispatcher = OutboxDispatcher(config, id_watch)
+    dispatcher.deliveries = {'working': recording_sender(config, sent),
+                             'broken': recording_sender(config, failed, fail=True)}
+    assert dispatcher.drain() == 0
+    later = datetime.datetime.now() + dispatcher.RETRY_BACKOFF
+    assert [delivered for _, _, _, delivered in id_watch.get_outbox(later)] == [['working']]
+    dispatcher.deliveries['broken'] = recording_sender(config, failed)
+    make_due(id_watch)
+    assert dispatcher.drain() == 1
+    assert sent == [1]
+    assert failed == [1]
+    assert id_watch.get_outbox(later) == []
+
+TWO_RECEIVERS_OUTBOX_CONFIG = TELEGRAM_OUTBOX_CONFIG + """
+    - 456
+    """
+
+def test_telegram_receivers_are_retried_individually(id_watch):
+    assert id_watch.enqueue_notification({'id': 1, 'title': 'one', 'url': 'https://a'})
+    dispatcher = OutboxDispatcher(StringConfig(string=TWO_RECEIVERS_OUTBOX_CONFIG), id_watch)
+    assert list(dispatcher.deliveries) == ['telegram:123', 'telegram:456']
+    receivers = []
+    def send_message(request, context):
+        chat_id = parse_qs(request.text)['chat_id'][0]
+        receivers.append(chat_id)
+        context.status_code = 500 if chat_id == '456' and len(receivers) < 3 else 200
+        return {'ok': context.status_code == 200, 'result': {'message_id': 1}}
+    with requests_mock.Mocker() as mock:
+        mock.post('https://api.telegram.org/botdummy/sendMessage', json=send_message)
+        assert dispatcher.drain() == 0
+        make_due(id_watch)
+        assert dispatcher.drain() == 1
+    assert receivers == ['123', '456', '456']
+
+@pytest.mark.parametrize('config, url, status, description', [
+    (TELEGRAM_OUTBOX_CONFIG, 'https://api.telegram.org/botdummy/sendMessage', 403,
+     'Forbidden: bot was blocked by the user'),
+    (TELEGRAM_OUTBOX_CONFIG, 'https://api.telegram.org/botdummy/sendMessage', 403,
+     'Forbidden: user is deactivated'),
+    (TELEGRAM_OUTBOX_CONFIG, 'https://api.telegram.org/botdummy/sendMessage', 400,
+     'Bad Request: chat not found'),
+    (SLACK_OUTBOX_CONFIG, 'https://hooks.slack.com/dummy', 404, 'no_service')])
+def test_permanently_rejected_notifications_are_not_retried(id_watch, config, url, status,
+                                                            description):
+    assert id_watch.enqueue_notification({'id': 1, 'title': 'one', 'url': 'https://a'})
+    dispatcher = OutboxDispatcher(StringConfig(string=config), id_watch)
+    with requests_mock.Mocker() as mock:
+        mock.post(url, status_code=status, json={'ok': False, 'description': description})
+        assert dispatcher.drain() == 1
+    later = datetime.datetime.now() + dispatcher.RETRY_BACKOFF
+    assert id_watch.get_outbox(later) == []
+
+def test_rate_limited_notifications_are_retried(id_watch):
+    assert id_watch.enqueue_notification({'id': 1, 'title': 'one', 'url': 'https://a'})
+    dispatcher = OutboxDispatcher(StringConfig(string=SLACK_OUTBOX_CONFIG), id_watch)
+    with requests_mock.Mocker() as mock:
+        mock.post('https://hooks.slack.com/dummy', status_code=429, text='rate_limited')
+        assert dispatcher.drain() == 0
+    later = datetime.datetime.now() + dispatcher.RETRY_BACKOFF
+    assert len(id_watch.get_outbox(later)) == 1
+
+def test_outbox_of_older_databases_gets_the_delivered_column():
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'processed_ids.db')
+        with sqlite3.connect(database) as connection:
+            connection.execute('CREATE TABLE outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                                expose_id INTEGER, created TIMESTAMP, details BLOB, \
+                                attempts INTEGER, next_attempt TIMESTAMP)')
+            connection.execute('INSERT INTO outbox(expose_id, created, details, attempts, \
+                                next_attempt) VALUES (1, 0, \'{"id": 1}\', 0, 0)')
+        id_watch = IdMaintainer(database)
+        assert id_watch.get_outbox(datetime.datetime.now()) == [(1, {'id': 1}, 0, [])]
@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import unittest
+
+import requests_mock
+
+from flathunter.crawler.storia import Storia
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.page_archive import PageArchive
+from flathunter.stand_ins import StandInServer
+from test.utils.config import StringConfig
+
+STORIA_URL = 'https://www.storia.ro/ro/rezultate/vanzare/apartament/cluj/cluj--napoca'
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'storia_sample.html')
+
+
+class PageArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_recordings_are_replayed_in_order(self):
+        archive = PageArchive(self.path, PageArchive.RECORD)
+        archive.record('Storia', 'https://a', b'first')
+        archive.record('Storia', 'https://a', 'second')
+        archive.record('Storia', 'https://b', b'first')
+        replay = PageArchive(self.path, PageArchive.REPLAY)
+        self.assertEqual([b'first', b'second', b'second'],
+                         [replay.replay('Storia', 'https://a') for _ in range(3)])
+        replay.rewind()
+        self.assertEqual(b'first', replay.replay('Storia', 'https://a'))
+        self.assertEqual(b'', replay.replay('Storia', 'https://c'))
+        self.assertEqual(b'', replay.replay('ImmoScout', 'https://b'))
+        self.assertEqual(2, len(os.listdir(os.path.join(self.path, 'blobs'))))
+
+    def test_crawler_pages_are_recorded_and_replayed(self):
+        config = StringConfig(string=json.dumps(
+            {'urls': [STORIA_URL], 'page_archive': {'path': self.path, 'mode': 'record'}}))
+        crawler = Storia(config)
+        with requests_mock.Mocker() as mock:
+            mock.get(STORIA_URL, text='<html><p>recorded</p></html>')
+            crawler.get_soup_from_url(STORIA_URL)
+        config.set_page_archive(PageArchive(self.path, PageArchive.REPLAY))
+        with requests_mock.Mocker():
+            soup = crawler.get_soup_from_url(STORIA_URL)
+        self.assertEqual('recorded', soup.find('p').text)
+
+    def test_replay_hunt(self):
+        with open(SAMPLE, 'rb') as sample:
+            PageArchive(self.path, PageArchive.RECORD).record('Storia', STORIA_URL, sample.read())
+        stand_ins = StandInServer().start()
+        try:
+            config = StringConfig(string=json.dumps({
+                'urls': [STORIA_URL], 'notifiers': ['telegram'],
+                'telegram': {'bot_token': 'dummy', 'receiver_ids': [123]}}))
+            config.set_searchers([Storia(config)])
+            config.set_page_archive(PageArchive(self.path, PageArchive.REPLAY))
+            stand_ins.configure(config)
+            hunter = Hunter(config, IdMaintainer(':memory:'))
+            with requests_mock.Mocker(real_http=True) as mock:
+                exposes = hunter.hunt_flats()
+                self.assertFalse(any('storia.ro' in request.url
+                                     for request in mock.request_history))
+            self.assertEqual(1, len(exposes))
+            self.assertEqual(1, stand_ins.requests('telegram'))
+        finally:
+            stand_ins.stop()
+
@@ -0,0 +1,156 @@
+import threading
+import time
+import unittest
+
+from flathunter.abstract_processor import Processor
+from flathunter.config import YamlConfig
+from flathunter.pipeline import StagedPipeline
+from flathunter.processor import ProcessorChain
+from flathunter.utils.list import IDLE, chunk_stream
+
+
+class SlowProcessor(Processor):
+    IO_BOUND = True
+
+    def __init__(self, name, delay=0.0, parallelism=1):
+        self.name = name
+        self.delay = delay
+        self.PARALLELISM = parallelism
+
+    def process_expose(self, expose):
+        time.sleep(self.delay)
+        expose.setdefault('seen', []).append(self.name)
+        return expose
+
+
+class FailingProcessor(Processor):
+
+    def process_expose(self, expose):
+        if expose['id'] == 3:
+            raise ValueError("failed")
+        return expose
+
+
+class StagedPipelineTest(unittest.TestCase):
+
+    def test_cpu_bound_processors_share_a_stage(self):
+        cpu_a, cpu_b, cpu_c = Processor(), Processor(), Processor()
+        io_a, io_b = SlowProcessor('a'), SlowProcessor('b')
+        stages = StagedPipeline.plan_stages([cpu_a, cpu_b, io_a, io_b, cpu_c])
+        self.assertEqual([[cpu_a, cpu_b], [io_a], [io_b], [cpu_c]], stages)
+
+    def test_exposes_keep_their_order(self):
+        pipeline = StagedPipeline([SlowProcessor('a', parallelism=4), Processor(),
+                                   SlowProcessor('b')], queue_size=2)
+        result = list(pipeline.process({'id': i} for i in range(50)))
+        self.assertEqual(list(range(50)), [expose['id'] for expose in result])
+        self.assertTrue(all(expose['seen'] == ['a', 'b'] for expose in result))
+
+    def test_stages_run_concurrently(self):
+        pipeline = StagedPipeline([SlowProcessor('a', 0.05), SlowProcessor('b', 0.05)])
+        start = time.monotonic()
+        self.assertEqual(10, len(list(pipeline.process({'id': i} for i in range(10)))))
+        # One stage after the other would take 1 second
+        self.assertLess(time.monotonic() - start, 0.8)
+
+    def test_parallel_stage(self):
+        pipeline = StagedPipeline([SlowProcessor('a', 0.1, parallelism=5)])
+        start = time.monotonic()
+        self.assertEqual(10, len(list(pipeline.process({'id': i} for i in range(10)))))
+        self.assertLess(time.monotonic() - start, 0.6)
+
+    def test_queues_apply_backpressure(self):
+        consumed = []
+        def source():
+            for i in range(100):
+                consumed.append(i)
+                yield {'id': i}
+        pipeline = StagedPipeline([SlowProcessor('a'), SlowProcessor('b')], queue_size=2)
+        exposes = pipeline.process(source())
+        next(exposes)
+        time.sleep(0.2)
+        # Two stages holding an expose each, plus two full queues of two
+        self.assertLessEqual(len(consumed), 10)
+        exposes.close()
+
+    def test_errors_are_raised_to_the_consumer(self):
+        pipeline = StagedPipeline([SlowProcessor('a'), FailingProcessor(), SlowProcessor('b')])
+        result = []
+        with self.assertRaises(ValueError):
+            for expose in pipeline.process({'id': i} for i in range(10)):
+                result.append(expose['id'])
+        self.assertEqual([0, 1, 2], result)
+
+    def test_stopping_early_ends_the_threads(self):
+        threads = threading.active_count()
+        pipeline = StagedPipeline([SlowProcessor('a'), SlowProcessor('b')], queue_size=1)
+        exposes = pipeline.process({'id': i} for i in range(100))
+        next(exposes)
+        exposes.close()
+        self.assertEqual(threads, threading.active_count())
+
+    def test_chain_is_staged_if_configured(self):
+        config = YamlConfig({'pipeline': {'staged': True}})
+        chain = ProcessorChain.builder(config).map(lambda expose: expose).build()
+        self.assertIsNotNone(chain.pipeline)
+        self.assertEqual([{'id': 1}], list(chain.process([{'id': 1}])))
+        chain = ProcessorChain.builder(YamlConfig({})).build()
+        self.assertIsNone(chain.pipeline)
+
+
+class BatchProcessor(Processor):
+    IO_BOUND = True
+    BATCH_SIZE = None
+
+    def __init__(self):
+        self.batches = []
+
+    def process_batch(self, exposes):
+        self.batches.append([expose['id'] for expose in exposes])
+        return exposes
+
+
+class BatchingTest(unittest.TestCase):
+
+    def test_chunk_stream(self):
+        self.assertEqual([[0, 1, 2], [3, 4, 5], [6]], list(chunk_stream(range(7), 3)))
+
+    def test_chunk_stream_flushes_after_timeout(self):
+        now = [0.0]
+        def items():
+            yield 1
+            now[0] = 5.0
+            yield IDLE
+            yield 2
+            yield 3
+        chunks = list(chunk_stream(items(), 10, timeout=2.0, clock=lambda: now[0]))
+        self.assertEqual([[1], [2, 3]], chunks)
+
+    def test_chain_passes_batches(self):
+        processor = BatchProcessor()
+        config = YamlConfig({'pipeline': {'batch_size': 4}})
+        chain = ProcessorChain.builder(config).build()
+        chain.processors.append(processor)
+        self.assertEqual(10, len(list(chain.process({'id': i} for i in range(10)))))
+        self.assertEqual([[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]], processor.batches)
+
+    def test_processor_batch_size_limits_batches(self):
+        processor = BatchProcessor()
+        processor.BATCH_SIZE = 3
+        list(processor.process_batches(({'id': i} for i in range(5)), 4))
+        self.assertEqual([[0, 1, 2], [3, 4]], processor.batches)
+
+    def test_staged_pipeline_flushes_incomplete_batches(self):
+        processor = BatchProcessor()
+        pipeline = StagedPipeline([SlowProcessor('a'), processor],
+                                  batch_size=10, batch_timeout=0.2)
+        arrived = threading.Event()
+        def source():
+            yield {'id': 1}
+            arrived.wait(5)
+            yield {'id': 2}
+        exposes = pipeline.process(source())
+        self.assertEqual(1, next(exposes)['id'])
+        arrived.set()
+        self.assertEqual([2], [expose['id'] for expose in exposes])
+        self.assertEqual([[1], [2]], processor.batches)
@@ -1,4 +1,6 @@
+import time
 import unittest
+from flathunter.default_processors import AddressResolver
 from flathunter.hunter import Hunter
 from flathunter.idmaintainer import IdMaintainer
 from flathunter.processor import ProcessorChain
@@ -40,3 +42,53 @@ google_maps_api:
         exposes = chain.process(exposes)
         for expose in exposes:
             self.assertFalse(expose['address'].startswith('http'), "Expected addresses to be processed")
+
+    def test_address_resolver_loads_each_url_once(self):
+        crawler = CountingCrawler()
+        config = StringConfig(string=self.DUMMY_CONFIG)
+        config.set_searchers([crawler])
+        exposes = [{'id': i, 'address': f"https://www.example.com/expose/{i % 3}"}
+                   for i in range(9)]
+        chain = ProcessorChain.builder(config).resolve_addresses().build()
+        resolved = list(chain.process(exposes))
+        self.assertEqual([expose['id'] for expose in resolved], list(range(9)))
+        self.assertEqual(resolved[4]['address'], "Address of https://www.example.com/expose/1")
+        self.assertEqual(sorted(crawler.loaded), [f"https://www.example.com/expose/{i}"
+                                                  for i in range(3)])
+
+    def test_address_resolver_caches_addresses(self):
+        crawler = CountingCrawler()
+        config = StringConfig(string=self.DUMMY_CONFIG)
+        config.set_searchers([crawler])
+        id_watch = IdMaintainer(":memory:")
+        for _ in range(2):
+            exposes = [{'id': 1, 'address': "https://www.example.com/expose/1"}]
+            chain = ProcessorChain.builder(config).resolve_addresses(id_watch).build()
+            resolved = list(chain.process(exposes))
+            self.assertEqual(resolved[0]['address'], "Address of https://www.example.com/expose/1")
+        self.assertEqual(crawler.loaded, ["https://www.example.com/expose/1"])
+
+    def test_address_resolver_loads_in_parallel(self):
+        crawler = CountingCrawler(delay=0.2)
+        config = StringConfig(string=self.DUMMY_CONFIG)
+        config.set_searchers([crawler])
+        exposes = [{'id': i, 'address': f"https://www.example.com/expose/{i}"}
+                   for i in range(AddressResolver.MAX_WORKERS)]
+        chain = ProcessorChain.builder(config).resolve_addresses().build()
+        start = time.monotonic()
+        self.assertEqual(len(list(chain.process(exposes))), AddressResolver.MAX_WORKERS)
+        self.assertLess(time.monotonic() - start, 0.2 * AddressResolver.MAX_WORKERS - 0.1)
+
+
+class CountingCrawler(DummyCrawler):
+    """Crawler that records the URLs it loads addresses from"""
+
+    def __init__(self, delay=0):
+        super().__init__(addresses_as_links=True)
+        self.delay = delay
+        self.loaded = []
+
+    def load_address(self, url):
+        time.sleep(self.delay)
+        self.loaded.append(url)
+        return f"Address of {url}"
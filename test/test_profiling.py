@@ -0,0 +1,72 @@
+import json
+import time
+
+import pytest
+
+from flathunter import metrics
+from flathunter.abstract_processor import Processor
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.processor import ProcessorChain
+from flathunter.profiling import CycleProfile
+from test.dummy_crawler import DummyCrawler
+from test.utils.config import StringConfig
+
+
+class SleepingProcessor(Processor):
+
+    def process_expose(self, expose):
+        time.sleep(0.02)
+        return expose
+
+
+class DroppingProcessor(Processor):
+
+    def process_exposes(self, exposes):
+        return (expose for expose in exposes if expose['id'] % 2 == 0)
+
+
+class FailingProcessor(Processor):
+
+    def process_expose(self, expose):
+        raise ValueError("failed")
+
+
+def test_processors_are_timed_without_upstream_time():
+    profile = CycleProfile()
+    chain = ProcessorChain([SleepingProcessor(), DroppingProcessor()])
+    result = list(chain.process([{'id': i} for i in range(6)], profile))
+    assert len(result) == 3
+    sleeping = profile.stages['SleepingProcessor']
+    dropping = profile.stages['DroppingProcessor']
+    assert (sleeping.exposes_in, sleeping.exposes_out) == (6, 6)
+    assert (dropping.exposes_in, dropping.exposes_out) == (6, 3)
+    assert sleeping.seconds >= 0.12
+    assert dropping.seconds < 0.05
+
+def test_errors_are_counted_where_they_are_raised():
+    profile = CycleProfile()
+    chain = ProcessorChain([FailingProcessor(), Processor()])
+    with pytest.raises(ValueError):
+        list(chain.process([{'id': 1}], profile))
+    assert profile.stages['FailingProcessor'].errors == 1
+    assert profile.stages['Processor'].errors == 0
+
+def test_hunter_logs_cycle_profile(caplog):
+    config = StringConfig(string="""
+urls:
+  - https://www.example.com/liste/berlin/wohnungen/mieten?roomi=2&prima=1500&wflmi=70&sort=createdate%2Bdesc
+""")
+    config.set_searchers([DummyCrawler()])
+    crawled_before = metrics.STAGE_EXPOSES_OUT.value(stage='crawl:DummyCrawler')
+    with caplog.at_level('INFO', logger='flathunt'):
+        exposes = Hunter(config, IdMaintainer(":memory:")).hunt_flats()
+    lines = [record.getMessage() for record in caplog.records
+             if record.getMessage().startswith('Cycle profile: ')]
+    assert len(lines) == 1
+    profile = json.loads(lines[0][len('Cycle profile: '):])
+    crawled = profile['stages']['crawl:DummyCrawler']['out']
+    assert crawled > 0
+    assert profile['stages']['Filter']['in'] == crawled
+    assert profile['stages']['Filter']['out'] == len(exposes)
+    assert metrics.STAGE_EXPOSES_OUT.value(stage='crawl:DummyCrawler') - crawled_before == crawled
@@ -0,0 +1,44 @@
+import unittest
+
+from flathunter.utils.rate_limit import TokenBucket
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_burst_is_not_delayed(self):
+        clock = FakeClock()
+        bucket = TokenBucket(1, capacity=3, clock=clock, sleep=clock.sleep)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual([], clock.sleeps)
+
+    def test_callers_wait_for_tokens_in_order(self):
+        clock = FakeClock()
+        bucket = TokenBucket(2, capacity=1, clock=clock)
+        self.assertEqual(0, bucket.reserve())
+        self.assertEqual(0.5, bucket.reserve())
+        self.assertEqual(1.0, bucket.reserve())
+
+    def test_tokens_are_refilled_over_time(self):
+        clock = FakeClock()
+        bucket = TokenBucket(1, capacity=2, clock=clock, sleep=clock.sleep)
+        bucket.acquire()
+        bucket.acquire()
+        clock.now += 10
+        self.assertEqual(0, bucket.reserve())
+        self.assertEqual(0, bucket.reserve())
+        self.assertEqual(1, bucket.reserve())
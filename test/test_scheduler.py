@@ -0,0 +1,114 @@
+import threading
+import unittest
+from concurrent.futures import wait
+
+from flathunter import metrics
+from flathunter.scheduler import Clock, Scheduler
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.runs = []
+
+    def scheduler(self, pause=None):
+        return Scheduler(pause=pause, clock=Clock(self.clock, self.clock.sleep))
+
+    def job(self, name, duration=0.0, result=None):
+        def run():
+            self.runs.append((name, self.clock.now))
+            self.clock.now += duration
+            return result
+        return run
+
+    def test_jobs_run_at_their_interval(self):
+        scheduler = self.scheduler()
+        scheduler.every(10, self.job('a'), 'a')
+        scheduler.every(25, self.job('b'), 'b', delay=25)
+        scheduler.run(until=lambda: len(self.runs) == 8)
+        self.assertEqual([('a', 0), ('a', 10), ('a', 20), ('b', 25), ('a', 30),
+                          ('a', 40), ('b', 50), ('a', 50)], self.runs)
+
+    def test_interval_does_not_depend_on_duration(self):
+        scheduler = self.scheduler()
+        scheduler.every(10, self.job('a', duration=4), 'a')
+        scheduler.run(until=lambda: len(self.runs) == 3)
+        self.assertEqual([0, 10, 20], [time for _, time in self.runs])
+
+    def test_slow_jobs_skip_missed_runs(self):
+        scheduler = self.scheduler()
+        scheduler.every(10, self.job('slow', duration=25), 'slow')
+        scheduler.run(until=lambda: len(self.runs) == 3)
+        self.assertEqual([0, 30, 60], [time for _, time in self.runs])
+
+    def test_jobs_can_plan_their_next_run(self):
+        scheduler = self.scheduler()
+        delays = iter([5, 20, None])
+        scheduler.schedule(lambda: self.job('a')() or next(delays), 'a')
+        scheduler.run()
+        self.assertEqual([0, 5, 25], [time for _, time in self.runs])
+        self.assertIsNone(scheduler.seconds_until_next())
+
+    def test_jobs_are_put_off_during_pause(self):
+        def pause():
+            return 100 - self.clock.now if 30 <= self.clock.now < 100 else 0
+        scheduler = self.scheduler(pause)
+        scheduler.every(20, self.job('a'), 'a')
+        scheduler.run(until=lambda: len(self.runs) == 4)
+        self.assertEqual([0, 20, 100, 120], [time for _, time in self.runs])
+
+    def test_cancelled_jobs_do_not_run(self):
+        scheduler = self.scheduler()
+        job = scheduler.every(10, self.job('a'), 'a', delay=10)
+        job.cancel()
+        self.assertEqual([], scheduler.jobs())
+        scheduler.run()
+        self.assertEqual([], self.runs)
+
+    def test_background_jobs_skip_overlapping_runs(self):
+        release = threading.Event()
+        started = []
+        def slow():
+            started.append(self.clock.now)
+            release.wait(5)
+        scheduler = self.scheduler()
+        scheduler.every(10, slow, 'slow', background=True)
+        scheduler.every(10, self.job('fast'), 'fast')
+        skipped = metrics.SKIPPED_RUNS.value(job='slow')
+        def until():
+            if len(self.runs) == 3:
+                release.set()
+                return True
+            return False
+        scheduler.run(until=until)
+        self.assertEqual([0], started)
+        self.assertEqual([0, 10, 20], [time for _, time in self.runs])
+        self.assertEqual(skipped + 2, metrics.SKIPPED_RUNS.value(job='slow'))
+
+    def test_failing_background_jobs_keep_running(self):
+        calls = []
+        def failing():
+            calls.append(1)
+            raise ValueError("failed")
+        scheduler = self.scheduler()
+        job = scheduler.every(10, failing, 'failing', background=True)
+        def until():
+            # Let each run finish, so the next one is not skipped as still running
+            if job.running is not None:
+                wait([job.running], timeout=5)
+            return self.clock.now >= 30
+        scheduler.run(until=until)
+        self.assertEqual(3, len(calls))
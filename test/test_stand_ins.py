@@ -0,0 +1,118 @@
+import json
+import os
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from flathunter.captcha.twocaptcha_solver import TwoCaptchaSolver
+from flathunter.config import Config, YamlConfig
+from flathunter.notifiers import SenderMattermost, SenderSlack, SenderTelegram
+from flathunter.stand_ins import Faults, StandInServer, point_at_stand_ins
+
+
+class StandInServerTest(unittest.TestCase):
+
+    def setUp(self):
+        SenderTelegram.reset_rate_limits()
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def stand_ins(self, **kwargs):
+        server = StandInServer(faults=Faults(retry_after=0, **kwargs), seed=1).start()
+        self.servers.append(server)
+        return server
+
+    def config(self, stand_ins, **config):
+        config = YamlConfig(config)
+        stand_ins.configure(config)
+        return config
+
+    def test_telegram_messages_are_answered(self):
+        stand_ins = self.stand_ins()
+        config = self.config(stand_ins, telegram={'bot_token': 'dummy', 'receiver_ids': [123]})
+        SenderTelegram(config=config).notify("message")
+        self.assertEqual(1, stand_ins.requests('telegram', 200))
+
+    def test_throttled_telegram_messages_are_retried(self):
+        stand_ins = self.stand_ins(throttle_rate=1.0)
+        config = self.config(stand_ins, telegram={'bot_token': 'dummy', 'receiver_ids': [123]})
+        SenderTelegram(config=config).notify("message")
+        self.assertEqual(SenderTelegram.MAX_RETRIES + 1, stand_ins.requests('telegram', 429))
+
+    def test_webhooks_fail_at_the_failure_rate(self):
+        stand_ins = self.stand_ins(failure_rate=0.5)
+        config = self.config(stand_ins)
+        for _ in range(20):
+            SenderSlack(config).notify("message")
+            SenderMattermost(config).notify("message")
+        for service in ('slack', 'mattermost'):
+            self.assertEqual(20, stand_ins.requests(service))
+            self.assertGreater(stand_ins.requests(service, 500), 0)
+            self.assertGreater(stand_ins.requests(service, 200), 0)
+
+    def test_answers_are_delayed_by_the_latency(self):
+        stand_ins = self.stand_ins(latency=0.2)
+        start = time.monotonic()
+        requests.post(stand_ins.base_url + '/slack', data=json.dumps({'text': 'a'}), timeout=5)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_distance_matrix_has_an_element_per_pair(self):
+        stand_ins = self.stand_ins()
+        response = requests.get(stand_ins.base_url + '/maps/api/distancematrix/json',
+                                params={'origins': 'a|b', 'destinations': 'c|d|e'},
+                                timeout=5).json()
+        self.assertEqual('OK', response['status'])
+        self.assertEqual([3, 3], [len(row['elements']) for row in response['rows']])
+
+    def test_captchas_are_solved(self):
+        stand_ins = self.stand_ins()
+        config = self.config(stand_ins, captcha={'2captcha': {'api_key': 'dummy'}})
+        solver = config.get_captcha_solver()
+        self.assertEqual('stand-in-token', solver.solve_recaptcha('key', 'https://a').result)
+        self.assertEqual('stand-in', solver.solve_geetest('gt', 'challenge', 'https://a').validate)
+        config = self.config(stand_ins, captcha={'capmonster': {'api_key': 'dummy'}})
+        response = config.get_captcha_solver().solve_awswaf('key', '', '', '', '', 'https://a')
+        self.assertEqual('stand-in-token', response.token)
+        self.assertEqual(4, stand_ins.requests('2captcha'))
+        self.assertEqual(2, stand_ins.requests('capmonster'))
+
+
+class PointAtStandInsTest(unittest.TestCase):
+
+    def test_services_are_redirected(self):
+        config = YamlConfig({'telegram': None, 'captcha': None,
+                             'slack': {'webhook_url': 'https://hooks.slack.com/hook'},
+                             'google_maps_api': {'enable': True, 'url': 'https://maps'}})
+        point_at_stand_ins(config, 'http://127.0.0.1:8099/')
+        self.assertEqual('http://127.0.0.1:8099', config.telegram_api_url())
+        self.assertEqual('http://127.0.0.1:8099/slack', config.slack_webhook_url())
+        self.assertEqual('http://127.0.0.1:8099/2captcha', config.get_twocaptcha_api_url())
+        self.assertTrue(config.get('google_maps_api')['url'].startswith(
+            'http://127.0.0.1:8099/maps/api/distancematrix/json?'))
+
+    def test_google_maps_is_left_alone_if_not_configured(self):
+        config = YamlConfig({})
+        point_at_stand_ins(config, 'http://127.0.0.1:8099')
+        self.assertNotIn('google_maps_api', config.config)
+
+    @mock.patch.dict(os.environ, {
+        'FLATHUNTER_TARGET_URLS': 'https://www.example.com',
+        'FLATHUNTER_NOTIFIERS': 'slack,mattermost,apprise',
+        'FLATHUNTER_SLACK_WEBHOOK_URL': 'https://hooks.slack.com/hook',
+        'FLATHUNTER_MATTERMOST_WEBHOOK_URL': 'https://mattermost.example.com/hook',
+        'FLATHUNTER_IMAGETYPERZ_TOKEN': 'token',
+        'FLATHUNTER_2CAPTCHA_KEY': 'key'})
+    def test_stand_ins_take_precedence_over_the_environment(self):
+        config = Config()
+        point_at_stand_ins(config, 'http://127.0.0.1:8099')
+        self.assertEqual('http://127.0.0.1:8099/slack', config.slack_webhook_url())
+        self.assertEqual('http://127.0.0.1:8099/mattermost', config.mattermost_webhook_url())
+        self.assertEqual(['slack', 'mattermost'], config.notifiers())
+        solver = config.get_captcha_solver()
+        self.assertIsInstance(solver, TwoCaptchaSolver)
+        self.assertEqual('http://127.0.0.1:8099/2captcha', solver.api_url)
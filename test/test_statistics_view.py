@@ -39,3 +39,9 @@ def hunt_client():
 def test_statistics_view(hunt_client):
     rv = hunt_client.get('/stats')
     assert b'<a class="navbar-brand" href="/">Flathunter</a>' in rv.data
+
+def test_statistics_view_serves_aggregates(hunt_client):
+    app.config['HUNTER'].hunt_flats()
+    rv = hunt_client.get('/stats')
+    assert b'"crawler": "DummyCrawler"' in rv.data
+    assert b'median_pps' in rv.data
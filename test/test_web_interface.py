@@ -199,3 +199,10 @@ def test_logout(hunt_client):
     assert 'user' in session
     rv = hunt_client.get('/logout')
     assert 'user' not in session
+
+def test_metrics(hunt_client):
+    app.config['HUNTER'].hunt_flats()
+    rv = hunt_client.get('/metrics')
+    assert rv.status_code == 200
+    assert rv.content_type.startswith('text/plain')
+    assert b'flathunter_stage_exposes_out_total{stage="crawl:DummyCrawler"}' in rv.data